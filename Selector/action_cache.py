@@ -0,0 +1,115 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 1000
+
+# Per-request values that change on every page load but never affect the actions. The key is
+# built from distilled HTML, which already drops hidden inputs, meta tags and nonces, so what
+# is left are tokens in URL query strings (href="/logout?csrf=...&amp;_=1712345678") and
+# ;jsessionid= path parameters. Names that are always volatile are stripped whatever their
+# value; generic names like state or ts only when the value looks random, since ?state=open
+# and ?state=closed are different pages.
+_VOLATILE_PARAMS = r'csrf[-_\w]*|_?xsrf[-_\w]*|_csrf|_token|authenticity_token|nonce|session_?id|phpsessid'
+_RANDOM_PARAMS = r'state|sid|ts|timestamp|_'
+_RANDOM_VALUE = (r'(?:[0-9a-f]{16,}|\d{10,13}|(?=[A-Za-z_-]*\d)(?=[\d_-]*[A-Za-z])[A-Za-z0-9_-]{20,})'
+                 r'(?=[&#"\s]|$)')
+_QUERY_START = r'(?:\?|&(?:amp;)?)'
+_VOLATILE_PATTERNS = [
+    re.compile(r'(' + _QUERY_START + r'(?:' + _VOLATILE_PARAMS + r')=)[^&#"\s]*', re.IGNORECASE),
+    re.compile(r'(' + _QUERY_START + r'(?:' + _RANDOM_PARAMS + r')=)' + _RANDOM_VALUE, re.IGNORECASE),
+    re.compile(r'(;jsessionid=)[^?#"\s]*', re.IGNORECASE),
+]
+
+def cache_key(optimized_html, prompt, model):
+    """Digest of the optimized HTML, prompt and model, ignoring CSRF tokens, session ids and cache busters"""
+    for pattern in _VOLATILE_PATTERNS:
+        optimized_html = pattern.sub(r'\1', optimized_html)
+    digest = hashlib.sha256()
+    for part in (model or '', prompt, optimized_html):
+        digest.update(part.encode('utf-8', 'replace'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class ActionCache:
+    """Persistent get_actions results in SQLite, with a TTL and LRU eviction.
+
+    Entries older than ttl_seconds are ignored and purged; once more than
+    max_entries are stored the least recently used ones are dropped.
+    """
+
+    def __init__(self, db_path, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = str(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS action_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    result TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER DEFAULT 0
+                )
+            ''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_action_cache_last_used ON action_cache(last_used)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created FROM action_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE action_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+                )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, result, model=None):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                '''INSERT INTO action_cache (key, model, result, created, last_used) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET result = excluded.result, model = excluded.model,
+                    created = excluded.created, last_used = excluded.last_used''',
+                (key, model, json.dumps(result), now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM action_cache WHERE created < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            '''DELETE FROM action_cache WHERE key IN (
+                SELECT key FROM action_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )''',
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM action_cache")
+
+    def info(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM action_cache").fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'size': size,
+                    'max_entries': self.max_entries, 'ttl_seconds': self.ttl_seconds}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,222 @@
+import abc
+import logging
+import os
+import threading
+import time
+from Selector.llm_client import get_client
+
+DEFAULT_LOCAL_MODEL = os.path.join("models", "tinyllama-1.1b.gguf")
+
+class ActionBackend(abc.ABC):
+    """Something that answers chat-completions payloads for get_actions.
+
+    complete() returns an OpenAI-style response dict and stream() yields content
+    deltas. Backends with remote = False ignore the payload's model and run
+    their own, so get_actions skips the fallback chain for them. A stream may
+    hold resources until it is exhausted or closed, so callers that can stop
+    early should wrap it in contextlib.closing.
+    """
+
+    name = "base"
+    remote = True
+    model_name = None
+
+    def __init__(self):
+        self._metrics_lock = threading.Lock()
+        self._metrics = {'requests': 0, 'errors': 0, 'latency_seconds': 0.0, 'last_latency': None,
+                         'prompt_tokens': 0, 'completion_tokens': 0, 'generation_seconds': 0.0}
+
+    @abc.abstractmethod
+    def complete(self, payload):
+        """OpenAI-style response dict for a chat-completions payload"""
+
+    @abc.abstractmethod
+    def stream(self, payload):
+        """Yield the content deltas of a streamed completion"""
+
+    def _record(self, latency, usage=None, generation_seconds=None, error=False):
+        usage = usage or {}
+        with self._metrics_lock:
+            m = self._metrics
+            m['requests'] += 1
+            m['errors'] += int(error)
+            m['latency_seconds'] += latency
+            m['last_latency'] = latency
+            m['prompt_tokens'] += usage.get('prompt_tokens') or 0
+            m['completion_tokens'] += usage.get('completion_tokens') or 0
+            m['generation_seconds'] += generation_seconds if generation_seconds is not None else latency
+
+    def metrics(self):
+        """Request counts, mean latency and completion tokens per second"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        m['backend'] = self.name
+        m['mean_latency'] = m['latency_seconds'] / m['requests'] if m['requests'] else None
+        m['tokens_per_second'] = (m['completion_tokens'] / m['generation_seconds']
+                                  if m['generation_seconds'] else None)
+        return m
+
+class OpenRouterBackend(ActionBackend):
+    """The hosted chat-completions API through the shared pooled ChatClient"""
+
+    name = "openrouter"
+
+    def __init__(self, client_factory=None):
+        super().__init__()
+        self._client_factory = client_factory or get_client
+
+    def complete(self, payload):
+        start_time = time.time()
+        try:
+            response = self._client_factory().complete(payload)
+        except Exception:
+            self._record(time.time() - start_time, error=True)
+            raise
+        self._record(time.time() - start_time, response.get('usage'))
+        return response
+
+    def stream(self, payload):
+        start_time = time.time()
+        try:
+            yield from self._client_factory().stream(payload)
+        except Exception:
+            self._record(time.time() - start_time, error=True)
+            raise
+        self._record(time.time() - start_time)
+
+class LlamaCppBackend(ActionBackend):
+    """Local CPU inference with llama-cpp-python.
+
+    The GGUF model is loaded once and stays resident; calls are serialized on it
+    since a llama.cpp context is not thread-safe. A prompt cache keeps the KV state
+    of the shared system prompt and page context, so complete_batch over several
+    prompts for the same page only evaluates the differing tail of each.
+    """
+
+    name = "llama_cpp"
+    remote = False
+
+    def __init__(self, model_path=DEFAULT_LOCAL_MODEL, n_ctx=4096, n_threads=None, n_batch=512,
+                 cache_bytes=512 * 1024 * 1024):
+        super().__init__()
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"Local model not found: {model_path}")
+        if os.path.getsize(model_path) == 0:
+            raise ValueError(
+                f"Local model {model_path} is an empty placeholder; download a GGUF model "
+                f"(e.g. TinyLlama 1.1B chat) to that path or pass model_path"
+            )
+        try:
+            import llama_cpp
+        except ImportError as e:
+            raise RuntimeError(
+                "The llama_cpp backend needs llama-cpp-python (pip install llama-cpp-python)"
+            ) from e
+        self.model_path = model_path
+        self.model_name = os.path.basename(model_path)
+        start_time = time.time()
+        self.llm = llama_cpp.Llama(model_path=model_path, n_ctx=n_ctx, n_batch=n_batch,
+                                   n_threads=n_threads or os.cpu_count(), verbose=False)
+        self.llm.set_cache(llama_cpp.LlamaRAMCache(capacity_bytes=cache_bytes))
+        self.load_seconds = time.time() - start_time
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _options(payload):
+        return {
+            'messages': payload['messages'],
+            'temperature': payload.get('temperature', 0.3),
+            'max_tokens': payload.get('max_tokens', 2000),
+            'response_format': payload.get('response_format'),
+        }
+
+    def complete(self, payload):
+        start_time = time.time()
+        with self._lock:
+            generation_start = time.time()
+            try:
+                response = self.llm.create_chat_completion(**self._options(payload))
+            except Exception:
+                self._record(time.time() - start_time, error=True)
+                raise
+            generation_seconds = time.time() - generation_start
+        self._record(time.time() - start_time, response.get('usage'), generation_seconds)
+        return response
+
+    def complete_batch(self, payloads):
+        """Run several payloads back to back on the resident model, in order.
+
+        Returns one response per payload; a payload that fails gets None instead
+        of aborting the rest. Payloads that share a prefix (system prompt and page)
+        reuse its KV state through the prompt cache.
+        """
+        with self._lock:
+            return [self._complete_locked(payload) for payload in payloads]
+
+    def _complete_locked(self, payload):
+        start_time = time.time()
+        try:
+            response = self.llm.create_chat_completion(**self._options(payload))
+        except Exception as e:
+            logging.warning(f"Local completion failed: {str(e)}")
+            self._record(time.time() - start_time, error=True)
+            return None
+        self._record(time.time() - start_time, response.get('usage'))
+        return response
+
+    def stream(self, payload):
+        """Yield deltas while holding the model.
+
+        The lock is released in a finally, so it is held only until the caller
+        exhausts or closes the generator; wrap it in contextlib.closing when the
+        caller may stop early.
+        """
+        start_time = time.time()
+        completion_tokens = 0
+        error = False
+        self._lock.acquire()
+        try:
+            chunks = self.llm.create_chat_completion(stream=True, **self._options(payload))
+            try:
+                for chunk in chunks:
+                    content = (chunk['choices'][0].get('delta') or {}).get('content')
+                    if content:
+                        completion_tokens += 1
+                        yield content
+            finally:
+                close = getattr(chunks, 'close', None)
+                if close is not None:
+                    close()
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._lock.release()
+            self._record(time.time() - start_time, {'completion_tokens': completion_tokens}, error=error)
+
+_BACKEND_FACTORIES = {
+    OpenRouterBackend.name: OpenRouterBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+}
+_backends = {}
+_backends_lock = threading.Lock()
+
+def register_backend(name, factory):
+    """Make a backend available to get_backend(name); factory takes no arguments"""
+    with _backends_lock:
+        _BACKEND_FACTORIES[name] = factory
+        _backends.pop(name, None)
+
+def get_backend(name=None):
+    """Shared backend instance by name (default: ACTION_BACKEND env var or openrouter).
+
+    Backends are created once per process, which keeps local models loaded.
+    """
+    name = name or os.getenv("ACTION_BACKEND", OpenRouterBackend.name)
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name not in _BACKEND_FACTORIES:
+                raise ValueError(f"Unknown action backend: {name}")
+            backend = _backends[name] = _BACKEND_FACTORIES[name]()
+        return backend
@@ -0,0 +1,228 @@
+import math
+import re
+import time
+import zlib
+import numpy as np
+
+DEFAULT_DIMENSIONS = 1 << 18
+DEFAULT_MIN_SCORE = 0.3
+DEFAULT_MIN_MARGIN = 0.05
+
+TYPEABLE_TYPES = frozenset({'input', 'textarea', 'select'})
+CLICK_VERBS = frozenset({'click', 'press', 'tap', 'hit', 'select', 'choose', 'check', 'uncheck', 'toggle', 'open'})
+TYPE_VERBS = frozenset({'type', 'enter', 'fill', 'input', 'write'})
+# Click verbs that can also mean picking an option, which a click can't do
+SELECT_VERBS = frozenset({'select', 'choose'})
+STOP_WORDS = frozenset({'the', 'a', 'an', 'on', 'in', 'into', 'to', 'at', 'of', 'for', 'with', 'please',
+                        'it', 'this', 'that', 'my', 'field', 'box', 'element'})
+
+_CAMEL_RE = re.compile(r"([a-z])([A-Z])")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_QUOTED_RE = re.compile(r"\"([^\"]*)\"|'([^']*)'|“([^”]*)”")
+_PLACEHOLDER_RE = re.compile(r"\x00(\d+)\x00")
+# "and" only separates actions when a verb follows, so "terms and conditions" stays one target
+_SPLIT_RE = re.compile(r"\s*(?:[,;]|\band then\b|\bthen\b|\band\b(?=\s+(?:%s)\b))\s*"
+                       % '|'.join(sorted(CLICK_VERBS | TYPE_VERBS)), re.IGNORECASE)
+_UNQUOTED_VALUE_RE = re.compile(r"^(?:type|enter|write|input)\s+(.+?)\s+(?:into|in)\s+(.+)$", re.IGNORECASE)
+
+def _words(text):
+    # "loginButton", "login-button" and "login_button" all become "login button"
+    return _WORD_RE.findall(_CAMEL_RE.sub(r"\1 \2", text or '').lower())
+
+def _features(words):
+    """Word and character-trigram features; trigrams let "log in" meet "login" and "signup" meet "sign-up\""""
+    features = [f"w:{word}" for word in words]
+    for word in words:
+        padded = f"^{word}$"
+        features.extend(f"g:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+def element_text(element):
+    """What an element is matched on: its tag, selector and stored description"""
+    return ' '.join((element.get('element_type') or '', element.get('selector') or '',
+                     element.get('description') or ''))
+
+class ElementIndex:
+    """Hashed TF-IDF vectors over a session's elements, scored by cosine similarity.
+
+    Every element becomes a sparse row of hashed word and character-trigram
+    features (tag, selector, text and aria attributes), stored in CSR arrays.
+    search() scores every element against a phrase with one gather and one
+    bincount, so lookups take well under a millisecond for thousands of elements.
+    """
+
+    def __init__(self, elements, dimensions=DEFAULT_DIMENSIONS):
+        self.elements = list(elements)
+        self.size = len(self.elements)
+        self.dimensions = dimensions
+        self._typeable = np.array([(e.get('element_type') or '') in TYPEABLE_TYPES for e in self.elements], dtype=bool)
+
+        rows, columns, counts = [], [], []
+        for row, element in enumerate(self.elements):
+            hashed, tf = np.unique(self._hash(_features(_words(element_text(element)))), return_counts=True)
+            rows.append(np.full(len(hashed), row, dtype=np.int32))
+            columns.append(hashed)
+            counts.append(tf)
+        self._rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        self._columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+        tf = np.concatenate(counts).astype(np.float32) if counts else np.zeros(0, dtype=np.float32)
+
+        document_frequency = np.bincount(self._columns, minlength=dimensions).astype(np.float32)
+        self._idf = (np.log((1 + self.size) / (1 + document_frequency)) + 1).astype(np.float32)
+        # Sublinear term frequency so a repeated word in long text doesn't dominate
+        weights = (1 + np.log(tf)) * self._idf[self._columns]
+        norms = np.sqrt(np.bincount(self._rows, weights=weights * weights, minlength=self.size))
+        norms[norms == 0] = 1
+        self._weights = (weights / norms[self._rows]).astype(np.float32)
+
+    def _hash(self, features):
+        return np.fromiter((zlib.crc32(f.encode()) % self.dimensions for f in features),
+                           dtype=np.int64, count=len(features))
+
+    def _query_vector(self, text):
+        features = _features([w for w in _words(text) if w not in STOP_WORDS])
+        if not features:
+            return None
+        hashed, tf = np.unique(self._hash(features), return_counts=True)
+        weights = (1 + np.log(tf.astype(np.float32))) * self._idf[hashed]
+        norm = math.sqrt(float(np.dot(weights, weights)))
+        if norm == 0:
+            return None
+        query = np.zeros(self.dimensions, dtype=np.float32)
+        query[hashed] = weights / norm
+        return query
+
+    def scores(self, text, typeable_only=False):
+        """Cosine similarity of text against every element, as a float array in element order"""
+        query = self._query_vector(text) if self.size else None
+        if query is None:
+            return np.zeros(self.size, dtype=np.float32)
+        scores = np.bincount(self._rows, weights=self._weights * query[self._columns], minlength=self.size)
+        if typeable_only:
+            scores[~self._typeable] = 0
+        return scores
+
+    def search(self, text, k=3, typeable_only=False):
+        """Top k (element, score) pairs for text, best first"""
+        scores = self.scores(text, typeable_only)
+        if not self.size:
+            return []
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.elements[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def resolve(self, prompt, min_score=DEFAULT_MIN_SCORE, min_margin=DEFAULT_MIN_MARGIN):
+        """Turn an instruction into actions without a model, or None when unsure.
+
+        The prompt is split into phrases ("click login, then type 'bob' into user
+        name"); each needs a known verb and a best match scoring at least
+        min_score and min_margin above the runner-up. If any phrase falls short
+        the whole prompt is left to get_actions.
+        """
+        if not self.size:
+            return None
+        quoted = []
+
+        def stash(match):
+            quoted.append(next(group for group in match.groups() if group is not None))
+            return f"\x00{len(quoted) - 1}\x00"
+
+        actions = []
+        for phrase in _SPLIT_RE.split(_QUOTED_RE.sub(stash, prompt)):
+            if not phrase.strip():
+                continue
+            action = self._resolve_phrase(phrase.strip(), quoted, min_score, min_margin)
+            if action is None:
+                return None
+            actions.append(action)
+        return actions or None
+
+    def _resolve_phrase(self, phrase, quoted, min_score, min_margin):
+        words = phrase.split()
+        verb = words[0].lower()
+        if verb in TYPE_VERBS:
+            action_type = 'type'
+        elif verb in CLICK_VERBS:
+            action_type = 'click'
+        else:
+            return None
+
+        values = [quoted[int(i)] for i in _PLACEHOLDER_RE.findall(phrase)]
+        if action_type == 'click':
+            if verb in SELECT_VERBS and values and _PLACEHOLDER_RE.sub(' ', ' '.join(words[1:])).strip():
+                # select "India" from country: an option value, not something to click
+                return None
+            # click the "Sign up" link: quoted text is part of what to click
+            target = _PLACEHOLDER_RE.sub(lambda m: f" {quoted[int(m.group(1))]} ", ' '.join(words[1:]))
+            values = []
+        else:
+            target = _PLACEHOLDER_RE.sub(' ', ' '.join(words[1:]))
+            if not values:
+                unquoted = _UNQUOTED_VALUE_RE.match(phrase)
+                if not unquoted:
+                    # "type into search" says where but not what; leave it to the model
+                    return None
+                values, target = [unquoted.group(1)], unquoted.group(2)
+
+        matches = self.search(target, k=2, typeable_only=action_type == 'type')
+        if not matches or matches[0][1] < min_score:
+            return None
+        if len(matches) > 1 and matches[0][1] - matches[1][1] < min_margin:
+            return None
+        element, score = matches[0]
+        if action_type == 'click' and element.get('element_type') == 'select':
+            # Clicking a <select> doesn't choose anything
+            return None
+        return {
+            'type': action_type,
+            'label': element.get('label'),
+            'selector': element['selector'],
+            'element_type': element.get('element_type'),
+            'value': values[0] if action_type == 'type' else '',
+            'score': round(score, 3)
+        }
+
+def _synthetic_elements(count):
+    words = ['login', 'search', 'email', 'password', 'submit', 'cart', 'checkout', 'profile', 'menu', 'help',
+             'newsletter', 'coupon', 'address', 'city', 'country', 'phone', 'signup', 'filter', 'sort', 'share']
+    elements = []
+    for i in range(count):
+        word = words[i % len(words)]
+        typeable = i % 3 == 0
+        elements.append({
+            'label': f"L-{i + 1}",
+            'selector': f'[data-testid="{word}-{"input" if typeable else "button"}-{i}"]',
+            'element_type': 'input' if typeable else 'button',
+            'description': f"{word.title()} {i} {'Enter your ' + word if typeable else 'Go to ' + word}"
+        })
+    return elements
+
+def benchmark_element_index(element_count=5000, repeat=5):
+    """Build and query times for an index over element_count synthetic elements"""
+    elements = _synthetic_elements(element_count)
+
+    def best_of(fn):
+        timings, result = [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    build_seconds, index = best_of(lambda: ElementIndex(elements))
+    target = elements[element_count // 2]
+    phrase = f"click {target['description']}"
+    resolve_seconds, actions = best_of(lambda: index.resolve(phrase))
+    return {
+        'elements': element_count,
+        'build_seconds': build_seconds,
+        'resolve_seconds': resolve_seconds,
+        'resolved': bool(actions) and actions[0]['label'] == target['label'],
+    }
+
+if __name__ == "__main__":
+    for count in (500, 5000, 20000):
+        result = benchmark_element_index(element_count=count)
+        print(f"{result['elements']:>6} elements: build {result['build_seconds'] * 1000:.1f} ms, "
+              f"resolve {result['resolve_seconds'] * 1000:.3f} ms, correct: {result['resolved']}")
@@ -1,14 +1,27 @@
 import os
 import sqlite3
 import json
-from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
+import hashlib
+from PIL import Image
 from pathlib import Path
-from playwright.sync_api import sync_playwright
 import logging
 import uuid
 from functools import wraps
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from playwright.async_api import async_playwright
+from utils.browser_pool import get_browser_pool
+from Selector.element_store import ElementStore, backfill_url_keys, normalize_url
+from Selector.screenshot_store import ScreenshotStore, TILES_SUFFIX, is_tile_manifest
+from Selector.overlay_cache import OverlayCache
+from Selector.label_matcher import LabelMatcher
+from Selector.element_index import ElementIndex
+import numpy as np
+from utils.overlay import (render_overlay, render_overlay_file, render_overlay_pil, render_overlay_tiles,
+                           read_region, load_font)
+from utils.image_encoder import DEFAULT_ENCODING, get_image_encoder
+from utils.readiness import get_readiness_engine
 
 logging.basicConfig(
     level=logging.INFO,
@@ -38,38 +51,314 @@ def retry(max_attempts=3, delay=5):
         return wrapper
     return decorator
 
+def async_retry(max_attempts=3, delay=5):
+    """Coroutine counterpart of retry() that backs off with asyncio.sleep"""
+    def decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            last_error = None
+            for attempt in range(max_attempts):
+                try:
+                    return await f(*args, **kwargs)
+                except Exception as e:
+                    last_error = e
+                    if attempt < max_attempts - 1:
+                        wait_time = delay * (attempt + 1)
+                        logging.warning(f"Attempt {attempt + 1} failed. Retrying in {wait_time}s...")
+                        await asyncio.sleep(wait_time)
+                        continue
+                    raise last_error
+        return wrapper
+    return decorator
+
+INTERACTIVE_SELECTOR = '''
+    button, a, input, textarea, select, [role="button"], 
+    [role="link"], [onclick], [tabindex], [role="tab"],
+    [role="checkbox"], [role="radio"], [contenteditable="true"],
+    [data-testid], [data-qa], [data-test], [data-cy], [data-test-id],
+    [data-testing-id], [data-component-id], [data-automation-id],
+    [data-tracking-id], [data-element], [data-hook]
+'''
+
+GENERATE_SELECTOR_JS = '''function generateSelector(el) {
+    // Try data attributes first
+    const dataAttrs = ['testid', 'qa', 'test', 'cy', 'test-id', 'testing-id', 
+                     'component-id', 'automation-id', 'tracking-id', 'element', 'hook'];
+    for (const attr of dataAttrs) {
+        if (el.dataset[attr]) {
+            return {
+                selector: `[data-${attr}="${el.dataset[attr]}"]`,
+                type: 'data-attribute'
+            };
+        }
+    }
+    
+    // Then try ID and ARIA attributes
+    if (el.id) {
+        return {
+            selector: `#${el.id}`,
+            type: 'id'
+        };
+    }
+    
+    if (el.getAttribute('aria-label')) {
+        return {
+            selector: `[aria-label="${el.getAttribute('aria-label')}"]`,
+            type: 'aria-attribute'
+        };
+    }
+    
+    // Then try text content (only if unique)
+    const textContent = el.textContent?.trim();
+    if (textContent && textContent.length > 0 && textContent.length < 50) {
+        const escapedText = textContent.replace(/"/g, '\\"');
+        return {
+            selector: `text="${escapedText}"`,
+            type: 'text-content'
+        };
+    }
+    
+    // Fallback to more complex but stable selector
+    const path = [];
+    let current = el;
+    while (current && current.nodeType === Node.ELEMENT_NODE) {
+        let selector = current.tagName.toLowerCase();
+        if (current.id) {
+            selector = `#${current.id}`;
+            path.unshift(selector);
+            break;
+        }
+        
+        // Include classes if not too many
+        const classes = Array.from(current.classList)
+            .filter(cls => !cls.startsWith('_') && cls.length > 2)
+            .slice(0, 3)
+            .join('.');
+        if (classes) selector += `.${classes}`;
+        
+        // Include specific attributes
+        const attrs = ['name', 'type', 'alt', 'title', 'value', 'role', 'href', 'src'];
+        for (const attr of attrs) {
+            const value = current.getAttribute(attr);
+            if (value) {
+                selector += `[${attr}="${value}"]`;
+                break;
+            }
+        }
+        path.unshift(selector);
+        current = current.parentElement;
+    }
+    
+    return {
+        selector: path.join(' >> '),
+        type: 'composite'
+    };
+}'''
+
+DISMISS_POPUPS_JS = '''() => {
+    const selectors = [
+        '.modal-close', '.close-button', '[aria-label="Close"]',
+        '.overlay-close', '.popup-close', '.btn-close',
+        'button:has-text("Accept")', 'button:has-text("OK")',
+        'button:has-text("Dismiss")', 'button:has-text("Close")'
+    ];
+    for (const selector of selectors) {
+        const el = document.querySelector(selector);
+        if (el) el.click();
+    }
+}'''
+
+# Box, tag, the attributes selector generation reads, and short text; null when not rendered
+DESCRIBE_ELEMENT_JS = '''function describeElement(el, i) {
+    if (el.getClientRects().length === 0) return null;
+    const rect = el.getBoundingClientRect();
+    const attributes = {};
+    for (const attr of ['id', 'name', 'type', 'role', 'aria-label', 'href', 'placeholder', 'title',
+                        'data-testid', 'data-qa', 'data-test', 'data-cy', 'data-test-id',
+                        'data-testing-id', 'data-component-id', 'data-automation-id',
+                        'data-tracking-id', 'data-element', 'data-hook']) {
+        const value = el.getAttribute(attr);
+        if (value !== null) attributes[attr] = value;
+    }
+    return {
+        index: i + 1,
+        box: {x: rect.x, y: rect.y, width: rect.width, height: rect.height},
+        element_type: el.tagName.toLowerCase(),
+        attributes: attributes,
+        text: (el.textContent || '').trim().slice(0, 50)
+    };
+}'''
+
+# Per-handle path: the attributes and text describeElement captures for fingerprints
+DESCRIBE_HANDLE_JS = f'''el => {{
+    {DESCRIBE_ELEMENT_JS}
+    const description = describeElement(el, 0);
+    return description && {{attributes: description.attributes, text: description.text}};
+}}'''
+
+# Single round trip: boxes, tag names and selectors for every candidate element.
+# Indices match query_selector_all order so labels line up with the per-handle path.
+EXTRACT_ELEMENTS_JS = f'''(candidateSelector) => {{
+    {GENERATE_SELECTOR_JS}
+    {DESCRIBE_ELEMENT_JS}
+    const results = [];
+    document.querySelectorAll(candidateSelector).forEach((el, i) => {{
+        const description = describeElement(el, i);
+        if (!description) return;
+        const info = generateSelector(el);
+        description.selector = info.selector;
+        description.selector_type = info.type;
+        results.push(description);
+    }});
+    return results;
+}}'''
+
+# Incremental mode: describe candidates without paying for selector generation
+SNAPSHOT_ELEMENTS_JS = f'''(candidateSelector) => {{
+    {DESCRIBE_ELEMENT_JS}
+    const results = [];
+    document.querySelectorAll(candidateSelector).forEach((el, i) => {{
+        const description = describeElement(el, i);
+        if (description) results.push(description);
+    }});
+    return results;
+}}'''
+
+# Selectors for a subset of candidates, addressed by their 1-based index. Each element is
+# described again so the caller can check it is still the one the snapshot saw.
+SELECTORS_FOR_INDICES_JS = f'''([candidateSelector, indices]) => {{
+    {GENERATE_SELECTOR_JS}
+    {DESCRIBE_ELEMENT_JS}
+    const candidates = document.querySelectorAll(candidateSelector);
+    return indices.map(index => {{
+        const el = candidates[index - 1];
+        const description = el ? describeElement(el, index - 1) : null;
+        if (!description) return null;
+        const info = generateSelector(el);
+        return {{index: index, selector: info.selector, selector_type: info.type, description: description}};
+    }});
+}}'''
+
+PAGE_SIZE_JS = """
+() => {
+    const doc = document.documentElement;
+    const body = document.body || doc;
+    return {
+        width: Math.max(doc.scrollWidth, body.scrollWidth, doc.clientWidth),
+        height: Math.max(doc.scrollHeight, body.scrollHeight, doc.clientHeight),
+        viewport_height: window.innerHeight
+    };
+}
+"""
+
+def plan_tiles(page_height, tile_height, max_tiles):
+    """(y, height) strips covering the page, capped at max_tiles"""
+    tile_height = max(1, int(tile_height))
+    tiles = [(y, min(tile_height, page_height - y)) for y in range(0, max(1, page_height), tile_height)]
+    if len(tiles) > max_tiles:
+        logging.warning(f"Page needs {len(tiles)} tiles, capturing only the first {max_tiles}")
+        tiles = tiles[:max_tiles]
+    return tiles
+
+def element_fingerprint(element):
+    """Stable hash of what identifies an element between snapshots.
+
+    Covers tag, the attributes and text selector generation is based on, and the
+    box rounded to whole pixels. Returns None when the attributes weren't captured.
+    """
+    if 'attributes' not in element:
+        return None
+    box = element['box']
+    payload = [
+        element['element_type'],
+        sorted(element['attributes'].items()),
+        element.get('text', ''),
+        [round(box['x']), round(box['y']), round(box['width']), round(box['height'])]
+    ]
+    return hashlib.sha1(json.dumps(payload, separators=(',', ':')).encode()).hexdigest()
+
+# Attributes that say what an element is for, in the order they're joined into its description
+DESCRIPTION_ATTRIBUTES = ('aria-label', 'placeholder', 'title', 'name', 'id', 'type', 'role',
+                          'data-testid', 'data-test', 'data-qa', 'data-cy')
+
+def element_description(element):
+    """Visible text plus the descriptive attributes, stored for ElementIndex lookups"""
+    attributes = element.get('attributes') or {}
+    parts = [attributes[attr] for attr in DESCRIPTION_ATTRIBUTES if attributes.get(attr)]
+    if element.get('text'):
+        parts.append(element['text'])
+    return ' '.join(parts)[:300]
+
 class ElementLabeler:
-    def __init__(self, storage_dir="data"):
+    EXTRACTION_MODES = ('batch', 'handle')
+    OVERLAY_ENGINES = ('vectorized', 'pil')
+    CAPTURE_MODES = ('full', 'tiled')
+    BROWSER_LAUNCH_OPTIONS = {
+        'headless': False,
+        'timeout': 120000,
+        'args': [
+            '--disable-blink-features=AutomationControlled',
+            '--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            '--start-maximized'
+        ]
+    }
+    CONTEXT_OPTIONS = {
+        'viewport': {'width': 1366, 'height': 768},
+        'locale': 'en-US',
+        'ignore_https_errors': True
+    }
+
+    def __init__(self, storage_dir="data", extraction_mode="batch", browser_pool=None, overlay_engine="vectorized",
+                 capture_mode="full", tile_height=None, max_tiles=200, eager_overlays=False,
+                 overlay_cache_mb=256, overlay_encoding=None, readiness=None):
+        """capture_mode='tiled' screenshots the page in strips of tile_height pixels
+        (default: the viewport height) so very long pages never exist as one bitmap.
+
+        Labeled images are rendered on demand by render_labeled_image and kept in an
+        LRU cache of at most overlay_cache_mb; eager_overlays restores drawing a
+        _labeled companion during every capture.
+
+        Overlays are encoded on a background pool in overlay_encoding (an
+        EncodeOptions; PNG at compression level 3 by default).
+
+        Pages are captured once the ReadinessEngine `readiness` (the shared one by
+        default) considers them settled, rather than after networkidle and fixed sleeps.
+        """
         try:
+            if extraction_mode not in self.EXTRACTION_MODES:
+                raise ValueError(f"Unknown extraction mode: {extraction_mode}")
+            if overlay_engine not in self.OVERLAY_ENGINES:
+                raise ValueError(f"Unknown overlay engine: {overlay_engine}")
+            if capture_mode not in self.CAPTURE_MODES:
+                raise ValueError(f"Unknown capture mode: {capture_mode}")
+            self.extraction_mode = extraction_mode
+            self.overlay_engine = overlay_engine
+            self.capture_mode = capture_mode
+            self.tile_height = tile_height
+            self.max_tiles = max_tiles
+            self.eager_overlays = eager_overlays
+            self.overlay_encoding = overlay_encoding or DEFAULT_ENCODING
+            self.encoder = get_image_encoder()
+            self.readiness = readiness or get_readiness_engine()
+            self.browser_pool = browser_pool
             self.storage_dir = Path(storage_dir)
             self.screenshot_dir = self.storage_dir / "labeled_elements"
             self.screenshot_dir.mkdir(parents=True, exist_ok=True)
             self.db_path = self.storage_dir / "elements.db"
             self.current_session_id = str(uuid.uuid4())
-            self.font = self._load_font(14)
+            self.font = load_font(14)
             self._init_db()
             self._verify_db_integrity()
+            self.store = ElementStore(self.db_path)
+            self.screenshots = ScreenshotStore(self.screenshot_dir)
+            self._label_matchers = {}
+            self._element_indexes = {}
+            self.overlay_cache = OverlayCache(self.storage_dir / "overlay_cache", overlay_cache_mb * 1024 * 1024)
             logging.info(f"ElementLabeler initialized with session ID: {self.current_session_id}")
         except Exception as e:
             logging.error(f"Initialization failed: {str(e)}", exc_info=True)
             raise
 
-    def _load_font(self, size=14):
-        font_paths = [
-            "Arial.ttf",
-            "LiberationSans-Regular.ttf",
-            "/System/Library/Fonts/Supplemental/Arial.ttf",
-            "/Library/Fonts/Arial.ttf"
-        ]
-        for path in font_paths:
-            try:
-                return ImageFont.truetype(path, size)
-            except:
-                continue
-        font = ImageFont.load_default()
-        font.size = size
-        return font
-
     def _init_db(self):
         try:
             with sqlite3.connect(self.db_path) as conn:
@@ -126,6 +415,7 @@ class ElementLabeler:
                                 element_type TEXT,
                                 url TEXT,
                                 selector_type TEXT,
+                                url_key TEXT,
                                 PRIMARY KEY (session_id, label)
                             )
                         """)
@@ -134,6 +424,7 @@ class ElementLabeler:
                     conn.execute("CREATE INDEX IF NOT EXISTS idx_selector ON elements (selector)")
                     conn.execute("CREATE INDEX IF NOT EXISTS idx_url ON elements (url)")
                     conn.execute("CREATE INDEX IF NOT EXISTS idx_selector_type ON elements (selector_type)")
+                    self._migrate_schema(conn)
                     conn.execute("COMMIT")
                 
                 except Exception as e:
@@ -157,6 +448,7 @@ class ElementLabeler:
                             element_type TEXT,
                             url TEXT,
                             selector_type TEXT,
+                            url_key TEXT,
                             PRIMARY KEY (session_id, label)
                         )
                     """)
@@ -164,11 +456,38 @@ class ElementLabeler:
                     conn.execute("CREATE INDEX IF NOT EXISTS idx_selector ON elements (selector)")
                     conn.execute("CREATE INDEX IF NOT EXISTS idx_url ON elements (url)")
                     conn.execute("CREATE INDEX IF NOT EXISTS idx_selector_type ON elements (selector_type)")
+                    self._migrate_schema(conn)
                 logging.info("Created fresh database with new schema")
             except Exception as e:
                 logging.error(f"Failed to create fresh database: {str(e)}")
                 raise
 
+    def _migrate_schema(self, conn):
+        """Add columns and tables introduced after the url migration and backfill them"""
+        columns = [col[1] for col in conn.execute("PRAGMA table_info(elements)").fetchall()]
+        if 'url_key' not in columns:
+            conn.execute("ALTER TABLE elements ADD COLUMN url_key TEXT")
+        if 'fingerprint' not in columns:
+            conn.execute("ALTER TABLE elements ADD COLUMN fingerprint TEXT")
+        if 'description' not in columns:
+            conn.execute("ALTER TABLE elements ADD COLUMN description TEXT")
+        # Exact-match key replaces the leading-wildcard LIKE that couldn't use idx_url
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_url_key ON elements (url_key, timestamp)")
+        backfilled = backfill_url_keys(conn)
+        if backfilled:
+            logging.info(f"Backfilled url_key for {backfilled} rows")
+        # Content-addressed screenshot files, reference-counted through elements.screenshot_path
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS screenshots (
+                path TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER,
+                created DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_used DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_screenshot_path ON elements (screenshot_path)")
+
     def _verify_db_integrity(self):
         try:
             with sqlite3.connect(self.db_path) as conn:
@@ -186,69 +505,59 @@ class ElementLabeler:
         return self.current_session_id
 
     @retry(max_attempts=3, delay=5)
-    def capture_and_label(self, url, clear_existing=False):
+    def capture_and_label(self, url, clear_existing=False, incremental=False):
+        """Capture url and label its interactive elements into the current session.
+
+        With incremental, elements are diffed against the last stored snapshot of the
+        same URL and only added or changed elements get new selectors and rows.
+
+        Returns the labeled image path with eager_overlays, otherwise the raw
+        screenshot path; use render_labeled_image to get the overlay when needed.
+        """
         try:
             if not url.startswith(('http://', 'https://')):
                 url = f'https://{url}'
             
-            if not clear_existing and self.has_existing_labels(url):
-                latest_image = self.get_latest_labeled_image(url)
+            previous = self.store.get_latest_snapshot(url) if incremental else None
+            if incremental and not previous:
+                logging.info(f"No previous snapshot for {url}, doing a full label")
+            elif previous and any(row['fingerprint'] is None for row in previous['elements']):
+                # Rows stored before fingerprints (or without attributes) would all diff as removed
+                # and every element would be renumbered, breaking existing L-N references
+                logging.info(f"Previous snapshot of {url} has no fingerprints, doing a full label")
+                previous = None
+
+            if not clear_existing and not incremental:
+                latest_image = self._reuse_existing_labels(url)
                 if latest_image:
-                    logging.info(f"Using existing labels for {url}")
-                    existing_selectors = self.get_selectors_for_url(url)
-                    for selector_info in existing_selectors:
-                        self._store_element(
-                            selector_info['label'],
-                            latest_image.replace("_labeled.png", ".png"),
-                            selector_info['selector'],
-                            selector_info['coordinates'],
-                            selector_info['element_type'],
-                            url,
-                            selector_info.get('selector_type', 'legacy')
-                        )
                     return latest_image
 
             logging.info(f"Starting capture and label for {url} (session: {self.current_session_id})")
-            if clear_existing:
-                self.clear_session_elements()
 
-            playwright = sync_playwright().start()
-            try:
-                browser = playwright.chromium.launch(
-                    headless=False,
-                    timeout=120000,
-                    args=[
-                        '--disable-blink-features=AutomationControlled',
-                        '--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                        '--start-maximized'
-                    ]
-                )
-                context = browser.new_context(
-                    viewport={'width': 1366, 'height': 768},
-                    locale='en-US',
-                    ignore_https_errors=True
-                )
+            with self._get_browser_pool().context(**self.CONTEXT_OPTIONS) as context:
                 context.set_default_timeout(90000)
                 context.set_default_navigation_timeout(120000)
+                context.add_init_script(script=self.readiness.init_script())
                 page = context.new_page()
                 try:
                     response = page.goto(url, wait_until="domcontentloaded", timeout=120000)
                     if not response or not response.ok:
                         raise Exception(f"Navigation failed with status: {response.status if response else 'no response'}")
                     
-                    # Wait for page to stabilize
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    page.wait_for_timeout(2000)  # Additional buffer time
+                    # Wait for the DOM and network to go quiet
+                    self.readiness.wait_for_page(page, 'navigation')
                     
                     self._dismiss_popups(page)
                     
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    screenshot_path = str(self.screenshot_dir / f"screenshot_{timestamp}.png")
-                    page.screenshot(path=screenshot_path, full_page=True, animations='disabled', timeout=30000)
-                    logging.info(f"Screenshot saved to {screenshot_path}")
+                    screenshot_path = self._capture_screenshot(page)
                     
-                    elements = self._find_interactive_elements(page)
-                    labeled_path = self._label_elements(screenshot_path, elements, page, url)
+                    if previous:
+                        return self._label_incrementally(page, screenshot_path, url, previous)
+
+                    elements = self._extract_elements(page)
+                    # Old session rows are replaced in the same transaction as the new ones
+                    labeled_path = self._label_elements(screenshot_path, elements, page, url,
+                                                        replace_session=clear_existing)
                     return labeled_path
                 except Exception as e:
                     logging.error(f"Page interaction failed: {str(e)}", exc_info=True)
@@ -256,190 +565,503 @@ class ElementLabeler:
                 finally:
                     if page and not page.is_closed():
                         page.close()
-            finally:
-                if 'context' in locals():
-                    context.close()
-                if 'browser' in locals():
-                    browser.close()
-                playwright.stop()
         except Exception as e:
             logging.error(f"Capture and label failed: {str(e)}", exc_info=True)
             raise
 
+    @staticmethod
+    def _diff_snapshot(candidates, previous):
+        """Split candidates into (kept, added, removed) by fingerprint against the previous snapshot"""
+        previous_by_fingerprint = {}
+        for row in previous['elements']:
+            previous_by_fingerprint.setdefault(row['fingerprint'], []).append(row)
+        kept, added = [], []
+        for candidate in candidates:
+            matches = previous_by_fingerprint.get(element_fingerprint(candidate))
+            if matches:
+                kept.append((candidate, matches.pop()))
+            else:
+                added.append(candidate)
+        removed = [row for rows in previous_by_fingerprint.values() for row in rows]
+        return kept, added, removed
+
+    def _label_incrementally(self, page, screenshot_path, url, previous, session_id=None):
+        """Relabel by fingerprint diff against previous (see ElementStore.get_latest_snapshot)"""
+        session_id = session_id or self.current_session_id
+        start_time = time.time()
+        candidates = page.evaluate(SNAPSHOT_ELEMENTS_JS, INTERACTIVE_SELECTOR)
+        kept, added, removed = self._diff_snapshot(candidates, previous)
+
+        if added:
+            selectors = page.evaluate(SELECTORS_FOR_INDICES_JS, [INTERACTIVE_SELECTOR, [c['index'] for c in added]])
+            if all(info and element_fingerprint(info['description']) == element_fingerprint(candidate)
+                   for candidate, info in zip(added, selectors)):
+                for candidate, info in zip(added, selectors):
+                    candidate['selector'] = info['selector']
+                    candidate['selector_type'] = info['selector_type']
+            else:
+                # The DOM changed between the two evaluates, so indices may point at other elements;
+                # redo the diff from one extraction that has selectors for every candidate
+                logging.info(f"Page changed while relabeling {url}; diffing a full extraction instead")
+                candidates = page.evaluate(EXTRACT_ELEMENTS_JS, INTERACTIVE_SELECTOR)
+                kept, added, removed = self._diff_snapshot(candidates, previous)
+
+        # Kept elements keep their labels; new ones are numbered after every previous label
+        next_number = max(
+            (int(row['label'][2:]) for row in previous['elements'] if row['label'][2:].isdigit()),
+            default=0
+        ) + 1
+        kept_rows = [
+            (row['label'], screenshot_path, row['selector'], row['coordinates'], row['element_type'], url,
+             row['selector_type'], row['fingerprint'], row['description'])
+            for _, row in kept
+        ]
+        added_rows = [
+            (f"L-{next_number + i}", screenshot_path, c['selector'], c['box'], c['element_type'], url,
+             c['selector_type'], element_fingerprint(c), element_description(c))
+            for i, c in enumerate(added)
+        ]
+        self.store.apply_snapshot_diff(
+            session_id, previous['session_id'], url, screenshot_path,
+            kept_rows, added_rows, [row['label'] for row in removed]
+        )
+        logging.info(
+            f"Incremental relabel of {url}: {len(kept)} unchanged, {len(added)} added/changed, "
+            f"{len(removed)} removed in {time.time() - start_time:.2f}s"
+        )
+        return self._labeled_result(
+            screenshot_path,
+            [(row['label'], candidate['box']) for candidate, row in kept] +
+            [(row[0], row[3]) for row in added_rows]
+        )
+
+    def _reuse_existing_labels(self, url, session_id=None):
+        """Copy the stored labels for url into the session; returns the capture result or None"""
+        if not self.has_existing_labels(url):
+            return None
+        screenshot_path = self.store.get_latest_screenshot_path(url)
+        if not screenshot_path:
+            return None
+        logging.info(f"Using existing labels for {url}")
+        self._store_elements(
+            [
+                (
+                    selector_info['label'],
+                    screenshot_path,
+                    selector_info['selector'],
+                    selector_info['coordinates'],
+                    selector_info['element_type'],
+                    url,
+                    selector_info.get('selector_type', 'legacy'),
+                    selector_info.get('fingerprint'),
+                    selector_info.get('description', '')
+                )
+                for selector_info in self.get_selectors_for_url(url)
+            ],
+            session_id=session_id
+        )
+        if self.eager_overlays:
+            return self.get_latest_labeled_image(url)
+        return screenshot_path
+
+    def capture_and_label_many(self, urls, concurrency=4, clear_existing=False):
+        """Label several URLs in parallel; see capture_and_label_many_async.
+
+        The async labeler runs on its own worker thread and event loop: a pooled sync
+        Playwright on the calling thread (after any capture_and_label or fetch) keeps
+        an event loop there, which makes asyncio.run() fail.
+        """
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="label-many") as executor:
+            return executor.submit(
+                asyncio.run, self.capture_and_label_many_async(urls, concurrency, clear_existing)
+            ).result()
+
+    async def capture_and_label_many_async(self, urls, concurrency=4, clear_existing=False):
+        """Label URLs concurrently on one async browser with at most `concurrency` open pages.
+
+        Each URL is labeled into its own new session so L-<n> labels from different
+        pages don't overwrite each other. Returns one result per URL, in input order:
+        {url, session_id, labeled_path, element_count, duration, error}.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(**self.BROWSER_LAUNCH_OPTIONS)
+            try:
+                async def run_one(url):
+                    session_id = str(uuid.uuid4())
+                    result = {'url': url, 'session_id': session_id, 'labeled_path': None,
+                              'element_count': 0, 'duration': 0.0, 'error': None}
+                    async with semaphore:
+                        start_time = time.time()
+                        try:
+                            labeled_path, element_count = await self._capture_and_label_async(
+                                browser, url, session_id, clear_existing
+                            )
+                            result['labeled_path'] = labeled_path
+                            result['element_count'] = element_count
+                        except Exception as e:
+                            logging.error(f"Capture and label failed for {url}: {str(e)}")
+                            result['error'] = str(e)
+                        result['duration'] = time.time() - start_time
+                    return result
+
+                results = await asyncio.gather(*(run_one(url) for url in urls))
+            finally:
+                await browser.close()
+
+        failed = sum(1 for r in results if r['error'])
+        logging.info(f"Labeled {len(results) - failed}/{len(results)} URLs (concurrency={concurrency})")
+        return results
+
+    @async_retry(max_attempts=3, delay=5)
+    async def _capture_and_label_async(self, browser, url, session_id, clear_existing=False):
+        if not url.startswith(('http://', 'https://')):
+            url = f'https://{url}'
+
+        if not clear_existing:
+            latest_image = await asyncio.to_thread(self._reuse_existing_labels, url, session_id)
+            if latest_image:
+                elements = await asyncio.to_thread(self.get_session_elements, session_id)
+                return latest_image, len(elements)
+
+        logging.info(f"Starting capture and label for {url} (session: {session_id})")
+        context = await browser.new_context(**self.CONTEXT_OPTIONS)
+        try:
+            context.set_default_timeout(90000)
+            context.set_default_navigation_timeout(120000)
+            await context.add_init_script(script=self.readiness.init_script())
+            page = await context.new_page()
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=120000)
+            if not response or not response.ok:
+                raise Exception(f"Navigation failed with status: {response.status if response else 'no response'}")
+
+            await self.readiness.wait_for_page_async(page, 'navigation')
+
+            try:
+                await page.evaluate(DISMISS_POPUPS_JS)
+                await self.readiness.wait_for_page_async(page, 'popups')
+            except Exception:
+                pass
+
+            screenshot_path = await self._capture_screenshot_async(page)
+
+            start_time = time.time()
+            elements = await page.evaluate(EXTRACT_ELEMENTS_JS, INTERACTIVE_SELECTOR)
+            logging.info(f"Extracted {len(elements)} elements in {time.time() - start_time:.2f}s (batch mode)")
+        finally:
+            await context.close()
+
+        # Drawing and sqlite writes are blocking; keep them off the event loop
+        labeled_path = await asyncio.to_thread(
+            self._label_elements, screenshot_path, elements, None, url, session_id, clear_existing
+        )
+        return labeled_path, len(elements)
+
+    def _capture_screenshot(self, page):
+        """Screenshot the page per capture_mode; returns the stored screenshot or tile manifest path"""
+        if self.capture_mode == 'full':
+            return self._save_screenshot(page.screenshot(full_page=True, animations='disabled', timeout=30000))
+        start_time = time.time()
+        size = page.evaluate(PAGE_SIZE_JS)
+        tile_height = self.tile_height or size['viewport_height']
+        tiles = []
+        for y, height in plan_tiles(size['height'], tile_height, self.max_tiles):
+            data = page.screenshot(clip={'x': 0, 'y': y, 'width': size['width'], 'height': height},
+                                   full_page=True, animations='disabled', timeout=30000)
+            tiles.append({'y': y, 'height': height, 'path': self.store.save_screenshot(self.screenshots, data)[0]})
+        return self._save_tile_manifest(size, tile_height, tiles, start_time)
+
+    async def _capture_screenshot_async(self, page):
+        if self.capture_mode == 'full':
+            screenshot = await page.screenshot(full_page=True, animations='disabled', timeout=30000)
+            return await asyncio.to_thread(self._save_screenshot, screenshot)
+        start_time = time.time()
+        size = await page.evaluate(PAGE_SIZE_JS)
+        tile_height = self.tile_height or size['viewport_height']
+        tiles = []
+        for y, height in plan_tiles(size['height'], tile_height, self.max_tiles):
+            data = await page.screenshot(clip={'x': 0, 'y': y, 'width': size['width'], 'height': height},
+                                         full_page=True, animations='disabled', timeout=30000)
+            path, _ = await asyncio.to_thread(self.store.save_screenshot, self.screenshots, data)
+            tiles.append({'y': y, 'height': height, 'path': path})
+        return await asyncio.to_thread(self._save_tile_manifest, size, tile_height, tiles, start_time)
+
+    def _save_tile_manifest(self, size, tile_height, tiles, start_time):
+        manifest = {'width': size['width'], 'height': size['height'], 'tile_height': tile_height, 'tiles': tiles}
+        data = json.dumps(manifest, sort_keys=True).encode()
+        manifest_path, _ = self.store.save_screenshot(self.screenshots, data, TILES_SUFFIX)
+        logging.info(f"Captured {len(tiles)} tiles of {size['width']}x{size['height']} page in {time.time() - start_time:.2f}s")
+        return manifest_path
+
+    def _save_screenshot(self, data):
+        screenshot_path, was_new = self.store.save_screenshot(self.screenshots, data)
+        if was_new:
+            logging.info(f"Screenshot saved to {screenshot_path}")
+        else:
+            logging.info(f"Screenshot identical to existing {screenshot_path}, reusing it")
+        return screenshot_path
+
+    def _collect_screenshot_garbage(self):
+        try:
+            removed, freed = self.store.collect_garbage(self.screenshots)
+            if removed:
+                logging.info(f"Removed {removed} unreferenced screenshots ({freed / 1024 / 1024:.1f} MB)")
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"Screenshot garbage collection failed: {str(e)}")
+
+    def import_legacy_screenshots(self, include_unreferenced=False):
+        """Move timestamped screenshots into the content-addressed store.
+
+        Byte-identical captures collapse into one file and the old files are deleted.
+        With include_unreferenced, screenshot_*.png files no element row points at are
+        imported too, which makes them eligible for garbage collection.
+        Returns the number of files imported.
+        """
+        legacy_paths = [p for p in self.store.get_unregistered_screenshot_paths() if p and os.path.exists(p)]
+        if include_unreferenced:
+            referenced = {os.path.abspath(p) for p in legacy_paths}
+            legacy_paths += [
+                str(p) for p in sorted(self.screenshot_dir.glob("screenshot_*.png"))
+                if not p.name.endswith("_labeled.png") and os.path.abspath(p) not in referenced
+            ]
+        for old_path in legacy_paths:
+            with open(old_path, 'rb') as f:
+                new_path = self._save_screenshot(f.read())
+            old_labeled = self.screenshots.labeled_path(old_path)
+            new_labeled = self.screenshots.labeled_path(new_path)
+            if os.path.exists(old_labeled) and not os.path.exists(new_labeled):
+                os.replace(old_labeled, new_labeled)
+            self.store.repoint_screenshot(old_path, new_path)
+            if os.path.abspath(old_path) != os.path.abspath(new_path):
+                self.screenshots.remove(old_path)
+        logging.info(f"Imported {len(legacy_paths)} legacy screenshots")
+        return len(legacy_paths)
+
+    def _get_browser_pool(self):
+        """Pool passed to the constructor, or the shared pool for our launch options"""
+        if self.browser_pool is None:
+            return get_browser_pool(**self.BROWSER_LAUNCH_OPTIONS)
+        return self.browser_pool
+
     def _dismiss_popups(self, page):
         try:
-            page.evaluate('''() => {
-                const selectors = [
-                    '.modal-close', '.close-button', '[aria-label="Close"]',
-                    '.overlay-close', '.popup-close', '.btn-close',
-                    'button:has-text("Accept")', 'button:has-text("OK")',
-                    'button:has-text("Dismiss")', 'button:has-text("Close")'
-                ];
-                for (const selector of selectors) {
-                    const el = document.querySelector(selector);
-                    if (el) el.click();
-                }
-            }''')
-            page.wait_for_timeout(1000)
+            page.evaluate(DISMISS_POPUPS_JS)
+            self.readiness.wait_for_page(page, 'popups')
         except:
             pass
 
     def _find_interactive_elements(self, page):
         try:
-            elements = page.query_selector_all('''
-                button, a, input, textarea, select, [role="button"], 
-                [role="link"], [onclick], [tabindex], [role="tab"],
-                [role="checkbox"], [role="radio"], [contenteditable="true"],
-                [data-testid], [data-qa], [data-test], [data-cy], [data-test-id],
-                [data-testing-id], [data-component-id], [data-automation-id],
-                [data-tracking-id], [data-element], [data-hook]
-            ''')
+            elements = page.query_selector_all(INTERACTIVE_SELECTOR)
             logging.info(f"Found {len(elements)} elements to label")
             return elements
         except Exception as e:
             logging.error(f"Element detection failed: {str(e)}")
             return []
 
-    def _label_elements(self, screenshot_path, elements, page=None, url=None):
-        try:
-            img = Image.open(screenshot_path)
-            draw = ImageDraw.Draw(img)
-            
-            for idx, element in enumerate(elements, 1):
-                try:
-                    box = element.bounding_box()
-                    if not box:
-                        continue
-                    
-                    label = f"L-{idx}"
-                    
-                    draw.rectangle(
-                        [(box['x'], box['y']), (box['x'] + box['width'], box['y'] + box['height'])],
-                        outline="red",
-                        width=2
-                    )
-                    
-                    text_bbox = draw.textbbox((0, 0), label, font=self.font)
-                    text_width = text_bbox[2] - text_bbox[0]
-                    text_height = text_bbox[3] - text_bbox[1]
-                    
-                    draw.rectangle(
-                        [(box['x'], box['y'] - text_height - 5), (box['x'] + text_width + 5, box['y'] - 5)],
-                        fill="white"
-                    )
-                    
-                    draw.text(
-                        (box['x'] + 2, box['y'] - text_height - 3),
-                        label,
-                        fill="red",
-                        font=self.font
-                    )
-                    
-                    element_type = element.evaluate('el => el.tagName.toLowerCase()')
-                    selector, selector_type = self._generate_selector(element)
-                    self._store_element(label, screenshot_path, selector, box, element_type, url, selector_type)
-                except Exception as e:
-                    logging.warning(f"Failed to process element {idx}: {str(e)}", exc_info=True)
+    def _extract_elements(self, page):
+        """Collect box, tag name and selector for every visible candidate element.
+
+        Returns a list of dicts with index, box, element_type, selector and selector_type.
+        """
+        start_time = time.time()
+        mode = self.extraction_mode
+        elements = None
+        if mode == 'batch':
+            try:
+                elements = self._extract_elements_batch(page)
+            except Exception as e:
+                logging.warning(f"Batched extraction failed, falling back to per-handle: {str(e)}")
+                mode = 'handle'
+        if elements is None:
+            elements = self._extract_elements_per_handle(page)
+        logging.info(f"Extracted {len(elements)} elements in {time.time() - start_time:.2f}s ({mode} mode)")
+        return elements
+
+    def _extract_elements_batch(self, page):
+        """One page.evaluate for all candidates instead of three round trips per handle"""
+        return page.evaluate(EXTRACT_ELEMENTS_JS, INTERACTIVE_SELECTOR)
+
+    def _extract_elements_per_handle(self, page):
+        """Original per-handle path, kept as a fallback and for comparison"""
+        elements = []
+        for idx, element in enumerate(self._find_interactive_elements(page), 1):
+            try:
+                box = element.bounding_box()
+                if not box:
                     continue
-            
-            labeled_path = screenshot_path.replace(".png", "_labeled.png")
-            img.save(labeled_path)
-            logging.info(f"Labeled image saved to {labeled_path}")
+                element_type = element.evaluate('el => el.tagName.toLowerCase()')
+                selector, selector_type = self._generate_selector(element)
+                description = element.evaluate(DESCRIBE_HANDLE_JS)
+                info = {
+                    'index': idx,
+                    'box': box,
+                    'element_type': element_type,
+                    'selector': selector,
+                    'selector_type': selector_type
+                }
+                # Same attributes and text as the batch path, so fingerprints and descriptions match
+                if description:
+                    info['attributes'] = description['attributes']
+                    info['text'] = description['text']
+                elements.append(info)
+            except Exception as e:
+                logging.warning(f"Failed to process element {idx}: {str(e)}", exc_info=True)
+                continue
+        return elements
+
+    def _label_elements(self, screenshot_path, elements, page=None, url=None, session_id=None, replace_session=False):
+        try:
+            rows = [
+                (f"L-{element['index']}", screenshot_path, element['selector'], element['box'],
+                 element['element_type'], url, element['selector_type'], element_fingerprint(element),
+                 element_description(element))
+                for element in elements
+            ]
+            labeled_path = self._labeled_result(screenshot_path, [(row[0], row[3]) for row in rows])
+            self._store_elements(rows, session_id=session_id, replace_session=replace_session)
             return labeled_path
         except Exception as e:
             logging.error(f"Labeling failed: {str(e)}", exc_info=True)
             raise
 
-    def _store_element(self, label, screenshot_path, selector, coordinates, element_type, url=None, selector_type='auto'):
+    def _labeled_result(self, screenshot_path, labeled_boxes):
+        if self.eager_overlays:
+            return self._draw_labels(screenshot_path, labeled_boxes)
+        return screenshot_path
+
+    def render_labeled_image(self, url=None, session_id=None, labels=None, region=None):
+        """Labeled image of a stored capture, rendered on first request and then cached.
+
+        Uses the latest capture of url, or of session_id (default: the current
+        session). labels restricts the overlay to those labels and region
+        (x, y, width, height) crops it to part of the page. Returns the path, or
+        None when there is no such capture.
+        """
+        if not url:
+            session_id = session_id or self.current_session_id
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    '''INSERT OR REPLACE INTO elements 
-                    (session_id, label, screenshot_path, selector, coordinates, element_type, url, selector_type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (self.current_session_id, label, screenshot_path, selector, json.dumps(coordinates), element_type, url, selector_type)
-                )
-            logging.debug(f"Stored element {label} in database (selector: {selector})")
+            source = self.store.get_overlay_source(url=url, session_id=session_id)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load labels for overlay: {str(e)}")
+            return None
+        if not source:
+            return None
+        screenshot_path, labeled_boxes = source
+        if labels is not None:
+            wanted = set(labels)
+            labeled_boxes = [item for item in labeled_boxes if item[0] in wanted]
+        labeled_boxes.sort(key=lambda item: item[0])
+        region = tuple(int(v) for v in region) if region else None
+        key = OverlayCache.key(screenshot_path, labeled_boxes, region, self.overlay_engine, self.overlay_encoding)
+        suffix = TILES_SUFFIX if is_tile_manifest(screenshot_path) and not region else self.overlay_encoding.extension
+
+        def render(output_path, sibling_prefix):
+            if region:
+                self._draw_region(screenshot_path, labeled_boxes, region, output_path)
+            else:
+                self._draw_labels(screenshot_path, labeled_boxes, output_path, sibling_prefix, wait=True)
+
+        return self.overlay_cache.get_or_render(key, suffix, render)
+
+    def _draw_region(self, screenshot_path, labeled_boxes, region, output_path):
+        start_time = time.time()
+        x, y, width, height = region
+        tiles = self.screenshots.read_manifest(screenshot_path)['tiles'] if is_tile_manifest(screenshot_path) else None
+        image = read_region(screenshot_path, region, tiles)
+        inside = [
+            (label, box) for label, box in labeled_boxes
+            if box['x'] < x + width and box['x'] + box['width'] > x
+            and box['y'] < y + height and box['y'] + box['height'] > y
+        ]
+        render_overlay(image, inside, offset=(x, y))
+        self.encoder.submit(image, output_path, self.overlay_encoding, self._log_encode).result()
+        logging.info(f"Rendered region {region} with {len(inside)} labels in {time.time() - start_time:.2f}s")
+
+    @staticmethod
+    def _log_encode(result):
+        logging.info(
+            f"Encoded {result['path']} as {result['format']}: "
+            f"{result['bytes'] / 1024:.0f} KB in {result['encode_seconds']:.2f}s"
+        )
+
+    def _draw_labels(self, screenshot_path, labeled_boxes, labeled_path=None, sibling_prefix=None, wait=False):
+        """Draw (label, box) pairs onto a copy of the screenshot; returns the labeled path.
+
+        Encoding happens on the background encoder; unless wait is set the path is
+        returned before the file is written (self.encoder.wait(path) blocks on it).
+        Labeled tiles of a manifest are written as <sibling_prefix><n><ext> when given.
+        """
+        start_time = time.time()
+        extension = self.overlay_encoding.extension
+        labeled_path = labeled_path or self.screenshots.labeled_path(screenshot_path, extension)
+        pending = []
+
+        def write(image, path):
+            pending.append(self.encoder.submit(image, path, self.overlay_encoding, self._log_encode))
+            # Bound the number of decoded tiles queued for encoding
+            while len(pending) > 2 and is_tile_manifest(screenshot_path):
+                pending.pop(0).result()
+
+        if is_tile_manifest(screenshot_path):
+            # Tiles are always rendered with the vectorized engine, one tile in memory at a time
+            manifest = self.screenshots.read_manifest(screenshot_path)
+            if sibling_prefix:
+                output_paths = [f"{sibling_prefix}{i}{extension}" for i in range(len(manifest['tiles']))]
+            else:
+                output_paths = [self.screenshots.labeled_path(tile['path'], extension) for tile in manifest['tiles']]
+            manifest['tiles'] = list(render_overlay_tiles(manifest['tiles'], labeled_boxes,
+                                                          output_paths=output_paths, writer=write))
+            # The manifest must not point at tiles that are still being written
+            for future in pending:
+                future.result()
+            with open(labeled_path, 'w') as f:
+                json.dump(manifest, f, sort_keys=True)
+        elif self.overlay_engine == 'pil':
+            img = Image.open(screenshot_path).convert('RGB')
+            render_overlay_pil(img, labeled_boxes, font=self.font)
+            write(np.ascontiguousarray(np.asarray(img)[:, :, ::-1]), labeled_path)
+        else:
+            render_overlay_file(screenshot_path, labeled_boxes, labeled_path, writer=write)
+        logging.info(f"Labels drawn for {labeled_path} ({len(labeled_boxes)} labels in {time.time() - start_time:.2f}s, {self.overlay_engine})")
+        if wait:
+            for future in pending:
+                future.result()
+        return labeled_path
+
+    def close(self):
+        self.encoder.flush()
+        self.store.close()
+
+    def _store_elements(self, rows, session_id=None, replace_session=False):
+        """Write a page's rows with one executemany in a single transaction.
+
+        rows are (label, screenshot_path, selector, coordinates, element_type, url, selector_type,
+        fingerprint, description) tuples. With replace_session the session's previous rows are deleted in the same
+        transaction, so a failed page leaves the session as it was.
+        """
+        session_id = session_id or self.current_session_id
+        start_time = time.time()
+        try:
+            self.store.store_elements(session_id, rows, replace_session=replace_session)
+            logging.info(f"Stored {len(rows)} elements for session {session_id} in {time.time() - start_time:.3f}s")
         except sqlite3.Error as e:
-            logging.error(f"Failed to store element {label}: {str(e)}", exc_info=True)
+            logging.error(f"Failed to store elements for session {session_id}: {str(e)}", exc_info=True)
             raise
 
+    def _store_element(self, label, screenshot_path, selector, coordinates, element_type, url=None, selector_type='auto', session_id=None, fingerprint=None, description=''):
+        self._store_elements(
+            [(label, screenshot_path, selector, coordinates, element_type, url, selector_type, fingerprint, description)],
+            session_id=session_id
+        )
+        logging.debug(f"Stored element {label} in database (selector: {selector})")
+
     def _generate_selector(self, element):
         try:
-            selector_info = element.evaluate('''el => {
-                // Try data attributes first
-                const dataAttrs = ['testid', 'qa', 'test', 'cy', 'test-id', 'testing-id', 
-                                 'component-id', 'automation-id', 'tracking-id', 'element', 'hook'];
-                for (const attr of dataAttrs) {
-                    if (el.dataset[attr]) {
-                        return {
-                            selector: `[data-${attr}="${el.dataset[attr]}"]`,
-                            type: 'data-attribute'
-                        };
-                    }
-                }
-                
-                // Then try ID and ARIA attributes
-                if (el.id) {
-                    return {
-                        selector: `#${el.id}`,
-                        type: 'id'
-                    };
-                }
-                
-                if (el.getAttribute('aria-label')) {
-                    return {
-                        selector: `[aria-label="${el.getAttribute('aria-label')}"]`,
-                        type: 'aria-attribute'
-                    };
-                }
-                
-                // Then try text content (only if unique)
-                const textContent = el.textContent?.trim();
-                if (textContent && textContent.length > 0 && textContent.length < 50) {
-                    const escapedText = textContent.replace(/"/g, '\\"');
-                    return {
-                        selector: `text="${escapedText}"`,
-                        type: 'text-content'
-                    };
-                }
-                
-                // Fallback to more complex but stable selector
-                const path = [];
-                let current = el;
-                while (current && current.nodeType === Node.ELEMENT_NODE) {
-                    let selector = current.tagName.toLowerCase();
-                    if (current.id) {
-                        selector = `#${current.id}`;
-                        path.unshift(selector);
-                        break;
-                    }
-                    
-                    // Include classes if not too many
-                    const classes = Array.from(current.classList)
-                        .filter(cls => !cls.startsWith('_') && cls.length > 2)
-                        .slice(0, 3)
-                        .join('.');
-                    if (classes) selector += `.${classes}`;
-                    
-                    // Include specific attributes
-                    const attrs = ['name', 'type', 'alt', 'title', 'value', 'role', 'href', 'src'];
-                    for (const attr of attrs) {
-                        const value = current.getAttribute(attr);
-                        if (value) {
-                            selector += `[${attr}="${value}"]`;
-                            break;
-                        }
-                    }
-                    path.unshift(selector);
-                    current = current.parentElement;
-                }
-                
-                return {
-                    selector: path.join(' >> '),
-                    type: 'composite'
-                };
-            }''')
+            selector_info = element.evaluate(f'el => {{ {GENERATE_SELECTOR_JS}; return generateSelector(el); }}')
             
             return selector_info['selector'], selector_info['type']
         except Exception as e:
@@ -449,14 +1071,8 @@ class ElementLabeler:
     def get_selector(self, label, session_id=None):
         session_id = session_id or self.current_session_id
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT selector FROM elements WHERE session_id = ? AND label = ?",
-                    (session_id, label)
-                )
-                result = cursor.fetchone()
-                return result[0] if result else None
+            info = self.store.get_element_info(session_id, label)
+            return info['selector'] if info else None
         except sqlite3.Error as e:
             logging.error(f"Failed to get selector for {label}: {str(e)}")
             return None
@@ -464,33 +1080,15 @@ class ElementLabeler:
     def get_element_info(self, label, session_id=None):
         session_id = session_id or self.current_session_id
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    '''SELECT label, selector, coordinates, element_type, screenshot_path, selector_type
-                    FROM elements WHERE session_id = ? AND label = ?''',
-                    (session_id, label)
-                )
-                result = cursor.fetchone()
-                if result:
-                    return {
-                        'label': result[0],
-                        'selector': result[1],
-                        'coordinates': json.loads(result[2]),
-                        'element_type': result[3],
-                        'screenshot_path': result[4],
-                        'selector_type': result[5]
-                    }
-                return None
+            return self.store.get_element_info(session_id, label)
         except sqlite3.Error as e:
             logging.error(f"Failed to get element info: {str(e)}")
             return None
 
     def clear_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("DELETE FROM elements")
-                conn.execute("VACUUM")
+            self.store.clear_all()
+            self._collect_screenshot_garbage()
             logging.info("Database cleared successfully")
             return True
         except sqlite3.Error as e:
@@ -500,11 +1098,8 @@ class ElementLabeler:
     def clear_session_elements(self, session_id=None):
         session_id = session_id or self.current_session_id
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    "DELETE FROM elements WHERE session_id = ?",
-                    (session_id,)
-                )
+            self.store.clear_session(session_id)
+            self._collect_screenshot_garbage()
             logging.info(f"Cleared elements for session {session_id}")
             return True
         except sqlite3.Error as e:
@@ -514,82 +1109,70 @@ class ElementLabeler:
     def get_session_elements(self, session_id=None):
         session_id = session_id or self.current_session_id
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    '''SELECT label, selector, coordinates, element_type, screenshot_path, selector_type
-                    FROM elements WHERE session_id = ?
-                    ORDER BY label''',
-                    (session_id,)
-                )
-                return [
-                    {
-                        'label': row[0],
-                        'selector': row[1],
-                        'coordinates': json.loads(row[2]),
-                        'element_type': row[3],
-                        'screenshot_path': row[4],
-                        'selector_type': row[5]
-                    }
-                    for row in cursor.fetchall()
-                ]
+            return self.store.get_session_elements(session_id)
         except sqlite3.Error as e:
             logging.error(f"Failed to get session elements: {str(e)}")
             return []
 
+    def get_label_matcher(self, session_id=None):
+        """LabelMatcher over a session's labels, rebuilt only after the store changes"""
+        session_id = session_id or self.current_session_id
+        cached = self._label_matchers.get(session_id)
+        if cached and cached[0] == self.store.generation:
+            return cached[1]
+        generation = self.store.generation
+        matcher = LabelMatcher(self.get_session_elements(session_id))
+        self._label_matchers[session_id] = (generation, matcher)
+        return matcher
+
+    def get_element_index(self, session_id=None, url=None):
+        """ElementIndex over a session's elements, or over the latest labeling of url.
+
+        Cached like get_label_matcher and rebuilt only after the store changes.
+        """
+        key = ('url', normalize_url(url)) if url else ('session', session_id or self.current_session_id)
+        cached = self._element_indexes.get(key)
+        if cached and cached[0] == self.store.generation:
+            return cached[1]
+        generation = self.store.generation
+        try:
+            if url:
+                snapshot = self.store.get_latest_snapshot(url)
+                elements = snapshot['elements'] if snapshot else []
+            else:
+                elements = self.store.get_session_elements(key[1])
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load elements for index: {str(e)}")
+            elements = []
+        index = ElementIndex(elements)
+        self._element_indexes[key] = (generation, index)
+        return index
+
     def has_existing_labels(self, url=None):
         """Check if labels exist for the current URL (regardless of session)"""
         if not url:
             return False
-            
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT 1 FROM elements WHERE url LIKE ? LIMIT 1",
-                (f"%{url}%",)
-            )
-            return cursor.fetchone() is not None
+        return self.store.has_url(url)
 
     def get_latest_labeled_image(self, url):
         """Get the latest labeled image for this URL (regardless of session)"""
         if not url:
             return None
-            
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """SELECT screenshot_path FROM elements 
-                WHERE url LIKE ?
-                ORDER BY timestamp DESC LIMIT 1""",
-                (f"%{url}%",)
-            )
-            result = cursor.fetchone()
-            if result:
-                return result[0].replace(".png", "_labeled.png")
-        return None
+        if self.eager_overlays:
+            screenshot_path = self.store.get_latest_screenshot_path(url)
+            labeled_path = screenshot_path and self.screenshots.labeled_path(
+                screenshot_path, self.overlay_encoding.extension)
+            if labeled_path:
+                self.encoder.wait(labeled_path)
+                if os.path.exists(labeled_path):
+                    return labeled_path
+        return self.render_labeled_image(url=url)
 
     def get_selectors_for_url(self, url):
         """Get all selectors for a given URL (regardless of session)"""
         if not url:
             return []
-            
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """SELECT label, selector, coordinates, element_type, selector_type 
-                FROM elements WHERE url LIKE ?""",
-                (f"%{url}%",)
-            )
-            return [
-                {
-                    'label': row[0],
-                    'selector': row[1],
-                    'coordinates': json.loads(row[2]),
-                    'element_type': row[3],
-                    'selector_type': row[4]
-                }
-                for row in cursor.fetchall()
-            ]
+        return self.store.get_selectors_for_url(url)
 
     def validate_label_exists(self, url, label):
         """Check if a specific label exists for a URL"""
@@ -598,29 +1181,16 @@ class ElementLabeler:
 
     def deduplicate_url_entries(self):
         """Clean up duplicate entries for the same URL"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("""
-                DELETE FROM elements 
-                WHERE rowid NOT IN (
-                    SELECT MAX(rowid) 
-                    FROM elements 
-                    GROUP BY url, label, selector
-                )
-            """)
-            conn.commit()
+        self.store.deduplicate()
         logging.info("Deduplicated URL entries")
 
     def cleanup_old_sessions(self, days=7):
         """Remove elements older than specified days"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute(
-                    "DELETE FROM elements WHERE timestamp < datetime('now', ?)",
-                    (f'-{days} days',)
-                )
-                conn.execute("VACUUM")
+            self.store.delete_older_than(days)
+            self._collect_screenshot_garbage()
             logging.info(f"Cleaned up elements older than {days} days")
             return True
         except sqlite3.Error as e:
             logging.error(f"Cleanup failed: {str(e)}")
-            return False
\ No newline at end of file
+            return False
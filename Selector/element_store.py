@@ -0,0 +1,450 @@
+import json
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from Selector.screenshot_store import TILES_SUFFIX
+
+_MISSING = object()
+
+_ELEMENT_COLUMNS = "label, selector, coordinates, element_type, screenshot_path, selector_type, description"
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url):
+    """Canonical key for a page URL.
+
+    Lowercases scheme and host, assumes https when the scheme is missing (as
+    capture_and_label does), drops default ports, trailing slashes and the
+    fragment, and sorts query parameters.
+    """
+    if not url:
+        return ''
+    url = url.strip()
+    if '://' not in url:
+        url = f'https://{url}'
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and _DEFAULT_PORTS.get(scheme) != port:
+        host = f"{host}:{port}"
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+def backfill_url_keys(conn, batch_size=1000):
+    """Fill url_key for rows written before the column existed; returns the row count"""
+    rows = conn.execute("SELECT rowid, url FROM elements WHERE url_key IS NULL").fetchall()
+    for i in range(0, len(rows), batch_size):
+        conn.executemany(
+            "UPDATE elements SET url_key = ? WHERE rowid = ?",
+            [(normalize_url(url), rowid) for rowid, url in rows[i:i + batch_size]]
+        )
+    return len(rows)
+
+def _row_to_info(row):
+    return {
+        'label': row[0],
+        'selector': row[1],
+        'coordinates': json.loads(row[2]),
+        'element_type': row[3],
+        'screenshot_path': row[4],
+        'selector_type': row[5],
+        'description': row[6] or ''
+    }
+
+class LabelCache:
+    """Thread-safe LRU of (session_id, label) -> element info, including known misses.
+
+    generation is bumped by every invalidation. Read-through callers capture it
+    before querying and pass it to put(), which then drops the value if an
+    invalidation happened in between, so a row read before a write can't be
+    cached after that write's invalidation.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate_session(self, session_id):
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._data if k[0] == session_id]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def info(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+class ElementStore:
+    """Pooled SQLite access to the elements table with a read-through label cache.
+
+    Connections are opened once and reused; each keeps its own prepared statement
+    cache. Writes are serialized through one lock since SQLite allows a single writer.
+    """
+
+    def __init__(self, db_path, pool_size=4, cache_size=4096, cached_statements=128):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.cache = LabelCache(cache_size)
+        self._pool = queue.LifoQueue()
+        self._pool_size = pool_size
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._all_connections = []
+        # Bumped after every write so callers can cache derived data (e.g. label matchers)
+        self.generation = 0
+
+    def _open_connection(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            timeout=30,
+            cached_statements=self.cached_statements
+        )
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; waits for one to be returned when the pool is exhausted"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._created < self._pool_size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                conn = self._open_connection()
+                with self._pool_lock:
+                    self._all_connections.append(conn)
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Serialized write transaction; commits on success and rolls back on error"""
+        with self._write_lock, self.connection() as conn:
+            try:
+                with conn:
+                    yield conn
+            finally:
+                self.generation += 1
+
+    def close(self):
+        with self._pool_lock:
+            for conn in self._all_connections:
+                conn.close()
+            self._all_connections = []
+            self._created = 0
+            self._pool = queue.LifoQueue()
+        self.cache.clear()
+
+    @staticmethod
+    def _insert_rows(conn, session_id, rows):
+        conn.executemany(
+            '''INSERT OR REPLACE INTO elements
+            (session_id, label, screenshot_path, selector, coordinates, element_type, url, selector_type, url_key,
+             fingerprint, description)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            [
+                (session_id, label, screenshot_path, selector, json.dumps(coordinates), element_type, url, selector_type,
+                 normalize_url(url), fingerprint, description)
+                for label, screenshot_path, selector, coordinates, element_type, url, selector_type, fingerprint,
+                description in rows
+            ]
+        )
+
+    def store_elements(self, session_id, rows, replace_session=False):
+        """Insert (label, screenshot_path, selector, coordinates, element_type, url, selector_type, fingerprint,
+        description) rows"""
+        with self.transaction() as conn:
+            if replace_session:
+                conn.execute("DELETE FROM elements WHERE session_id = ?", (session_id,))
+            self._insert_rows(conn, session_id, rows)
+        # Drop the whole session rather than per label so stale "missing" entries go too
+        self.cache.invalidate_session(session_id)
+
+    def get_latest_snapshot(self, url):
+        """Rows of the most recently labeled session for url, as {session_id, elements}"""
+        url_key = normalize_url(url)
+        with self.connection() as conn:
+            row = conn.execute(
+                "SELECT session_id FROM elements WHERE url_key = ? ORDER BY timestamp DESC LIMIT 1",
+                (url_key,)
+            ).fetchone()
+            if not row:
+                return None
+            rows = conn.execute(
+                '''SELECT label, selector, coordinates, element_type, selector_type, fingerprint, description
+                FROM elements WHERE session_id = ? AND url_key = ?''',
+                (row[0], url_key)
+            ).fetchall()
+        return {
+            'session_id': row[0],
+            'elements': [
+                {
+                    'label': r[0],
+                    'selector': r[1],
+                    'coordinates': json.loads(r[2]),
+                    'element_type': r[3],
+                    'selector_type': r[4],
+                    'fingerprint': r[5],
+                    'description': r[6] or ''
+                }
+                for r in rows
+            ]
+        }
+
+    def apply_snapshot_diff(self, session_id, previous_session_id, url, screenshot_path,
+                            kept_rows, added_rows, removed_labels):
+        """Write an incremental relabel in one transaction.
+
+        Relabeling the previous session in place only deletes removed labels, inserts
+        added rows and repoints the kept rows at the new screenshot. Any other session
+        is replaced by copies of the kept rows plus the added ones.
+        """
+        with self.transaction() as conn:
+            if session_id == previous_session_id:
+                conn.executemany(
+                    "DELETE FROM elements WHERE session_id = ? AND label = ?",
+                    [(session_id, label) for label in removed_labels]
+                )
+                conn.execute(
+                    '''UPDATE elements SET screenshot_path = ?, timestamp = CURRENT_TIMESTAMP
+                    WHERE session_id = ? AND url_key = ?''',
+                    (screenshot_path, session_id, normalize_url(url))
+                )
+            else:
+                conn.execute("DELETE FROM elements WHERE session_id = ?", (session_id,))
+                self._insert_rows(conn, session_id, kept_rows)
+            self._insert_rows(conn, session_id, added_rows)
+        self.cache.invalidate_session(session_id)
+
+    def get_element_info(self, session_id, label):
+        key = (session_id, label)
+        info = self.cache.get(key)
+        if info is _MISSING:
+            generation = self.cache.generation
+            with self.connection() as conn:
+                row = conn.execute(
+                    f"SELECT {_ELEMENT_COLUMNS} FROM elements WHERE session_id = ? AND label = ?",
+                    (session_id, label)
+                ).fetchone()
+            info = _row_to_info(row) if row else None
+            self.cache.put(key, info, generation)
+        return dict(info) if info else None
+
+    def get_session_elements(self, session_id):
+        """All elements of a session; also warms the label cache for later lookups"""
+        generation = self.cache.generation
+        with self.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {_ELEMENT_COLUMNS} FROM elements WHERE session_id = ? ORDER BY label",
+                (session_id,)
+            ).fetchall()
+        elements = []
+        for row in rows:
+            info = _row_to_info(row)
+            self.cache.put((session_id, info['label']), info, generation)
+            elements.append(dict(info))
+        return elements
+
+    def has_url(self, url):
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT 1 FROM elements WHERE url_key = ? LIMIT 1",
+                (normalize_url(url),)
+            ).fetchone() is not None
+
+    def get_latest_screenshot_path(self, url):
+        with self.connection() as conn:
+            row = conn.execute(
+                """SELECT screenshot_path FROM elements
+                WHERE url_key = ?
+                ORDER BY timestamp DESC LIMIT 1""",
+                (normalize_url(url),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_overlay_source(self, url=None, session_id=None):
+        """(screenshot_path, [(label, coordinates)]) of a session's latest capture.
+
+        With url, uses the most recent capture of that URL (optionally within session_id).
+        """
+        with self.connection() as conn:
+            if url:
+                query = "SELECT session_id, screenshot_path FROM elements WHERE url_key = ?"
+                params = [normalize_url(url)]
+                if session_id:
+                    query += " AND session_id = ?"
+                    params.append(session_id)
+            else:
+                query = "SELECT session_id, screenshot_path FROM elements WHERE session_id = ?"
+                params = [session_id]
+            row = conn.execute(query + " ORDER BY timestamp DESC LIMIT 1", params).fetchone()
+            if not row:
+                return None
+            rows = conn.execute(
+                "SELECT label, coordinates FROM elements WHERE session_id = ? AND screenshot_path = ?",
+                row
+            ).fetchall()
+        return row[1], [(label, json.loads(coordinates)) for label, coordinates in rows]
+
+    def get_selectors_for_url(self, url):
+        with self.connection() as conn:
+            rows = conn.execute(
+                """SELECT label, selector, coordinates, element_type, selector_type, fingerprint, description
+                FROM elements WHERE url_key = ?""",
+                (normalize_url(url),)
+            ).fetchall()
+        return [
+            {
+                'label': row[0],
+                'selector': row[1],
+                'coordinates': json.loads(row[2]),
+                'element_type': row[3],
+                'selector_type': row[4],
+                'fingerprint': row[5],
+                'description': row[6] or ''
+            }
+            for row in rows
+        ]
+
+    def save_screenshot(self, screenshot_store, data, suffix='.png'):
+        """Store screenshot bytes content-addressed and register them for garbage collection.
+
+        Runs under the write lock so a concurrent collect_garbage can't delete a file
+        that is being reused by a new capture.
+        """
+        with self.transaction() as conn:
+            path, digest, was_new = screenshot_store.put_bytes(data, suffix)
+            conn.execute(
+                '''INSERT INTO screenshots (path, digest, size) VALUES (?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET last_used = CURRENT_TIMESTAMP''',
+                (path, digest, len(data))
+            )
+        return path, was_new
+
+    def collect_garbage(self, screenshot_store, grace_seconds=300):
+        """Delete registered screenshots no element row references any more.
+
+        Files used within the last grace_seconds are kept so a capture whose rows
+        aren't written yet doesn't lose its screenshot. Returns (files, bytes_freed).
+        """
+        with self.transaction() as conn:
+            paths = [
+                row[0] for row in conn.execute(
+                    '''SELECT path FROM screenshots s
+                    WHERE last_used < datetime('now', ?)
+                    AND NOT EXISTS (SELECT 1 FROM elements e WHERE e.screenshot_path = s.path)''',
+                    (f'-{int(grace_seconds)} seconds',)
+                ).fetchall()
+            ]
+            if paths:
+                # Tiles are only referenced through the manifests rows point at
+                live_parts = set()
+                for (manifest_path,) in conn.execute(
+                    "SELECT DISTINCT screenshot_path FROM elements WHERE screenshot_path LIKE ?",
+                    (f"%{TILES_SUFFIX}",)
+                ):
+                    live_parts.update(screenshot_store.manifest_parts(manifest_path))
+                paths = [path for path in paths if path not in live_parts]
+            conn.executemany("DELETE FROM screenshots WHERE path = ?", [(path,) for path in paths])
+            freed = sum(screenshot_store.remove(path) for path in paths)
+        return len(paths), freed
+
+    def get_unregistered_screenshot_paths(self):
+        """Screenshot paths referenced by elements but not tracked in the screenshots table"""
+        with self.connection() as conn:
+            return [
+                row[0] for row in conn.execute(
+                    '''SELECT DISTINCT screenshot_path FROM elements e
+                    WHERE NOT EXISTS (SELECT 1 FROM screenshots s WHERE s.path = e.screenshot_path)'''
+                ).fetchall()
+            ]
+
+    def repoint_screenshot(self, old_path, new_path):
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE elements SET screenshot_path = ? WHERE screenshot_path = ?",
+                (new_path, old_path)
+            )
+        self.cache.clear()
+
+    def clear_session(self, session_id):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM elements WHERE session_id = ?", (session_id,))
+        self.cache.invalidate_session(session_id)
+
+    def clear_all(self):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM elements")
+        self.cache.clear()
+        self.vacuum()
+
+    def delete_older_than(self, days):
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM elements WHERE timestamp < datetime('now', ?)",
+                (f'-{days} days',)
+            )
+        self.cache.clear()
+        self.vacuum()
+
+    def deduplicate(self):
+        with self.transaction() as conn:
+            conn.execute("""
+                DELETE FROM elements
+                WHERE rowid NOT IN (
+                    SELECT MAX(rowid)
+                    FROM elements
+                    GROUP BY url_key, label, selector
+                )
+            """)
+        self.cache.clear()
+
+    def vacuum(self):
+        # VACUUM can't run inside a transaction
+        with self._write_lock, self.connection() as conn:
+            conn.execute("VACUUM")
@@ -0,0 +1,283 @@
+import re
+import time
+from html import escape
+from html.parser import HTMLParser
+
+DEFAULT_TOKEN_BUDGET = 2000
+
+# Subtrees that never help the model pick a selector
+DROP_TAGS = frozenset({'script', 'style', 'svg', 'noscript', 'template', 'canvas', 'object', 'iframe', 'math'})
+VOID_TAGS = frozenset({'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                       'param', 'source', 'track', 'wbr'})
+INTERACTIVE_TAGS = frozenset({'a', 'button', 'input', 'select', 'textarea', 'summary'})
+INTERACTIVE_ROLES = frozenset({'button', 'link', 'checkbox', 'radio', 'tab', 'menuitem', 'textbox',
+                               'combobox', 'switch', 'option', 'searchbox', 'slider'})
+HEADING_TAGS = frozenset({'title', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'label', 'legend', 'caption', 'th'})
+KEPT_ATTRIBUTES = frozenset({'id', 'name', 'role', 'type', 'href'})
+
+# Start tags that imply the end of an open element (HTML optional end tags): the nearest open
+# element in the first set is closed, unless an element in the second set is found first
+_BLOCK_TAGS = frozenset({'address', 'article', 'aside', 'blockquote', 'details', 'div', 'dl', 'fieldset',
+                         'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr',
+                         'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'})
+_P_SCOPE = frozenset({'p'}), frozenset({'button', 'table', 'td', 'th', 'li', 'dd', 'dt', 'div', 'section'})
+IMPLIED_END_TAGS = {
+    'li': (frozenset({'li'}), frozenset({'ul', 'ol', 'table'})),
+    'dt': (frozenset({'dt', 'dd'}), frozenset({'dl', 'table'})),
+    'dd': (frozenset({'dt', 'dd'}), frozenset({'dl', 'table'})),
+    'option': (frozenset({'option'}), frozenset({'select', 'datalist', 'optgroup'})),
+    'optgroup': (frozenset({'option', 'optgroup'}), frozenset({'select'})),
+    'tr': (frozenset({'tr', 'td', 'th'}), frozenset({'table', 'thead', 'tbody', 'tfoot'})),
+    'td': (frozenset({'td', 'th'}), frozenset({'tr', 'table'})),
+    'th': (frozenset({'td', 'th'}), frozenset({'tr', 'table'})),
+    'thead': (frozenset({'tr', 'td', 'th', 'thead', 'tbody', 'tfoot'}), frozenset({'table'})),
+    'tbody': (frozenset({'tr', 'td', 'th', 'thead', 'tbody', 'tfoot'}), frozenset({'table'})),
+    'tfoot': (frozenset({'tr', 'td', 'th', 'thead', 'tbody', 'tfoot'}), frozenset({'table'})),
+    **{tag: _P_SCOPE for tag in _BLOCK_TAGS},
+}
+# Deeper nesting than this is treated as broken markup: the outermost open element is dropped
+MAX_OPEN_DEPTH = 256
+
+MAX_TEXT_CHARS = 80
+MAX_CONTEXT_CHARS = 120
+MAX_ATTRIBUTE_CHARS = 100
+
+# Interactive elements, then headings/labels, then remaining text
+_TIER_INTERACTIVE, _TIER_HEADING, _TIER_TEXT = range(3)
+
+_TOKEN_RE = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]")
+_SPACE_RE = re.compile(r"\s+")
+
+def estimate_tokens(text):
+    """BPE-like token estimate: long words and numbers split into several tokens,
+    every punctuation mark counts as one."""
+    return len(_TOKEN_RE.findall(text))
+
+def keep_attribute(name):
+    return name in KEPT_ATTRIBUTES or name.startswith('aria-') or name.startswith('data-test')
+
+class _Record:
+    __slots__ = ('tag', 'attrs', 'text', 'text_len', 'tier', 'order', 'limit')
+
+    def __init__(self, tag, attrs, tier, order, limit):
+        self.tag = tag
+        self.attrs = attrs
+        self.text = []
+        self.text_len = 0
+        self.tier = tier
+        self.order = order
+        self.limit = limit
+
+    def add_text(self, text):
+        if self.text_len < self.limit:
+            self.text.append(text)
+            self.text_len += len(text) + 1
+
+    def render(self):
+        text = ' '.join(self.text)[:self.limit]
+        if self.tag is None:
+            return text
+        attrs = ''.join(f' {k}="{escape(v[:MAX_ATTRIBUTE_CHARS], quote=True)}"' if v else f' {k}'
+                        for k, v in self.attrs)
+        if self.tag in VOID_TAGS:
+            return f"<{self.tag}{attrs}> {text}" if text else f"<{self.tag}{attrs}>"
+        return f"<{self.tag}{attrs}>{text}</{self.tag}>"
+
+class _Distiller(HTMLParser):
+    """Single pass over the document collecting ranked records; never builds a tree.
+
+    Only a stack of open tag names is kept, so text can be attributed to the
+    records that enclose it. End tags that HTML lets pages omit (</li>, </th>,
+    </option>, </p>) are implied by the next sibling's start tag or by the
+    enclosing element's end tag, so an unclosed record stops collecting text.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        self._stack = []  # (tag, record or None) of open elements, innermost last
+        self._open = []  # records still collecting text, innermost last
+        self._skip_tag = None
+        self._skip_depth = 0
+
+    def _push(self, tag, record):
+        if len(self._stack) >= MAX_OPEN_DEPTH:
+            _, dropped = self._stack.pop(0)
+            if dropped is not None:
+                self._open.pop(0)
+        self._stack.append((tag, record))
+        if record is not None:
+            self._open.append(record)
+
+    def _close_from(self, index):
+        closed = sum(record is not None for _, record in self._stack[index:])
+        del self._stack[index:]
+        if closed:
+            del self._open[-closed:]
+
+    def _close_implied(self, tag):
+        closes, boundary = IMPLIED_END_TAGS[tag]
+        for i in range(len(self._stack) - 1, -1, -1):
+            open_tag = self._stack[i][0]
+            if open_tag in closes:
+                self._close_from(i)
+                return
+            if open_tag in boundary:
+                return
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in DROP_TAGS:
+            self._skip_tag, self._skip_depth = tag, 1
+            return
+        if tag in IMPLIED_END_TAGS:
+            self._close_implied(tag)
+        attr_map = dict(attrs)
+        record = None
+        if tag == 'input' and (attr_map.get('type') or '').lower() == 'hidden':
+            pass
+        elif (tag in INTERACTIVE_TAGS and (tag != 'a' or 'href' in attr_map)) \
+                or attr_map.get('role') in INTERACTIVE_ROLES or 'contenteditable' in attr_map:
+            record = _Record(tag, [(k, v or '') for k, v in attrs if keep_attribute(k)], _TIER_INTERACTIVE,
+                             len(self.records), MAX_TEXT_CHARS)
+        elif tag in HEADING_TAGS:
+            record = _Record(tag, [(k, v or '') for k, v in attrs if keep_attribute(k)], _TIER_HEADING,
+                             len(self.records), MAX_CONTEXT_CHARS)
+        if record is not None:
+            # Placeholder, alt and value describe an element without being worth an attribute
+            for hint in ('placeholder', 'alt', 'value', 'title'):
+                if attr_map.get(hint):
+                    record.add_text(_SPACE_RE.sub(' ', attr_map[hint]).strip())
+            self.records.append(record)
+        if tag not in VOID_TAGS:
+            self._push(tag, record)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if self._stack and self._stack[-1][0] == tag and tag not in VOID_TAGS:
+            self._close_from(len(self._stack) - 1)
+        elif self._skip_tag == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        # Closing an element also closes whatever was left open inside it (</tr> ends an unclosed <th>)
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                self._close_from(i)
+                break
+
+    def handle_data(self, data):
+        if self._skip_tag:
+            return
+        text = _SPACE_RE.sub(' ', data).strip()
+        if not text:
+            return
+        if self._open:
+            for record in self._open:
+                record.add_text(text)
+        elif len(text) > 2:
+            record = _Record(None, [], _TIER_TEXT, len(self.records), MAX_CONTEXT_CHARS)
+            record.add_text(text)
+            self.records.append(record)
+
+def distill_html(html, token_budget=DEFAULT_TOKEN_BUDGET, chunk_size=1 << 16):
+    """Compact, ranked view of a page for the model.
+
+    Streams html (a string or an iterable of string chunks) through HTMLParser,
+    drops script/style/svg and similar subtrees, keeps only whitelisted attributes
+    (id, name, role, type, href, aria-*, data-test*) and fills token_budget with
+    interactive elements first, then headings and labels, then other text. Each
+    section keeps document order. Runs in time linear in the input.
+    """
+    parser = _Distiller()
+    chunks = (html[i:i + chunk_size] for i in range(0, len(html), chunk_size)) if isinstance(html, str) else html
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+
+    selected = []
+    remaining = token_budget
+    for tier in (_TIER_INTERACTIVE, _TIER_HEADING, _TIER_TEXT):
+        for record in parser.records:
+            if record.tier != tier:
+                continue
+            line = record.render()
+            cost = estimate_tokens(line) + 1
+            if cost > remaining:
+                continue
+            remaining -= cost
+            selected.append((tier, record.order, line))
+    selected.sort()
+    return '\n'.join(line for _, _, line in selected)
+
+def regex_optimize(html, limit=15000):
+    """The original optimize_html: strip comments, collapse whitespace, cut at limit"""
+    html = re.sub(r'<!--.*?-->', '', html, flags=re.DOTALL)
+    html = re.sub(r'\s+', ' ', html)
+    return html[:limit]
+
+def _synthetic_page(target_bytes, controls):
+    junk = (
+        '<script>window.__STATE__=' + '{"k":"' + 'x' * 2000 + '"};</script>'
+        '<style>.a{color:red}' + '.b{margin:0}' * 200 + '</style>'
+        '<svg viewBox="0 0 10 10">' + '<path d="M0 0L10 10"/>' * 50 + '</svg>'
+        '<div class="tracking" data-analytics="' + 'y' * 300 + '"><span>Promo</span></div>'
+    )
+    parts = ['<html><head><title>Benchmark page</title></head><body>']
+    size = 0
+    per_control = max(1, target_bytes // max(controls, 1))
+    for i in range(controls):
+        while size < per_control * (i + 1):
+            parts.append(junk)
+            size += len(junk)
+        parts.append(f'<h2>Section {i}</h2><label for="f{i}">Field {i}</label>'
+                     f'<input id="f{i}" name="field{i}" type="text" class="x y z" style="a:b">'
+                     f'<button data-testid="submit-{i}" class="btn btn-primary">Submit {i}</button>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+def benchmark_distiller(target_bytes=2_000_000, controls=200, token_budget=DEFAULT_TOKEN_BUDGET, repeat=3):
+    """Compare regex_optimize and distill_html on a synthetic page full of scripts,
+    styles and SVG. Reports best-of-repeat seconds, output tokens and how many of
+    the page's inputs and buttons survive in each output."""
+    html = _synthetic_page(target_bytes, controls)
+
+    def best_of(fn):
+        timings, output = [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings), output
+
+    # _call_ai_api used to cut the regex output again at 8000 characters
+    regex_seconds, regex_out = best_of(lambda: regex_optimize(html)[:8000])
+    distill_seconds, distill_out = best_of(lambda: distill_html(html, token_budget))
+    return {
+        'input_bytes': len(html),
+        'controls': controls * 2,
+        'regex_seconds': regex_seconds,
+        'regex_tokens': estimate_tokens(regex_out),
+        'regex_controls_kept': regex_out.count('id="f') + regex_out.count('data-testid="submit-'),
+        'distill_seconds': distill_seconds,
+        'distill_tokens': estimate_tokens(distill_out),
+        'distill_controls_kept': distill_out.count('id="f') + distill_out.count('data-testid="submit-'),
+    }
+
+if __name__ == "__main__":
+    for size in (500_000, 2_000_000, 8_000_000):
+        result = benchmark_distiller(target_bytes=size)
+        print(f"{result['input_bytes'] / 1e6:.1f} MB, {result['controls']} controls: "
+              f"regex {result['regex_seconds'] * 1000:.0f} ms, {result['regex_tokens']} tokens, "
+              f"{result['regex_controls_kept']} controls kept | "
+              f"distiller {result['distill_seconds'] * 1000:.0f} ms, {result['distill_tokens']} tokens, "
+              f"{result['distill_controls_kept']} controls kept")
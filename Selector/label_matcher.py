@@ -0,0 +1,89 @@
+import re
+import time
+
+# Labels are matched as whole tokens; '-' and '_' are part of a token so "L-1" never matches in "L-10"
+_TOKEN_RE = re.compile(r"[\w-]+")
+
+def _tokens(text):
+    return [m.group(0) for m in _TOKEN_RE.finditer(text.lower())]
+
+class LabelMatcher:
+    """Token index over a session's labels that finds every label mention in a prompt.
+
+    Built once per set of labels; find() tokenizes the prompt once and looks each
+    token up in a dict, so a call costs O(prompt tokens) regardless of how many
+    labels the session has. Multi-token labels are matched longest first.
+    """
+
+    def __init__(self, elements):
+        self._index = {}
+        self.size = 0
+        for element in elements:
+            label = element['label'].lower()
+            # Most labels ("L-12") are a single token; skip the regex scan for those
+            tokens = (label,) if _TOKEN_RE.fullmatch(label) else tuple(_tokens(label))
+            if not tokens:
+                continue
+            self._index.setdefault(tokens[0], []).append((tokens, element))
+            self.size += 1
+        for candidates in self._index.values():
+            candidates.sort(key=lambda candidate: -len(candidate[0]))
+
+    def find(self, prompt):
+        """Elements mentioned in prompt, in prompt order (repeated mentions repeat)"""
+        tokens = _tokens(prompt)
+        matches = []
+        i = 0
+        while i < len(tokens):
+            for label_tokens, element in self._index.get(tokens[i], ()):
+                if tuple(tokens[i:i + len(label_tokens)]) == label_tokens:
+                    matches.append(element)
+                    i += len(label_tokens)
+                    break
+            else:
+                i += 1
+        return matches
+
+def _substring_matches(prompt, elements):
+    # The original process_actions_with_labels test, kept for the benchmark
+    return [elem for elem in elements if elem['label'].lower() in prompt.lower()]
+
+def benchmark_label_matcher(label_count=20000, mentions=5, repeat=5):
+    """Time the substring loop against LabelMatcher on a session of label_count labels.
+
+    Returns best-of-repeat seconds per prompt for both, the one-off build time and
+    how many elements each path matched for a prompt naming `mentions` labels.
+    """
+    elements = [{'label': f"L-{i}", 'selector': f"#e{i}", 'element_type': 'button'}
+                for i in range(1, label_count + 1)]
+    named = [f"L-{1 + i * (label_count // mentions)}" for i in range(mentions)]
+    prompt = "Open the page, then " + ", then ".join(f"click {label}" for label in named) + " and wait"
+
+    def best_of(fn):
+        timings, result = [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    loop_seconds, loop_result = best_of(lambda: _substring_matches(prompt, elements))
+    build_seconds, matcher = best_of(lambda: LabelMatcher(elements))
+    match_seconds, match_result = best_of(lambda: matcher.find(prompt))
+    return {
+        'labels': label_count,
+        'mentions': mentions,
+        'loop_seconds': loop_seconds,
+        'loop_matches': len(loop_result),
+        'build_seconds': build_seconds,
+        'matcher_seconds': match_seconds,
+        'matcher_matches': len(match_result),
+    }
+
+if __name__ == "__main__":
+    for count in (1000, 20000, 100000):
+        result = benchmark_label_matcher(label_count=count)
+        print(f"{result['labels']:>6} labels, {result['mentions']} mentioned: "
+              f"loop {result['loop_seconds'] * 1000:.2f} ms ({result['loop_matches']} matches), "
+              f"matcher {result['matcher_seconds'] * 1000:.3f} ms ({result['matcher_matches']} matches), "
+              f"build {result['build_seconds'] * 1000:.1f} ms")
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_POOL_SIZE = 16
+
+DEFAULT_HEADERS = {
+    "Content-Type": "application/json",
+    "HTTP-Referer": "https://github.com/Khushboo-Verma2004/AI-Project",
+    "X-Title": "Web Automation Assistant"
+}
+
+class ChatClient:
+    """Keep-alive client for an OpenAI-compatible chat-completions endpoint.
+
+    One requests.Session with a pooled adapter is shared by all calls, so retries
+    and concurrent prompts reuse TCP/TLS connections; up to pool_size requests
+    can be in flight at once. Event loops use get_actions_async, which runs the
+    whole get_actions call (cache, scheduling, fallbacks) on a worker thread.
+    """
+
+    def __init__(self, base_url=None, api_key=None, timeout=45, pool_size=DEFAULT_POOL_SIZE, headers=None):
+        self.base_url = (base_url or os.getenv("OPENROUTER_BASE_URL") or DEFAULT_BASE_URL).rstrip('/')
+        self.api_key = api_key if api_key is not None else os.getenv("OPENROUTER_API_KEY")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+        if self.api_key:
+            self.session.headers["Authorization"] = f"Bearer {self.api_key}"
+
+    @property
+    def completions_url(self):
+        return f"{self.base_url}/chat/completions"
+
+    def post(self, payload, stream=False, timeout=None):
+        """POST a chat-completions payload; raises requests exceptions on HTTP errors"""
+        response = self.session.post(self.completions_url, json=payload, stream=stream,
+                                     timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response
+
+    def complete(self, payload, timeout=None):
+        return self.post(payload, timeout=timeout).json()
+
+    def stream(self, payload, timeout=None):
+        """Yield content deltas of a streamed completion as server-sent events arrive"""
+        response = self.post(dict(payload, stream=True), stream=True, timeout=timeout)
+        # Server-sent events are always UTF-8; without a charset requests would decode them as Latin-1
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; lines starting with ':' are keep-alive comments
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if chunk.get('error'):
+                    raise requests.exceptions.HTTPError(f"Stream error: {chunk['error']}")
+                choices = chunk.get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield content
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client(**kwargs):
+    """Process-wide shared ChatClient, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ChatClient(**kwargs)
+        return _client
+
+def set_client(client):
+    """Swap the shared client, e.g. for one pointed at a local stand-in server"""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None and previous is not client:
+        previous.close()
+    return client
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+class OverlayCache:
+    """Size-bounded on-disk LRU of rendered label overlays.
+
+    An entry is one primary file <key><suffix> plus any sibling files sharing the
+    <key>. prefix (the tiles of a labeled manifest). Recency survives restarts via
+    file mtimes, which are bumped on every hit.
+    """
+
+    def __init__(self, root_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (primary path, bytes)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _load(self):
+        groups = {}
+        for path in self.root_dir.iterdir():
+            if path.name.startswith('.'):
+                # Leftover temp file from an interrupted render
+                path.unlink(missing_ok=True)
+                continue
+            key = path.name.split('.', 1)[0]
+            stat = path.stat()
+            size, mtime, primary = groups.get(key, (0, 0, None))
+            if path.name.count('.') == 1 or path.name.endswith('.tiles.json'):
+                primary = str(path)
+            groups[key] = (size + stat.st_size, max(mtime, stat.st_mtime), primary)
+        for key, (size, _, primary) in sorted(groups.items(), key=lambda item: item[1][1]):
+            if primary:
+                self._entries[key] = (primary, size)
+            else:
+                self._remove_files(key)
+        self._evict()
+
+    def _files(self, key):
+        return list(self.root_dir.glob(f"{key}.*"))
+
+    def _remove_files(self, key):
+        for path in self._files(key):
+            try:
+                path.unlink()
+            except OSError as e:
+                logging.warning(f"Failed to remove cached overlay {path}: {str(e)}")
+
+    @property
+    def total_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def _evict(self):
+        # Called with the lock held; always keeps the newest entry even if oversized
+        total = self.total_bytes
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, (_, size) = self._entries.popitem(last=False)
+            self._remove_files(key)
+            total -= size
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not os.path.exists(entry[0]):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(entry[0])
+        except OSError:
+            pass
+        return entry[0]
+
+    def get_or_render(self, key, suffix, render):
+        """Return the cached file for key, calling render(tmp_path, sibling_prefix) on a miss.
+
+        render writes the primary file to tmp_path (which ends in suffix) and may write
+        extra files named <sibling_prefix><anything>; tmp_path is moved into place last
+        so readers never see a partial entry.
+        """
+        path = self.get(key)
+        if path:
+            return path
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            path = self.get(key)
+            if path:
+                return path
+            final_path = self.root_dir / f"{key}{suffix}"
+            tmp_path = self.root_dir / f".{key}.{uuid.uuid4().hex}{suffix}"
+            try:
+                render(str(tmp_path), str(self.root_dir / f"{key}."))
+                os.replace(tmp_path, final_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+            size = sum(p.stat().st_size for p in self._files(key))
+            with self._lock:
+                self._entries[key] = (str(final_path), size)
+                self._evict()
+                self._key_locks.pop(key, None)
+        return str(final_path)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove_files(key)
+            self._entries.clear()
+
+    def info(self):
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'bytes': self.total_bytes, 'max_bytes': self.max_bytes
+            }
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import os
+import uuid
+from pathlib import Path
+
+# Tiled captures are stored as a JSON manifest listing one PNG per tile
+TILES_SUFFIX = '.tiles.json'
+
+# Labeled companions may be written in any of the encoder's formats
+LABELED_EXTENSIONS = ('.png', '.webp', '.jpg')
+
+def is_tile_manifest(path):
+    return str(path).endswith(TILES_SUFFIX)
+
+class ScreenshotStore:
+    """Content-addressed screenshot files: identical captures share one file.
+
+    Files live at <root>/<first two hex chars>/<sha256><suffix>. Reference counting
+    is done against the elements table by ElementStore; this class only deals with
+    the files themselves.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def path_for(self, digest, suffix='.png'):
+        return self.root_dir / digest[:2] / f"{digest}{suffix}"
+
+    def put_bytes(self, data, suffix='.png'):
+        """Store data unless an identical file exists; returns (path, digest, was_new)"""
+        digest = self.digest(data)
+        path = self.path_for(digest, suffix)
+        if path.exists():
+            return str(path), digest, False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp name first so readers never see a half-written file
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return str(path), digest, True
+
+    def put_file(self, source_path):
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        return self.put_bytes(data, Path(source_path).suffix or '.png')
+
+    def contains(self, path):
+        try:
+            Path(path).resolve().relative_to(self.root_dir.resolve())
+            return True
+        except ValueError:
+            return False
+
+    @staticmethod
+    def labeled_path(path, extension='.png'):
+        """Companion path of the labeled rendering of a screenshot or tile manifest"""
+        path = str(path)
+        if is_tile_manifest(path):
+            return path[:-len(TILES_SUFFIX)] + "_labeled" + TILES_SUFFIX
+        return os.path.splitext(path)[0] + "_labeled" + extension
+
+    @staticmethod
+    def raw_path(labeled_path):
+        head, _, tail = str(labeled_path).rpartition("_labeled")
+        return head + tail if head else str(labeled_path)
+
+    @staticmethod
+    def read_manifest(path):
+        with open(path) as f:
+            return json.load(f)
+
+    def manifest_parts(self, path):
+        """Tile paths a manifest depends on; empty for plain screenshots or unreadable manifests"""
+        if not is_tile_manifest(path):
+            return []
+        try:
+            return [tile['path'] for tile in self.read_manifest(path)['tiles']]
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not read tile manifest {path}: {str(e)}")
+            return []
+
+    def remove(self, path):
+        """Delete a stored screenshot and its labeled companion; returns bytes freed.
+
+        Tiles of a manifest are collected separately since other manifests may share them.
+        """
+        freed = 0
+        candidates = [path] + list(dict.fromkeys(self.labeled_path(path, ext) for ext in LABELED_EXTENSIONS))
+        for candidate in candidates:
+            try:
+                freed += os.path.getsize(candidate)
+                os.remove(candidate)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logging.warning(f"Failed to remove screenshot {candidate}: {str(e)}")
+        return freed
@@ -3,22 +3,63 @@ import os
 import json
 import re
 import time
+import asyncio
+import heapq
+import itertools
+import threading
+from collections import Counter
+from contextlib import closing
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from dotenv import load_dotenv
-from functools import lru_cache
+from Selector.action_cache import ActionCache, cache_key
+from Selector.html_distiller import distill_html, estimate_tokens, DEFAULT_TOKEN_BUDGET
+from Selector.llm_client import get_client
+from Selector.backends import OpenRouterBackend, get_backend, register_backend
 
 load_dotenv()
 
 # Configuration
 API_KEY = os.getenv("OPENROUTER_API_KEY")
+# Point at a local stand-in server in tests; defaults to OpenRouter
+BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 MODEL_FALLBACK_CHAIN = [
     "google/gemini-2.0-flash-exp:free",
     "anthropic/claude-3-haiku:free",
     "google/gemini-pro:free"
 ]
 MAX_RETRIES = 3
+# 429 responses wait on the scheduler instead of the retry ladder, up to this many times
+MAX_RATE_LIMIT_RETRIES = 5
 REQUEST_TIMEOUT = 45
 DEBUG_LOG = "ai_debug.log"
+HTML_TOKEN_BUDGET = int(os.getenv("HTML_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+ACTION_CACHE_PATH = os.getenv("ACTION_CACHE_PATH", os.path.join("data", "action_cache.db"))
+ACTION_CACHE_TTL = int(os.getenv("ACTION_CACHE_TTL", 7 * 24 * 3600))
+ACTION_CACHE_MAX_ENTRIES = int(os.getenv("ACTION_CACHE_MAX_ENTRIES", 1000))
+# Seconds to wait on a model before also asking the next one; unset disables hedging
+HEDGE_AFTER = float(os.getenv("HEDGE_AFTER")) if os.getenv("HEDGE_AFTER") else None
+
+# Which model answered first in hedged calls
+HEDGE_WINS = Counter()
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+# Per-model quotas: requests and tokens (prompt + completion) per minute
+DEFAULT_RATE_LIMIT = {"rpm": 20, "tpm": 100000}
+MODEL_RATE_LIMITS = {
+    "google/gemini-2.0-flash-exp:free": {"rpm": 10, "tpm": 100000},
+}
+
+_action_cache = None
+
+def get_action_cache():
+    """Shared persistent cache of get_actions results, created on first use"""
+    global _action_cache
+    if _action_cache is None:
+        os.makedirs(os.path.dirname(ACTION_CACHE_PATH) or ".", exist_ok=True)
+        _action_cache = ActionCache(ACTION_CACHE_PATH, ACTION_CACHE_TTL, ACTION_CACHE_MAX_ENTRIES)
+    return _action_cache
 
 def log_debug(message):
     """Enhanced logging with timestamps"""
@@ -28,8 +69,137 @@ def log_debug(message):
         f.write(log_entry + "\n")
     print(log_entry)
 
-@lru_cache(maxsize=100)
-def get_actions(html, prompt, model_name=None):
+class TokenBucket:
+    """Refills continuously at capacity per minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available (0 if it is now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+class RateLimitScheduler:
+    """Process-wide admission control for remote model calls.
+
+    Each model has a requests/min and a tokens/min bucket. Callers queue per model
+    by (priority, arrival); lower priority numbers go first. Only the head of a
+    model's queue may take from its buckets, so a big request can't be starved by
+    small ones. A 429 with Retry-After blocks the model for that long.
+    """
+
+    def __init__(self, limits=None, default_limit=None):
+        self.limits = limits if limits is not None else MODEL_RATE_LIMITS
+        self.default_limit = default_limit or DEFAULT_RATE_LIMIT
+        self._cond = threading.Condition()
+        self._models = {}
+        self._seq = itertools.count()
+        self.stats = Counter()
+
+    def _state(self, model):
+        state = self._models.get(model)
+        if state is None:
+            limit = self.limits.get(model, self.default_limit)
+            state = self._models[model] = {
+                'requests': TokenBucket(limit['rpm']),
+                'tokens': TokenBucket(limit['tpm']),
+                'queue': [],
+                'blocked_until': 0.0,
+            }
+        return state
+
+    def acquire(self, model, tokens, priority=0, cancel=None):
+        """Block until model has room for one request of tokens; returns seconds waited.
+
+        Returns None without taking anything if cancel (a threading.Event) is set.
+        """
+        start = time.monotonic()
+        with self._cond:
+            state = self._state(model)
+            entry = (priority, next(self._seq))
+            heapq.heappush(state['queue'], entry)
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    now = time.monotonic()
+                    wait = None
+                    if state['queue'][0] == entry:
+                        wait = max(
+                            state['blocked_until'] - now,
+                            state['requests'].wait_time(1, now),
+                            state['tokens'].wait_time(tokens, now),
+                        )
+                        if wait <= 0:
+                            state['requests'].take(1)
+                            state['tokens'].take(tokens)
+                            waited = now - start
+                            self.stats['granted'] += 1
+                            self.stats['waited_seconds'] += waited
+                            return waited
+                    # Wake periodically so a cancel is noticed even without notify
+                    self._cond.wait(min(wait, 1.0) if wait is not None else 1.0)
+            finally:
+                state['queue'].remove(entry)
+                heapq.heapify(state['queue'])
+                self._cond.notify_all()
+
+    def record_usage(self, model, reserved, actual):
+        """Return over-reserved tokens (or charge the shortfall) once usage is known"""
+        with self._cond:
+            bucket = self._state(model)['tokens']
+            if actual < reserved:
+                bucket.give(reserved - actual)
+            else:
+                bucket.take(actual - reserved)
+            self._cond.notify_all()
+
+    def penalize(self, model, retry_after):
+        """Stop admitting calls to model for retry_after seconds"""
+        with self._cond:
+            state = self._state(model)
+            state['blocked_until'] = max(state['blocked_until'], time.monotonic() + retry_after)
+            # The server's view of the window is exhausted; don't burst when it reopens
+            state['requests'].level = 0.0
+            self.stats['throttled'] += 1
+            self._cond.notify_all()
+
+SCHEDULER = RateLimitScheduler()
+
+def _retry_after_seconds(response, default=10.0):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+def _payload_tokens(payload):
+    prompt_tokens = sum(estimate_tokens(m.get("content") or "") + 4 for m in payload["messages"])
+    return prompt_tokens, prompt_tokens + payload.get("max_tokens", 0)
+
+def get_actions(html, prompt, model_name=None, use_cache=True, hedge_after=HEDGE_AFTER, backend=None, priority=0):
     """
     Enhanced AI action generator with fallback and retry mechanisms
     
@@ -37,6 +207,14 @@ def get_actions(html, prompt, model_name=None):
         html (str): Page HTML content (automatically optimized)
         prompt (str): User instruction for automation
         model_name (str): Optional specific model to use
+        use_cache (bool): Reuse results persisted in the action cache
+        hedge_after (float): If set, fire the next model in the chain whenever the
+            running ones haven't answered within this many seconds and take the
+            first valid action list
+        backend (str): Registered backend name, e.g. "llama_cpp" for the local
+            model (default: ACTION_BACKEND env var, else "openrouter")
+        priority (int): Queue position against other callers waiting on the same
+            model's rate limit; lower goes first
         
     Returns:
         dict: {
@@ -51,9 +229,29 @@ def get_actions(html, prompt, model_name=None):
     """
     # Optimize HTML input
     processed_html = optimize_html(html)
-    
-    # Model selection logic
-    models_to_try = [model_name] if model_name else MODEL_FALLBACK_CHAIN
+    models_to_try = _models_for(get_backend(backend), model_name)
+
+    key = cache_key(processed_html, prompt, ",".join(models_to_try))
+    if use_cache:
+        cached = get_action_cache().get(key)
+        if cached is not None:
+            log_debug(f"Action cache hit for {key[:12]}")
+            cached["cache_hit"] = True
+            return cached
+
+    if hedge_after is not None and len(models_to_try) > 1:
+        start_time = time.time()
+        result = _get_actions_hedged(processed_html, prompt, models_to_try, hedge_after, backend, priority)
+        if result:
+            result["performance"] = {
+                "response_time": time.time() - start_time,
+                "token_usage": _count_tokens(processed_html + prompt)
+            }
+            if use_cache:
+                get_action_cache().put(key, result, result["model_used"])
+            return result
+        log_debug("All hedged model attempts failed")
+        return {"actions": [], "error": "All model attempts failed"}
     
     for attempt, current_model in enumerate(models_to_try, 1):
         try:
@@ -63,7 +261,9 @@ def get_actions(html, prompt, model_name=None):
                 model=current_model,
                 html=processed_html,
                 prompt=prompt,
-                attempt=attempt
+                attempt=attempt,
+                backend=backend,
+                priority=priority
             )
             
             if result:
@@ -72,6 +272,8 @@ def get_actions(html, prompt, model_name=None):
                     "response_time": time.time() - start_time,
                     "token_usage": _count_tokens(processed_html + prompt)
                 }
+                if use_cache and result.get("actions"):
+                    get_action_cache().put(key, result, current_model)
                 return result
                 
         except Exception as e:
@@ -82,25 +284,188 @@ def get_actions(html, prompt, model_name=None):
     log_debug("All model attempts failed")
     return {"actions": [], "error": "All model attempts failed"}
 
+def _models_for(backend, model_name=None):
+    # Local backends run their own model, so there is no chain to fall back along
+    if not backend.remote:
+        return [backend.model_name]
+    return [model_name] if model_name else MODEL_FALLBACK_CHAIN
+
+def _get_actions_hedged(processed_html, prompt, models, hedge_after, backend=None, priority=0):
+    """Race the fallback chain: start the next model every hedge_after seconds (or as
+    soon as a running one fails), return the first valid result and cancel the rest."""
+    cancel = threading.Event()
+    pending = {}
+    launched = []
+    next_index = 0
+
+    def launch():
+        nonlocal next_index
+        model = models[next_index]
+        next_index += 1
+        launched.append(model)
+        if len(launched) > 1:
+            log_debug(f"Hedging: starting {model} alongside {launched[:-1]}")
+        future = _hedge_executor.submit(_call_ai_api, model, processed_html, prompt, next_index, cancel,
+                                        backend, priority)
+        pending[future] = model
+
+    launch()
+    try:
+        while pending:
+            timeout = hedge_after if next_index < len(models) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            failed = False
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    log_debug(f"Hedged call to {model} failed: {str(e)}")
+                    failed = True
+                    continue
+                if result and result.get("actions"):
+                    HEDGE_WINS[model] += 1
+                    result["model_used"] = model
+                    result["hedge"] = {"launched": launched, "winner": model}
+                    log_debug(f"Hedged call won by {model} (launched: {', '.join(launched)})")
+                    return result
+                failed = True
+            # Timed out, or a call finished without actions: bring in the next model
+            if next_index < len(models) and (not done or failed):
+                launch()
+        return None
+    finally:
+        # In-flight HTTP calls can't be interrupted, but they stop retrying and are ignored
+        cancel.set()
+        for future in pending:
+            future.cancel()
+
+def get_actions_batch(html, prompts, model_name=None, use_cache=True, backend=None, priority=0):
+    """
+    Generate actions for several prompts against the same page in one request.
+
+    The distilled page is sent once with the prompts as numbered tasks, and the
+    response is split back into one result per prompt (same shape as get_actions,
+    plus "batched": True). Prompts already in the action cache are not sent.
+    Backends with complete_batch (the local model) instead get one payload per
+    prompt in a single locked run, page first so the prompt cache evaluates the
+    shared page once.
+    Prompts whose entry is missing or invalid in the batched response, or all of
+    them if every model fails, fall back to individual get_actions calls.
+
+    Returns:
+        list: one result dict per prompt, in order
+    """
+    prompts = list(prompts)
+    processed_html = optimize_html(html)
+    backend_impl = get_backend(backend)
+    models_to_try = _models_for(backend_impl, model_name)
+    chain_key = ",".join(models_to_try)
+    results = [None] * len(prompts)
+    keys = [cache_key(processed_html, prompt, chain_key) for prompt in prompts]
+
+    if use_cache:
+        for i, key in enumerate(keys):
+            cached = get_action_cache().get(key)
+            if cached is not None:
+                cached["cache_hit"] = True
+                results[i] = cached
+    todo = [i for i, result in enumerate(results) if result is None]
+
+    if len(todo) > 1 and hasattr(backend_impl, "complete_batch"):
+        current_model = models_to_try[0]
+        start_time = time.time()
+        responses = backend_impl.complete_batch(
+            [_build_payload(current_model, processed_html, prompts[i], page_first=True) for i in todo]
+        )
+        elapsed = time.time() - start_time
+        for i, response in zip(todo, responses):
+            if response is None:
+                continue
+            try:
+                content = _extract_json_content(response)
+                _has_actions(content)
+            except (KeyError, IndexError, AttributeError, ValueError) as e:
+                log_debug(f"Batched local answer for prompt {i + 1} rejected: {str(e)}")
+                continue
+            content["model_used"] = current_model
+            content["batched"] = True
+            content["performance"] = {
+                "response_time": elapsed,
+                "token_usage": _count_tokens(processed_html + prompts[i]),
+                "batch_size": len(todo)
+            }
+            results[i] = content
+            if use_cache:
+                get_action_cache().put(keys[i], content, current_model)
+        log_debug(f"Batched {len(todo)} prompts on {current_model}: "
+                  f"{sum(results[i] is not None for i in todo)} valid in {elapsed:.2f}s")
+    elif len(todo) > 1:
+        batch_prompts = [prompts[i] for i in todo]
+
+        def validate(content):
+            if not isinstance(content.get("results"), list):
+                raise ValueError("No results array in batched response")
+
+        for attempt, current_model in enumerate(models_to_try, 1):
+            start_time = time.time()
+            try:
+                content = _call_ai_api(
+                    current_model, processed_html, None, attempt, backend=backend, priority=priority,
+                    payload=_build_batch_payload(current_model, processed_html, batch_prompts),
+                    validate=validate
+                )
+            except Exception as e:
+                log_debug(f"Batched attempt {attempt} with {current_model} failed: {str(e)}")
+                continue
+            if not content:
+                continue
+            by_index = {}
+            for entry in content["results"]:
+                if isinstance(entry, dict) and isinstance(entry.get("index"), int):
+                    by_index.setdefault(entry["index"], entry)
+            elapsed = time.time() - start_time
+            for task_number, i in enumerate(todo, 1):
+                entry = by_index.get(task_number)
+                if not entry or not isinstance(entry.get("actions"), list) or not entry["actions"]:
+                    continue
+                result = {k: v for k, v in entry.items() if k != "index"}
+                result["model_used"] = current_model
+                result["batched"] = True
+                result["performance"] = {
+                    "response_time": elapsed,
+                    "token_usage": _count_tokens(processed_html + prompts[i]),
+                    "batch_size": len(todo)
+                }
+                results[i] = result
+                if use_cache:
+                    get_action_cache().put(keys[i], result, current_model)
+            log_debug(f"Batched {len(todo)} prompts with {current_model}: "
+                      f"{sum(results[i] is not None for i in todo)} valid in {elapsed:.2f}s")
+            break
+
+    for i in todo:
+        if results[i] is None:
+            if len(todo) > 1:
+                log_debug(f"Falling back to an individual call for prompt {i + 1}")
+            results[i] = get_actions(html, prompts[i], model_name, use_cache=use_cache,
+                                     backend=backend, priority=priority)
+    return results
+
+async def get_actions_async(html, prompt, model_name=None, **kwargs):
+    """get_actions for event loops; many prompts can be awaited concurrently"""
+    return await asyncio.to_thread(get_actions, html, prompt, model_name, **kwargs)
+
+def _client():
+    return get_client(base_url=BASE_URL, api_key=API_KEY, timeout=REQUEST_TIMEOUT)
+
+register_backend(OpenRouterBackend.name, lambda: OpenRouterBackend(_client))
+
 def _count_tokens(text):
-    """Simple token counting approximation"""
-    return len(text) // 4  # Rough estimate of 1 token per 4 characters
-
-def _call_ai_api(model, html, prompt, attempt):
-    """Internal API call handler with enhanced error handling"""
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://github.com/Khushboo-Verma2004/AI-Project",
-        "X-Title": "Web Automation Assistant" 
-    }
+    """BPE-like token estimate (see html_distiller.estimate_tokens)"""
+    return estimate_tokens(text)
 
-    payload = {
-        "model": model,
-        "messages": [
-            {
-                "role": "system",
-                "content": """You are a senior web automation engineer. Analyze the HTML and provide:
+SYSTEM_PROMPT = """You are a senior web automation engineer. Analyze the HTML and provide:
 1. Reliable Playwright actions
 2. Robust selectors (prioritize data-testid, aria-label, id)
 3. Required verification points
@@ -111,14 +476,36 @@ Response MUST be valid JSON with:
 - search_results_selector?: string  
 - verification_selectors?: string[]
 - error_handling?: {selector, expected_text}[]"""
+
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + """
+
+Several numbered tasks are given for the same page. Response MUST be valid JSON with:
+- results: Array with one entry per task, {index, actions, search_results_selector?,
+  verification_selectors?, error_handling?}, where index is the task number"""
+
+PAGE_CONTENT_NOTE = """Interactive elements first, then headings and page text; only id, name, role, type,
+href, aria-* and data-test* attributes are kept."""
+
+def _build_payload(model, html, prompt, page_first=False):
+    # page_first puts the task after the page, so payloads for one page share a cacheable prefix
+    task = f"""## Task Instructions
+{prompt}"""
+    page = f"""## Page Content (Simplified)
+{PAGE_CONTENT_NOTE}
+{html}"""
+    sections = (page, task) if page_first else (task, page)
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": SYSTEM_PROMPT
             },
             {
                 "role": "user",
-                "content": f"""## Task Instructions
-{prompt}
+                "content": f"""{sections[0]}
 
-## Page Content (Simplified)
-{html[:8000]}... [truncated to conserve tokens]
+{sections[1]}
 
 ## Response Requirements
 - Selectors must work with Playwright
@@ -132,40 +519,266 @@ Response MUST be valid JSON with:
         "max_tokens": 2000
     }
 
-    for retry in range(MAX_RETRIES):
+def _build_batch_payload(model, html, prompts):
+    tasks = "\n".join(f"{i}. {prompt}" for i, prompt in enumerate(prompts, 1))
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+            {
+                "role": "user",
+                "content": f"""## Tasks
+{tasks}
+
+## Page Content (Simplified)
+{PAGE_CONTENT_NOTE}
+{html}
+
+## Response Requirements
+- One results entry per task, in task order, each with its own complete action list
+- Selectors must work with Playwright
+- Include all necessary waits"""
+            }
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.3,
+        "max_tokens": min(2000 * len(prompts), 8000)
+    }
+
+def _has_actions(content):
+    if not content.get("actions"):
+        raise ValueError("No actions in response")
+
+def _call_ai_api(model, html, prompt, attempt, cancel=None, backend=None, priority=0,
+                 payload=None, validate=_has_actions):
+    """Internal API call handler with enhanced error handling.
+
+    cancel is an optional threading.Event; once set no further retries are made.
+    backend names the registered backend that answers the payload. Remote calls
+    first wait for the model's rate limits in SCHEDULER. payload overrides the
+    single-prompt payload and validate(content) raises ValueError on a bad answer.
+    """
+    payload = payload or _build_payload(model, html, prompt)
+    backend_impl = get_backend(backend)
+    prompt_tokens, reserved = _payload_tokens(payload)
+    rate_limited = 0
+    retry = 0
+
+    while retry < MAX_RETRIES:
+        if cancel is not None and cancel.is_set():
+            return None
         try:
-            response = requests.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=REQUEST_TIMEOUT
-            )
-            
-            response.raise_for_status()
-            response_data = response.json()
+            if backend_impl.remote:
+                waited = SCHEDULER.acquire(model, reserved, priority, cancel)
+                if waited is None:
+                    return None
+                if waited > 0.5:
+                    log_debug(f"Waited {waited:.1f}s for {model} rate limit")
+            # Pooled keep-alive session: retries reuse the connection
+            try:
+                response_data = backend_impl.complete(payload)
+            except Exception:
+                if backend_impl.remote:
+                    # Nothing was generated; hand the reservation back
+                    SCHEDULER.record_usage(model, reserved, 0)
+                raise
+            if backend_impl.remote:
+                usage = response_data.get("usage") or {}
+                actual = usage.get("total_tokens") or (
+                    (usage.get("prompt_tokens") or prompt_tokens) + (usage.get("completion_tokens") or 0)
+                )
+                SCHEDULER.record_usage(model, reserved, actual)
             
             # Validate response structure
             content = _extract_json_content(response_data)
-            if not content.get("actions"):
-                raise ValueError("No actions in response")
+            validate(content)
                 
             # Add model metadata
             content["_metadata"] = {
                 "model": model,
                 "attempt": attempt,
-                "retries": retry
+                "retries": retry,
+                "rate_limited": rate_limited
             }
             
             return content
             
         except requests.exceptions.RequestException as e:
-            if retry < MAX_RETRIES - 1:
-                wait_time = (retry + 1) * 5
-                log_debug(f"Retry {retry + 1} in {wait_time}s...")
-                time.sleep(wait_time)
+            response = getattr(e, "response", None)
+            if response is not None and response.status_code == 429 and rate_limited < MAX_RATE_LIMIT_RETRIES:
+                rate_limited += 1
+                retry_after = _retry_after_seconds(response)
+                log_debug(f"{model} rate limited, retrying after {retry_after:.1f}s")
+                SCHEDULER.penalize(model, retry_after)
+                continue
+            retry += 1
+            if retry < MAX_RETRIES:
+                wait_time = retry * 5
+                log_debug(f"Retry {retry} in {wait_time}s...")
+                if cancel is not None:
+                    cancel.wait(wait_time)
+                else:
+                    time.sleep(wait_time)
                 continue
             raise
 
+def stream_actions(html, prompt, model_name=None, use_cache=True, backend=None, priority=0):
+    """
+    Generate actions with a streamed completion, yielding each action dict as soon
+    as its JSON object is complete, so callers can start executing the first steps
+    while the model is still writing the rest.
+
+    Models in the fallback chain are tried in turn until one yields an action; a
+    stream that breaks after actions were yielded is not retried. The complete
+    result is stored in the action cache.
+    """
+    processed_html = optimize_html(html)
+    backend_impl = get_backend(backend)
+    models_to_try = _models_for(backend_impl, model_name)
+    key = cache_key(processed_html, prompt, ",".join(models_to_try))
+    if use_cache:
+        cached = get_action_cache().get(key)
+        if cached is not None:
+            log_debug(f"Action cache hit for {key[:12]}")
+            yield from cached.get("actions", [])
+            return
+
+    for current_model in models_to_try:
+        payload = _build_payload(current_model, processed_html, prompt)
+        prompt_tokens, reserved = _payload_tokens(payload)
+        rate_limited = 0
+        while True:
+            start_time = time.time()
+            parser = IncrementalActionParser()
+            actions = []
+            acquired = False
+            try:
+                if backend_impl.remote:
+                    SCHEDULER.acquire(current_model, reserved, priority)
+                    acquired = True
+                # Closing the stream releases it (and a local model's lock) if our caller stops early
+                with closing(backend_impl.stream(payload)) as deltas:
+                    for delta in deltas:
+                        for action in parser.feed(delta):
+                            if not actions:
+                                log_debug(f"First action from {current_model} after {time.time() - start_time:.2f}s")
+                            actions.append(action)
+                            yield action
+                if not actions:
+                    # No incremental match (e.g. a fenced code block): parse the full text
+                    content = _extract_json_content({"choices": [{"message": {"content": parser.text}}]})
+                    for action in content.get("actions", []):
+                        actions.append(action)
+                        yield action
+            except (requests.exceptions.RequestException, ValueError) as e:
+                response = getattr(e, "response", None)
+                if response is not None and response.status_code == 429 and not actions \
+                        and rate_limited < MAX_RATE_LIMIT_RETRIES:
+                    rate_limited += 1
+                    retry_after = _retry_after_seconds(response)
+                    log_debug(f"{current_model} rate limited, retrying after {retry_after:.1f}s")
+                    SCHEDULER.penalize(current_model, retry_after)
+                    continue
+                log_debug(f"Streaming from {current_model} failed: {str(e)}")
+                if actions:
+                    raise
+                break
+            finally:
+                if acquired:
+                    # Streams carry no usage block; charge what was actually generated, or refund it all
+                    text = parser.text
+                    SCHEDULER.record_usage(current_model, reserved,
+                                           prompt_tokens + estimate_tokens(text) if text else 0)
+            if actions:
+                log_debug(f"Streamed {len(actions)} actions from {current_model} in {time.time() - start_time:.2f}s")
+                if use_cache:
+                    get_action_cache().put(key, {"actions": actions, "model_used": current_model}, current_model)
+                return
+            break
+    log_debug("All streaming model attempts failed")
+
+class IncrementalActionParser:
+    """Pull complete objects out of the "actions" array of a JSON document as it streams in.
+
+    feed() returns the actions whose closing brace arrived in that chunk. Chunks are
+    kept in a list and only the unscanned tail (plus the action being read) is
+    buffered, so total work is linear in the response length. text joins
+    everything fed so far.
+    """
+
+    _ACTIONS_KEY = re.compile(r'"actions"\s*:\s*\[')
+    # Enough of the previous chunk to find the key when it is split across chunks
+    _KEY_OVERLAP = 16
+
+    def __init__(self):
+        self._chunks = []
+        self._tail = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._object_start = None
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def text(self):
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        actions = []
+        if self._done:
+            return actions
+        text = self._tail + chunk
+        i = self._pos
+        if not self._in_array:
+            match = self._ACTIONS_KEY.search(text)
+            if not match:
+                self._tail = text[-self._KEY_OVERLAP:]
+                self._pos = 0
+                return actions
+            self._in_array = True
+            i = match.end()
+        while i < len(text):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._object_start = i
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # Closing bracket of the actions array itself
+                    self._done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    try:
+                        actions.append(json.loads(text[self._object_start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        log_debug(f"Skipping malformed streamed action: {str(e)}")
+                    self._object_start = None
+            i += 1
+        # Drop what has been scanned, keeping the start of an unfinished action
+        keep = i if self._object_start is None else self._object_start
+        self._tail = "" if self._done else text[keep:]
+        self._pos = i - keep
+        if self._object_start is not None:
+            self._object_start = 0
+        return actions
+
 def _extract_json_content(response_data):
     """Robust JSON extraction from various response formats"""
     content = response_data["choices"][0]["message"]["content"]
@@ -181,9 +794,6 @@ def _extract_json_content(response_data):
         # Fallback to text extraction
         return {"actions": [], "error": "Invalid JSON response"}
 
-def optimize_html(html):
-    """Reduce HTML size while preserving structure"""
-    # Remove excessive whitespace and comments
-    html = re.sub(r'<!--.*?-->', '', html, flags=re.DOTALL)
-    html = re.sub(r'\s+', ' ', html)
-    return html[:15000]  # Limit size
\ No newline at end of file
+def optimize_html(html, token_budget=None):
+    """Distill the page to its interactive elements and key text within a token budget"""
+    return distill_html(html, token_budget or HTML_TOKEN_BUDGET)
\ No newline at end of file
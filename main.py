@@ -1,150 +1,70 @@
 import subprocess
-import os
 import json
-from playwright.sync_api import sync_playwright
 from Selector.element_labeler import ElementLabeler
 from Selector.selector import get_actions
+from utils.browser_pool import get_browser_pool
+from Selector.label_matcher import LabelMatcher
+from utils.action_executor import execute_actions, summarize_results
+from utils.test_spec import write_test_spec
+from utils.suite_runner import run_suite
 
 MODEL_NAME = "google/gemini-2.0-flash-exp:free"
 LABELER = ElementLabeler(storage_dir="data")
 
-def fetch_html(url):
+def fetch_html(url, browser_pool=None):
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
+        pool = browser_pool or get_browser_pool(headless=True)
+        with pool.page() as page:
             page.goto(url, wait_until="domcontentloaded", timeout=60000)
-            html = page.content()
-            browser.close()
-            return html
+            return page.content()
     except Exception as e:
         print(f"Error fetching HTML: {e}")
         return None
 
-def process_actions_with_labels(prompt, existing_elements):
-    """Convert natural language prompt to actions using existing labels"""
+def process_actions_with_labels(prompt, existing_elements, matcher=None):
+    """Convert natural language prompt to actions using existing labels.
+
+    Labels are matched as whole words in prompt order ("L-1" does not match "L-10").
+    Pass the session's LabelMatcher to avoid rebuilding the index per prompt.
+    """
+    matcher = matcher or LabelMatcher(existing_elements)
     actions = []
-    for elem in existing_elements:
-        if elem['label'].lower() in prompt.lower():
-            actions.append({
-                'type': 'click' if elem['element_type'] in ['button', 'a'] else 'type',
-                'label': elem['label'],
-                'selector': elem['selector'],
-                'element_type': elem['element_type'],
-                'value': ''  # Will be filled for type actions
-            })
+    for elem in matcher.find(prompt):
+        actions.append({
+            'type': 'click' if elem['element_type'] in ['button', 'a'] else 'type',
+            'label': elem['label'],
+            'selector': elem['selector'],
+            'element_type': elem['element_type'],
+            'value': ''  # Will be filled for type actions
+        })
     return actions
 
-def run_test_with_actions(url, actions):
-    """Run test with pre-processed actions"""
-    test_file = "tests/generated_test.spec.js"
-    os.makedirs("tests", exist_ok=True)
-    
-    test_code = f"""
-const {{ test, expect }} = require('@playwright/test');
+def run_test_with_actions(url, actions, export_spec=False, use_npx=False):
+    """Run actions on url in-process and return the executor's per-action results.
 
-test('Generated Test', async ({{ page }}) => {{
-    test.setTimeout(120000); // Increased timeout to 2 minutes
-    
-    try {{
-        console.log("Navigating to {url}...");
-        await page.goto('{url}', {{ waitUntil: "domcontentloaded", timeout: 60000 }});
-        await page.waitForLoadState('networkidle');
-        await page.waitForTimeout(2000); // Additional stabilization time
-
-        // Action execution
-        const actions = {json.dumps(actions, indent=4)};
-        
-        for (const action of actions) {{
-            try {{
-                console.log(`Executing ${{action.type}} on ${{action.selector}}`);
-                
-                if (action.type === "type") {{
-                    await safeAction(page, action.selector, async () => {{
-                        await page.fill(action.selector, action.value);
-                    }});
-                }} 
-                else if (action.type === "click") {{
-                    await safeAction(page, action.selector, async () => {{
-                        await page.click(action.selector);
-                    }});
-                }}
-                
-                await page.waitForLoadState('networkidle');
-                await page.waitForTimeout(1000); // Short delay between actions
-            }} catch (e) {{
-                console.error(`Action failed: ${{action.type}} on ${{action.selector}}`);
-                try {{
-                    await page.screenshot({{ path: `error_${{action.label}}_${{Date.now()}}.png` }});
-                }} catch (screenshotError) {{
-                    console.error("Failed to capture screenshot:", screenshotError);
-                }}
-                throw e;
-            }}
-        }}
-    }} catch (e) {{
-        console.error("Test failed:", e);
-        throw e;
-    }}
-}});
-
-async function safeAction(page, selector, actionFn, maxAttempts = 3) {{
-    let lastError = null;
-    
-    for (let attempt = 1; attempt <= maxAttempts; attempt++) {{
-        try {{
-            // Wait for selector to be stable
-            await page.waitForSelector(selector, {{
-                state: 'visible',
-                timeout: attempt === 1 ? 30000 : 10000
-            }});
-            
-            // Scroll element into view
-            await page.$eval(selector, el => el.scrollIntoView({{ 
-                block: 'center',
-                behavior: 'smooth'
-            }}));
-            
-            // Highlight element temporarily
-            await page.$eval(selector, el => {{
-                const originalStyle = el.style.cssText;
-                el.style.border = '2px solid red';
-                setTimeout(() => el.style.cssText = originalStyle, 1000);
-            }});
-            
-            // Execute the action
-            await actionFn();
-            return;
-        }} catch (error) {{
-            lastError = error;
-            if (attempt < maxAttempts) {{
-                console.log(`Attempt ${{attempt}} failed, retrying...`);
-                await page.waitForTimeout(2000 * attempt);
-            }}
-        }}
-    }}
-    
-    throw lastError;
-}}"""
+    export_spec also writes the equivalent Playwright Test spec to tests/; use_npx
+    writes it and runs it with npx playwright test instead, as before.
+    """
+    if export_spec or use_npx:
+        actions = list(actions)
+        test_file = write_test_spec(url, actions)
+        print(f"Spec written to: {test_file}")
+    if use_npx:
+        print("\nRunning test...")
+        try:
+            subprocess.run(["npx", "playwright", "test", test_file, "--workers=1"], check=True)
+            print("\nTest completed successfully!")
+        except subprocess.CalledProcessError as e:
+            print(f"\nTest failed: {e}")
+        return None
 
-    with open(test_file, "w") as f:
-        f.write(test_code)
-    
     print("\nRunning test...")
-    try:
-        subprocess.run(["npx", "playwright", "test", test_file, "--workers=1"], check=True)
-        print("\nTest completed successfully!")
-    except subprocess.CalledProcessError as e:
-        print(f"\nTest failed: {e}")
+    result = execute_actions(url, actions)
+    for line in summarize_results(result):
+        print(line)
+    return result
 
 def generate_and_run_test(url, prompt, use_labels=False):
-    print("\nFetching HTML...")
-    html = fetch_html(url)
-    
-    if not html:
-        print("Error: Could not fetch HTML. Exiting.")
-        return
-    
     if use_labels:
         # Check for existing labels first
         existing_elements = LABELER.get_session_elements()
@@ -158,7 +78,7 @@ def generate_and_run_test(url, prompt, use_labels=False):
             reuse = input("Reuse these labels? (y/n): ").strip().lower()
             if reuse == 'y':
                 print("\nGenerating actions using existing labels...")
-                processed_actions = process_actions_with_labels(prompt, existing_elements)
+                processed_actions = process_actions_with_labels(prompt, existing_elements, LABELER.get_label_matcher())
                 if processed_actions:
                     print("\nGenerated Actions:")
                     for action in processed_actions:
@@ -168,16 +88,32 @@ def generate_and_run_test(url, prompt, use_labels=False):
         
         # If no existing labels or user chooses not to reuse
         print("\nLabeling page elements...")
-        labeled_path = LABELER.capture_and_label(url, clear_existing=True)  # Force fresh capture
-        print(f"Labeled screenshot saved to: {labeled_path}")
+        screenshot_path = LABELER.capture_and_label(url, clear_existing=True)  # Force fresh capture
+        print(f"Screenshot saved to: {screenshot_path}")
         existing_elements = LABELER.get_session_elements()
-        processed_actions = process_actions_with_labels(prompt, existing_elements)
+        processed_actions = process_actions_with_labels(prompt, existing_elements, LABELER.get_label_matcher())
         if processed_actions:
             print("\nGenerated Actions:")
             for action in processed_actions:
                 print(f"- {action['type']} {action['label']} ({action['selector']})")
             return run_test_with_actions(url, processed_actions)
 
+    # Phrases like "click the login button" rarely need the model once the page has been labeled
+    local_actions = LABELER.get_element_index(url=url).resolve(prompt)
+    if local_actions:
+        print("\nResolved actions from labeled elements:")
+        for action in local_actions:
+            print(f"- {action['type']} {action['label']} ({action['selector']}, score {action['score']})")
+        return run_test_with_actions(url, local_actions)
+
+    # Only the model needs the page, so resolved prompts never pay for a navigation
+    print("\nFetching HTML...")
+    html = fetch_html(url)
+
+    if not html:
+        print("Error: Could not fetch HTML. Exiting.")
+        return
+
     print(f"\nGenerating actions using {MODEL_NAME}...")
     try:
         ai_response = get_actions(html, prompt, model_name=MODEL_NAME)
@@ -203,14 +139,60 @@ def generate_and_run_test(url, prompt, use_labels=False):
             else:
                 processed_actions.append(action)
         
-        run_test_with_actions(url, processed_actions)
+        return run_test_with_actions(url, processed_actions)
         
     except Exception as e:
         print(f"Error generating or running test: {e}")
 
+def generate_actions(url, prompt):
+    """Actions for prompt on url: from the labeled-element index when confident, else the model"""
+    local_actions = LABELER.get_element_index(url=url).resolve(prompt)
+    if local_actions:
+        return local_actions
+    html = fetch_html(url)
+    if not html:
+        return []
+    ai_response = get_actions(html, prompt, model_name=MODEL_NAME)
+    if isinstance(ai_response, list):
+        return ai_response
+    return (ai_response or {}).get("actions", [])
+
+def suite_mode(suite_file, workers=None, shards=1):
+    """Generate and run a spec per {"url", "prompt"} entry of a JSON file in parallel"""
+    with open(suite_file) as f:
+        entries = json.load(f)
+    cases = []
+    for entry in entries:
+        actions = generate_actions(entry['url'], entry['prompt'])
+        if not actions:
+            print(f"Skipping {entry['url']} / {entry['prompt']!r}: no actions generated")
+            continue
+        cases.append({'url': entry['url'], 'prompt': entry['prompt'], 'actions': actions})
+    if not cases:
+        print("No tests to run")
+        return None
+
+    print(f"\nRunning {len(cases)} tests...")
+    result = run_suite(cases, workers=workers, shards=shards)
+    for test in result['tests']:
+        print(f"- [{test['status']}] {test['prompt']} ({test['url']}) {test['duration_seconds']:.1f}s")
+        for error in test['errors']:
+            print(f"    {error.splitlines()[0] if error else ''}")
+    for shard in result['shards']:
+        if shard.get('error'):
+            print(f"Shard {shard['shard']} failed: {shard['error']}")
+    summary = result['summary']
+    print(f"\n{summary['passed']} passed, {summary['failed']} failed, {summary['flaky']} flaky, "
+          f"{summary['not_run']} not run in {result['wall_seconds']:.1f}s "
+          f"({result['test_seconds']:.1f}s of test time, {result['wait_seconds']:.1f}s waiting for readiness, "
+          f"{result['workers']} workers)")
+    print(f"Specs and reports in: {result['run_dir']}")
+    return result
+
 def label_mode():
     url = input("Enter URL to label: ").strip()
-    labeled_path = LABELER.capture_and_label(url, clear_existing=True)
+    LABELER.capture_and_label(url, clear_existing=True)
+    labeled_path = LABELER.render_labeled_image()
     print(f"\nLabeled screenshot saved to: {labeled_path}")
     print("\nLabeled Elements:")
     elements = LABELER.get_session_elements()
@@ -218,8 +200,8 @@ def label_mode():
         print(f"{elem['label']}: {elem['selector']} ({elem['element_type']})")
 
 if __name__ == "__main__":
-    print("1. Generate Test\n2. Label Elements\n3. Run Test with Labels")
-    choice = input("Select mode (1-3): ").strip()
+    print("1. Generate Test\n2. Label Elements\n3. Run Test with Labels\n4. Run Test Suite")
+    choice = input("Select mode (1-4): ").strip()
     
     if choice == "1":
         url = input("Enter URL: ").strip()
@@ -231,5 +213,10 @@ if __name__ == "__main__":
         url = input("Enter URL: ").strip()
         prompt = input("Describe action (use labels like 'click L-1'): ").strip()
         generate_and_run_test(url, prompt, use_labels=True)
+    elif choice == "4":
+        suite_file = input("Suite file (JSON list of {\"url\", \"prompt\"}): ").strip()
+        workers = input("Workers (blank for one per CPU): ").strip()
+        shards = input("Shards (blank for 1): ").strip()
+        suite_mode(suite_file, workers=int(workers) if workers else None, shards=int(shards) if shards else 1)
     else:
         print("Invalid choice")
\ No newline at end of file
@@ -0,0 +1,50 @@
+import unittest
+from Selector.action_cache import cache_key
+from Selector.html_distiller import distill_html
+
+PAGE = """<html><head>
+<meta name="csrf-token" content="{token}">
+<script nonce="{token}">window.boot = 1;</script>
+</head><body>
+<form action="/search" method="get">
+  <input type="hidden" name="authenticity_token" value="{token}">
+  <input type="text" name="q" placeholder="Search products">
+  <button type="submit" id="search-button">Search</button>
+</form>
+<a href="/logout?csrf={token}&amp;_={timestamp}">Log out</a>
+<a href="/cart;jsessionid={token}?view=full">Cart</a>
+</body></html>"""
+
+def _key(html, prompt="search for shoes"):
+    return cache_key(distill_html(html), prompt, "model")
+
+class CacheKeyTest(unittest.TestCase):
+    def test_per_request_tokens_do_not_change_the_key(self):
+        first = PAGE.format(token="a1b2c3d4e5f6", timestamp="1712345678")
+        second = PAGE.format(token="f6e5d4c3b2a1", timestamp="1712349999")
+        self.assertNotEqual(distill_html(first), distill_html(second))
+        self.assertEqual(_key(first), _key(second))
+
+    def test_page_changes_still_change_the_key(self):
+        page = PAGE.format(token="a1b2c3d4e5f6", timestamp="1712345678")
+        changed = page.replace('id="search-button"', 'id="search-submit"')
+        self.assertNotEqual(_key(page), _key(changed))
+
+    def test_other_query_parameters_are_kept(self):
+        page = PAGE.format(token="a1b2c3d4e5f6", timestamp="1712345678")
+        changed = page.replace("view=full", "view=compact")
+        self.assertNotEqual(_key(page), _key(changed))
+
+    def test_meaningful_state_values_are_kept(self):
+        page = PAGE.format(token="a1b2c3d4e5f6", timestamp="1712345678")
+        issues = page.replace("view=full", "state=open")
+        self.assertNotEqual(_key(issues), _key(page.replace("view=full", "state=closed")))
+
+    def test_random_state_values_are_ignored(self):
+        page = PAGE.format(token="a1b2c3d4e5f6", timestamp="1712345678")
+        first = page.replace("view=full", "state=8f14e45fceea167a5a36dedd4bea2543")
+        second = page.replace("view=full", "state=c9f0f895fb98ab9159f51fd0297e236d")
+        self.assertEqual(_key(first), _key(second))
+
+if __name__ == "__main__":
+    unittest.main()
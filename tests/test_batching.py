@@ -0,0 +1,100 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from Selector import selector
+from Selector.action_cache import ActionCache
+from Selector.backends import ActionBackend, register_backend
+from Selector.selector import RateLimitScheduler
+
+HTML = '<form><input id="q" name="q"><button id="go">Search</button><a href="/cart">Cart</a></form>'
+PROMPTS = ["search for shoes", "open the cart", "click search"]
+
+def _response(content):
+    if not isinstance(content, str):
+        content = json.dumps(content)
+    return {"choices": [{"message": {"content": content}}], "usage": {"total_tokens": 100}}
+
+def _actions(target):
+    return [{"type": "click", "selector": target}]
+
+class ScriptedBackend(ActionBackend):
+    name = "scripted"
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.payloads = []
+
+    def complete(self, payload):
+        self.payloads.append(payload)
+        return self.script.pop(0)
+
+    def stream(self, payload):
+        yield from ()
+
+class GetActionsBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.cache = ActionCache(os.path.join(self.dir, "cache.db"))
+        self.addCleanup(self.cache.close)
+        for patcher in (mock.patch.object(selector, "SCHEDULER", RateLimitScheduler(limits={})),
+                        mock.patch.object(selector, "get_action_cache", lambda: self.cache),
+                        mock.patch.object(selector, "DEBUG_LOG", os.path.join(self.dir, "debug.log")),
+                        mock.patch("builtins.print")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_batch(self, script, use_cache=False):
+        self.backend = ScriptedBackend(script)
+        register_backend(self.backend.name, lambda: self.backend)
+        return selector.get_actions_batch(HTML, PROMPTS, model_name="m", use_cache=use_cache, backend="scripted")
+
+    def test_one_request_answers_every_prompt(self):
+        results = self.run_batch([_response({"results": [
+            {"index": 3, "actions": _actions("#go")},
+            {"index": 1, "actions": _actions("#q")},
+            {"index": 2, "actions": _actions("a[href='/cart']")},
+        ]})])
+        self.assertEqual(len(self.backend.payloads), 1)
+        self.assertEqual([r["actions"][0]["selector"] for r in results], ["#q", "a[href='/cart']", "#go"])
+        self.assertTrue(all(r["batched"] for r in results))
+        content = self.backend.payloads[0]["messages"][1]["content"]
+        self.assertIn("1. search for shoes\n2. open the cart\n3. click search", content)
+
+    def test_missing_entries_fall_back_to_individual_calls(self):
+        # A response cut short by max_tokens that still parses can lack the last tasks
+        results = self.run_batch([
+            _response({"results": [{"index": 1, "actions": _actions("#q")}, {"index": 2, "actions": []}]}),
+            _response({"actions": _actions("a[href='/cart']")}),
+            _response({"actions": _actions("#go")}),
+        ])
+        self.assertEqual(len(self.backend.payloads), 3)
+        self.assertTrue(results[0]["batched"])
+        self.assertNotIn("batched", results[1])
+        self.assertEqual(results[1]["actions"][0]["selector"], "a[href='/cart']")
+        self.assertEqual(results[2]["actions"][0]["selector"], "#go")
+
+    def test_truncated_json_falls_back_for_every_prompt(self):
+        truncated = json.dumps({"results": [{"index": 1, "actions": _actions("#q")}]})[:-12]
+        results = self.run_batch([_response(truncated)] + [_response({"actions": _actions(f"#p{i}")})
+                                                           for i in range(1, 4)])
+        self.assertEqual(len(self.backend.payloads), 4)
+        self.assertEqual([r["actions"][0]["selector"] for r in results], ["#p1", "#p2", "#p3"])
+
+    def test_cached_prompts_are_not_sent(self):
+        first = [_response({"results": [{"index": i, "actions": _actions(f"#b{i}")} for i in (1, 2, 3)]})]
+        self.run_batch(first, use_cache=True)
+        results = self.run_batch([], use_cache=True)
+        self.assertEqual(self.backend.payloads, [])
+        self.assertTrue(all(r["cache_hit"] for r in results))
+
+    def test_batch_output_budget_is_capped(self):
+        payload = selector._build_batch_payload("m", HTML, ["p"] * 10)
+        self.assertEqual(payload["max_tokens"], 8000)
+
+if __name__ == "__main__":
+    unittest.main()
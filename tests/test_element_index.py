@@ -0,0 +1,51 @@
+import unittest
+from Selector.element_index import ElementIndex
+
+ELEMENTS = [
+    {'label': 'L-1', 'selector': '#country', 'element_type': 'select', 'description': 'Country'},
+    {'label': 'L-2', 'selector': '#signup', 'element_type': 'a', 'description': 'Sign up'},
+    {'label': 'L-3', 'selector': '#login', 'element_type': 'a', 'description': 'Log in'},
+    {'label': 'L-4', 'selector': '#terms', 'element_type': 'input',
+     'description': 'I accept the terms and conditions'},
+    {'label': 'L-5', 'selector': '#email', 'element_type': 'input', 'description': 'Email address'},
+    {'label': 'L-6', 'selector': '#submit', 'element_type': 'button', 'description': 'Create account'},
+]
+
+class ResolveTest(unittest.TestCase):
+    def setUp(self):
+        self.index = ElementIndex(ELEMENTS)
+
+    def test_select_with_a_value_is_left_to_the_model(self):
+        self.assertIsNone(self.index.resolve('select "India" from country'))
+
+    def test_select_element_is_never_clicked(self):
+        self.assertIsNone(self.index.resolve('choose country'))
+
+    def test_quoted_text_is_part_of_the_click_target(self):
+        actions = self.index.resolve('click the "Sign up" link')
+        self.assertEqual([a['label'] for a in actions], ['L-2'])
+        self.assertEqual(actions[0]['value'], '')
+
+    def test_quoted_text_alone_is_the_click_target(self):
+        self.assertEqual(self.index.resolve('click "Log in"')[0]['label'], 'L-3')
+
+    def test_and_inside_a_target_does_not_split(self):
+        actions = self.index.resolve('check terms and conditions')
+        self.assertEqual([a['label'] for a in actions], ['L-4'])
+
+    def test_and_before_a_verb_splits(self):
+        actions = self.index.resolve("type 'bob@example.com' into email and click create account")
+        self.assertEqual([(a['type'], a['label'], a['value']) for a in actions],
+                         [('type', 'L-5', 'bob@example.com'), ('click', 'L-6', '')])
+
+    def test_type_without_a_value_is_left_to_the_model(self):
+        self.assertIsNone(self.index.resolve('type into email'))
+
+    def test_unquoted_value(self):
+        self.assertEqual(self.index.resolve('type bob into email')[0]['value'], 'bob')
+
+    def test_unknown_verb_is_left_to_the_model(self):
+        self.assertIsNone(self.index.resolve('verify the page title'))
+
+if __name__ == "__main__":
+    unittest.main()
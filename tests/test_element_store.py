@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import contextmanager
+from Selector.element_store import ElementStore, LabelCache, normalize_url
+
+SCHEMA = """CREATE TABLE elements (
+    session_id TEXT, label TEXT, screenshot_path TEXT NOT NULL, selector TEXT NOT NULL,
+    coordinates TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, element_type TEXT,
+    url TEXT, selector_type TEXT, url_key TEXT, fingerprint TEXT, description TEXT,
+    PRIMARY KEY (session_id, label)
+)"""
+
+def _row(label, selector, url="https://example.com/"):
+    return (label, "shot.png", selector, {'x': 0, 'y': 0, 'width': 10, 'height': 10}, "button", url,
+            "id", None, label.lower())
+
+class _WriteAfterSelect:
+    """Connection wrapper that runs a write right after the first SELECT, like a concurrent writer"""
+
+    def __init__(self, conn, write):
+        self._conn = conn
+        self._write = write
+
+    def execute(self, sql, params=()):
+        cursor = self._conn.execute(sql, params)
+        if not (self._write and sql.lstrip().upper().startswith("SELECT")):
+            return cursor
+        # Finish the read first so SQLite lets the write through
+        rows = cursor.fetchall()
+        write, self._write = self._write, None
+        write()
+        return _Rows(rows)
+
+class _Rows:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+class ElementStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = ElementStore(os.path.join(self.dir, "elements.db"))
+        with self.store.transaction() as conn:
+            conn.execute(SCHEMA)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_batch_write_and_read_back(self):
+        self.store.store_elements("s1", [_row(f"L-{i}", f"#b{i}") for i in range(1, 101)])
+        elements = self.store.get_session_elements("s1")
+        self.assertEqual(len(elements), 100)
+        self.assertEqual(self.store.get_element_info("s1", "L-42")['selector'], "#b42")
+
+    def test_replace_session(self):
+        self.store.store_elements("s1", [_row("L-1", "#old"), _row("L-2", "#gone")])
+        self.store.store_elements("s1", [_row("L-1", "#new")], replace_session=True)
+        self.assertEqual([e['selector'] for e in self.store.get_session_elements("s1")], ["#new"])
+
+    def test_cached_miss_is_invalidated_by_a_write(self):
+        self.assertIsNone(self.store.get_element_info("s1", "L-1"))
+        self.store.store_elements("s1", [_row("L-1", "#b1")])
+        self.assertEqual(self.store.get_element_info("s1", "L-1")['selector'], "#b1")
+
+    def test_row_read_before_a_concurrent_write_is_not_cached(self):
+        self.store.store_elements("s1", [_row("L-1", "#old")])
+        original = self.store.connection
+
+        def write():
+            self.store.connection = original
+            self.store.store_elements("s1", [_row("L-1", "#new")])
+
+        @contextmanager
+        def racing_connection():
+            with original() as conn:
+                yield _WriteAfterSelect(conn, write)
+
+        self.store.connection = racing_connection
+        # This read saw the old row; the write's invalidation must win over caching it
+        self.assertEqual(self.store.get_element_info("s1", "L-1")['selector'], "#old")
+        self.assertEqual(self.store.get_element_info("s1", "L-1")['selector'], "#new")
+
+    def test_latest_snapshot_uses_the_url_key(self):
+        self.store.store_elements("s1", [_row("L-1", "#b1", url="https://Example.com:443/?b=2&a=1#top")])
+        snapshot = self.store.get_latest_snapshot("example.com/?a=1&b=2")
+        self.assertEqual(snapshot['session_id'], "s1")
+
+class LabelCacheTest(unittest.TestCase):
+    def test_put_after_invalidation_is_dropped(self):
+        cache = LabelCache()
+        generation = cache.generation
+        cache.invalidate_session("s1")
+        cache.put(("s1", "L-1"), {'selector': '#stale'}, generation)
+        cache.put(("s1", "L-2"), {'selector': '#fresh'}, cache.generation)
+        self.assertEqual(cache.info()['size'], 1)
+
+    def test_lru_eviction(self):
+        cache = LabelCache(maxsize=2)
+        for label in ("L-1", "L-2", "L-3"):
+            cache.put(("s1", label), {})
+        self.assertEqual(cache.info()['size'], 2)
+
+class NormalizeUrlTest(unittest.TestCase):
+    def test_equivalent_urls_share_a_key(self):
+        self.assertEqual(normalize_url("HTTPS://Example.com:443/path/?b=2&a=1#frag"),
+                         normalize_url("example.com/path?a=1&b=2"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import time
+import unittest
+from Selector.html_distiller import distill_html
+
+def _unclosed_table(rows):
+    cells = "".join(f"<tr><th>Row {i}<td><button id=\"buy-{i}\">Buy {i}</button></tr>" for i in range(rows))
+    return f"<table><tr><th>Name<th>Action</tr>{cells}</table>"
+
+class UnclosedTagsTest(unittest.TestCase):
+    def test_unclosed_cells_stay_linear(self):
+        start = time.perf_counter()
+        distill_html(_unclosed_table(8000), token_budget=100000)
+        # Quadratic before: about 12s for 8000 rows
+        self.assertLess(time.perf_counter() - start, 3.0)
+
+    def test_unclosed_cells_keep_only_their_own_text(self):
+        lines = distill_html(_unclosed_table(50), token_budget=100000).splitlines()
+        self.assertIn("<th>Name</th>", lines)
+        self.assertIn("<th>Action</th>", lines)
+        self.assertIn("<th>Row 7</th>", lines)
+        self.assertIn('<button id="buy-7">Buy 7</button>', lines)
+
+    def test_unclosed_list_items_and_options(self):
+        html = ('<ul><li><a href="/home">Home<li><a href="/shop">Shop</ul>'
+                '<select name="size"><option>Small<option>Large</select><p>Footer text<p>More')
+        lines = distill_html(html).splitlines()
+        self.assertIn('<a href="/home">Home</a>', lines)
+        self.assertIn('<a href="/shop">Shop</a>', lines)
+        self.assertIn('<select name="size">Small Large</select>', lines)
+
+    def test_attribute_quotes_are_escaped(self):
+        self.assertEqual(distill_html("<button aria-label='Say \"hi\"'>Go</button>"),
+                         '<button aria-label="Say &quot;hi&quot;">Go</button>')
+
+if __name__ == "__main__":
+    unittest.main()
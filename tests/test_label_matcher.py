@@ -0,0 +1,39 @@
+import unittest
+from Selector.label_matcher import LabelMatcher
+
+def _elements(*labels):
+    return [{'label': label, 'selector': f"#{label.lower().replace(' ', '-')}", 'element_type': 'button'}
+            for label in labels]
+
+class LabelMatcherTest(unittest.TestCase):
+    def test_labels_match_whole_words_only(self):
+        matcher = LabelMatcher(_elements("L-1", "L-10", "L-100"))
+        self.assertEqual([e['label'] for e in matcher.find("click L-10")], ["L-10"])
+        self.assertEqual(matcher.find("click L-1000"), [])
+
+    def test_prefix_and_suffix_hyphens_do_not_match(self):
+        matcher = LabelMatcher(_elements("L-1"))
+        self.assertEqual(matcher.find("click XL-1 and L-1-b"), [])
+
+    def test_matches_follow_prompt_order_and_repeat(self):
+        matcher = LabelMatcher(_elements("L-1", "L-2", "L-3"))
+        found = matcher.find("Click L-3, then type into L-1 and click L-3 again")
+        self.assertEqual([e['label'] for e in found], ["L-3", "L-1", "L-3"])
+
+    def test_matching_is_case_insensitive(self):
+        matcher = LabelMatcher(_elements("L-7"))
+        self.assertEqual([e['label'] for e in matcher.find("press l-7.")], ["L-7"])
+
+    def test_multi_word_labels_match_longest_first(self):
+        matcher = LabelMatcher(_elements("Sign", "Sign in", "Sign in now"))
+        self.assertEqual([e['label'] for e in matcher.find("click sign in now")], ["Sign in now"])
+        self.assertEqual([e['label'] for e in matcher.find("click sign in")], ["Sign in"])
+        self.assertEqual([e['label'] for e in matcher.find("sign here")], ["Sign"])
+
+    def test_no_labels(self):
+        matcher = LabelMatcher([])
+        self.assertEqual(matcher.size, 0)
+        self.assertEqual(matcher.find("click L-1"), [])
+
+if __name__ == "__main__":
+    unittest.main()
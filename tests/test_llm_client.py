@@ -0,0 +1,42 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Selector.llm_client import ChatClient
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    deltas = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.send_response(200)
+        # No charset, as many SSE servers send it
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        for delta in self.deltas:
+            event = {'choices': [{'delta': {'content': delta}}]}
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+class StreamEncodingTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _SSEHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = ChatClient(base_url=f"http://127.0.0.1:{self.server.server_port}", api_key="")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_non_ascii_deltas_are_decoded_as_utf8(self):
+        _SSEHandler.deltas = ['{"actions": [{"selector": "text=Café', ' – 日本語 ✓"}]}']
+        text = ''.join(self.client.stream({'model': 'test', 'messages': []}))
+        self.assertEqual(json.loads(text), {'actions': [{'selector': 'text=Café – 日本語 ✓'}]})
+
+if __name__ == "__main__":
+    unittest.main()
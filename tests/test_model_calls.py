@@ -0,0 +1,165 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import requests
+from Selector import selector
+from Selector.backends import ActionBackend, register_backend
+from Selector.selector import RateLimitScheduler, TokenBucket
+
+def _response(content='{"actions": [{"type": "click", "selector": "#go"}]}', total_tokens=50):
+    return {"choices": [{"message": {"content": content}}], "usage": {"total_tokens": total_tokens}}
+
+def _rate_limited(retry_after="0"):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after
+    return requests.exceptions.HTTPError("429 Too Many Requests", response=response)
+
+class ScriptedBackend(ActionBackend):
+    """Remote backend that answers from a script: exceptions are raised, dicts returned"""
+
+    name = "scripted"
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.calls = []
+
+    def complete(self, payload):
+        self.calls.append(payload["model"])
+        step = self.script.pop(0)
+        if callable(step):
+            step = step(payload)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+    def stream(self, payload):
+        yield from ()
+
+class _SelectorTest(unittest.TestCase):
+    def setUp(self):
+        log_dir = tempfile.mkdtemp()
+        self.scheduler = RateLimitScheduler(limits={}, default_limit={"rpm": 600, "tpm": 10000})
+        for patcher in (mock.patch.object(selector, "SCHEDULER", self.scheduler),
+                        mock.patch.object(selector, "DEBUG_LOG", os.path.join(log_dir, "debug.log")),
+                        mock.patch("builtins.print")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use_backend(self, script):
+        backend = ScriptedBackend(script)
+        register_backend(backend.name, lambda: backend)
+        return backend
+
+class TokenBucketTest(unittest.TestCase):
+    def test_wait_time_reflects_refill_rate(self):
+        bucket = TokenBucket(60)
+        bucket.take(60)
+        now = bucket.updated
+        self.assertAlmostEqual(bucket.wait_time(1, now), 1.0, places=3)
+        self.assertEqual(bucket.wait_time(1, now + 1.0), 0.0)
+
+    def test_requests_larger_than_capacity_are_capped(self):
+        bucket = TokenBucket(10)
+        self.assertEqual(bucket.wait_time(50, bucket.updated), 0.0)
+
+class RateLimitSchedulerTest(unittest.TestCase):
+    def test_usage_refunds_over_reservation(self):
+        scheduler = RateLimitScheduler(limits={}, default_limit={"rpm": 60, "tpm": 1000})
+        scheduler.acquire("m", 800)
+        scheduler.record_usage("m", 800, 100)
+        self.assertAlmostEqual(scheduler._state("m")["tokens"].level, 900, delta=1)
+
+    def test_waits_for_the_request_bucket(self):
+        scheduler = RateLimitScheduler(limits={}, default_limit={"rpm": 240, "tpm": 1000})
+        scheduler._state("m")["requests"].level = 0.0
+        waited = scheduler.acquire("m", 10)
+        self.assertGreaterEqual(waited, 0.2)
+
+    def test_penalize_blocks_for_retry_after(self):
+        scheduler = RateLimitScheduler(limits={}, default_limit={"rpm": 600, "tpm": 1000})
+        scheduler.penalize("m", 0.3)
+        scheduler._state("m")["requests"].level = 600.0
+        self.assertGreaterEqual(scheduler.acquire("m", 10), 0.29)
+
+    def test_cancel_returns_none(self):
+        scheduler = RateLimitScheduler(limits={}, default_limit={"rpm": 600, "tpm": 1000})
+        scheduler.penalize("m", 60)
+        cancel = threading.Event()
+        threading.Timer(0.1, cancel.set).start()
+        self.assertIsNone(scheduler.acquire("m", 10, cancel=cancel))
+
+    def test_lower_priority_number_goes_first(self):
+        scheduler = RateLimitScheduler(limits={}, default_limit={"rpm": 600, "tpm": 1000})
+        scheduler.penalize("m", 0.3)
+        scheduler._state("m")["requests"].level = 600.0
+        order = []
+        waiters = [threading.Thread(target=lambda p=p: (scheduler.acquire("m", 10, priority=p), order.append(p)))
+                   for p in (5, 0)]
+        for waiter in waiters:
+            waiter.start()
+            time.sleep(0.05)
+        for waiter in waiters:
+            waiter.join()
+        self.assertEqual(order, [0, 5])
+
+class CallAiApiTest(_SelectorTest):
+    def test_429_waits_retry_after_and_retries(self):
+        backend = self.use_backend([_rate_limited("0.2"), _response()])
+        start = time.time()
+        content = selector._call_ai_api("m", "<button id=go>", "click go", 1, backend="scripted")
+        self.assertGreaterEqual(time.time() - start, 0.19)
+        self.assertEqual(content["actions"][0]["selector"], "#go")
+        self.assertEqual(content["_metadata"]["rate_limited"], 1)
+        self.assertEqual(len(backend.calls), 2)
+        self.assertEqual(self.scheduler.stats["throttled"], 1)
+
+    def test_failed_call_refunds_its_reservation(self):
+        self.use_backend([RuntimeError("connection reset")])
+        with self.assertRaises(RuntimeError):
+            selector._call_ai_api("m", "<button id=go>", "click go", 1, backend="scripted")
+        self.assertAlmostEqual(self.scheduler._state("m")["tokens"].level, 10000, delta=1)
+
+    def test_usage_replaces_the_reservation(self):
+        self.use_backend([_response(total_tokens=50)])
+        selector._call_ai_api("m", "<button id=go>", "click go", 1, backend="scripted")
+        self.assertAlmostEqual(self.scheduler._state("m")["tokens"].level, 10000 - 50, delta=1)
+
+class HedgedCallTest(_SelectorTest):
+    def test_next_model_starts_when_a_running_call_fails(self):
+        calls = []
+
+        def fake_call(model, html, prompt, attempt, cancel=None, backend=None, priority=0):
+            calls.append(model)
+            if model == "slow":
+                cancel.wait(5)
+                return None
+            if model == "broken":
+                raise RuntimeError("boom")
+            return {"actions": [{"type": "click", "selector": "#go"}]}
+
+        with mock.patch.object(selector, "_call_ai_api", fake_call):
+            start = time.time()
+            result = selector._get_actions_hedged("<html>", "click go", ["slow", "broken", "good"], hedge_after=0.2)
+        self.assertEqual(result["model_used"], "good")
+        self.assertEqual(calls, ["slow", "broken", "good"])
+        # "good" starts as soon as "broken" fails, not a second hedge delay later
+        self.assertLess(time.time() - start, 0.35)
+
+    def test_first_valid_result_wins(self):
+        def fake_call(model, html, prompt, attempt, cancel=None, backend=None, priority=0):
+            if model == "slow":
+                cancel.wait(5)
+            return {"actions": [{"type": "click", "selector": f"#{model}"}]}
+
+        with mock.patch.object(selector, "_call_ai_api", fake_call):
+            result = selector._get_actions_hedged("<html>", "click go", ["slow", "fast"], hedge_after=0.1)
+        self.assertEqual(result["model_used"], "fast")
+        self.assertEqual(result["hedge"]["launched"], ["slow", "fast"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from utils.browser_pool import get_browser_pool
+from utils.readiness import ReadinessEngine, get_readiness_engine
+
+DEFAULT_ERROR_DIR = os.path.join("data", "errors")
+
+# Same temporary outline the exported spec draws before acting
+HIGHLIGHT_JS = '''el => {
+    const originalStyle = el.style.cssText;
+    el.style.border = '2px solid red';
+    setTimeout(() => el.style.cssText = originalStyle, 1000);
+}'''
+
+class ActionExecutor:
+    """Runs generated type/click actions on a Playwright page in this process.
+
+    Mirrors the exported spec: navigate, then for each action wait for the
+    target to be visible, stable and enabled, scroll it into view, highlight it
+    and act, retrying up to max_attempts once the page has settled again
+    (safeAction). Instead of fixed sleeps the page is considered settled by the
+    ReadinessEngine, and the time each wait took is reported. A failed action
+    saves an error screenshot and, like the spec, stops the run. actions can be
+    any iterable, so a stream_actions generator starts executing as soon as
+    its first action arrives.
+    """
+
+    def __init__(self, max_attempts: int = 3, first_timeout: int = 30000, retry_timeout: int = 10000,
+                 navigation_timeout: int = 60000, readiness: Optional[ReadinessEngine] = None,
+                 error_dir: str = DEFAULT_ERROR_DIR, highlight: bool = True, stop_on_failure: bool = True):
+        self.max_attempts = max_attempts
+        self.first_timeout = first_timeout
+        self.retry_timeout = retry_timeout
+        self.navigation_timeout = navigation_timeout
+        self.readiness = readiness or get_readiness_engine()
+        self.error_dir = error_dir
+        self.highlight = highlight
+        self.stop_on_failure = stop_on_failure
+
+    def run(self, page, actions: Iterable[Dict[str, Any]], url: Optional[str] = None) -> Dict[str, Any]:
+        """Execute actions on page (after navigating to url, if given).
+
+        Returns {'url', 'passed', 'navigation_seconds', 'ready_seconds', 'total_seconds',
+        'actions'} where 'actions' holds one result dict per executed action and
+        ready_seconds is how long the page took to settle after navigation.
+        """
+        start_time = time.time()
+        result = {'url': url, 'passed': True, 'navigation_seconds': 0.0, 'ready_seconds': 0.0, 'actions': []}
+        if url:
+            try:
+                page.add_init_script(script=self.readiness.init_script())
+                page.goto(url, wait_until="domcontentloaded", timeout=self.navigation_timeout)
+                result['ready_seconds'] = self.readiness.wait_for_page(page, 'navigation')['seconds']
+            except Exception as e:
+                logging.error(f"Navigation to {url} failed: {str(e)}")
+                result.update(passed=False, error=str(e), total_seconds=time.time() - start_time)
+                return result
+            result['navigation_seconds'] = time.time() - start_time
+
+        for index, action in enumerate(actions, 1):
+            action_result = self.execute(page, action, index)
+            result['actions'].append(action_result)
+            if action_result['status'] == 'failed':
+                result['passed'] = False
+                if self.stop_on_failure:
+                    break
+        result['total_seconds'] = time.time() - start_time
+        return result
+
+    def execute(self, page, action: Dict[str, Any], index: int = 1) -> Dict[str, Any]:
+        """Run one action with retries; returns its result dict"""
+        action_type = action.get('type')
+        selector = action.get('selector')
+        result = {
+            'index': index,
+            'type': action_type,
+            'label': action.get('label'),
+            'selector': selector,
+            'status': 'passed',
+            'attempts': 0,
+            'seconds': 0.0,
+            'wait_seconds': 0.0,
+            'error': None,
+            'screenshot': None,
+        }
+        if action_type not in ('type', 'click'):
+            # The spec has no branch for other types and moves on
+            result['status'] = 'skipped'
+            logging.warning(f"Skipping unsupported action type {action_type!r}")
+            return result
+        if not selector:
+            result.update(status='failed', error="Action has no selector")
+            return result
+
+        logging.info(f"Executing {action_type} on {selector}")
+        start_time = time.time()
+        waits = []
+        try:
+            result['attempts'] = self._safe_action(page, action, waits)
+            waits.append(self.readiness.wait_for_page(page, 'action'))
+        except Exception as e:
+            logging.error(f"Action failed: {action_type} on {selector}: {str(e)}")
+            result.update(status='failed', error=str(e), attempts=self.max_attempts,
+                          screenshot=self._error_screenshot(page, action))
+        result['seconds'] = time.time() - start_time
+        result['wait_seconds'] = sum(wait['seconds'] for wait in waits)
+        return result
+
+    def _safe_action(self, page, action: Dict[str, Any], waits: list) -> int:
+        selector = action['selector']
+        last_error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                waits.append(self.readiness.wait_for_element(
+                    page, selector, editable=action['type'] == 'type',
+                    timeout_ms=self.first_timeout if attempt == 1 else self.retry_timeout
+                ))
+                page.eval_on_selector(selector, "el => el.scrollIntoView({block: 'center', behavior: 'smooth'})")
+                if self.highlight:
+                    page.eval_on_selector(selector, HIGHLIGHT_JS)
+                if action['type'] == 'type':
+                    page.fill(selector, action.get('value') or '')
+                else:
+                    page.click(selector)
+                return attempt
+            except Exception as e:
+                last_error = e
+                if attempt < self.max_attempts:
+                    logging.info(f"Attempt {attempt} on {selector} failed, retrying once the page settles...")
+                    waits.append(self.readiness.wait_for_page(page, 'retry'))
+        raise last_error
+
+    def _error_screenshot(self, page, action: Dict[str, Any]) -> Optional[str]:
+        path = os.path.join(self.error_dir, f"error_{action.get('label') or 'action'}_{int(time.time() * 1000)}.png")
+        try:
+            os.makedirs(self.error_dir, exist_ok=True)
+            page.screenshot(path=path)
+            return path
+        except Exception as e:
+            logging.error(f"Failed to capture screenshot: {str(e)}")
+            return None
+
+def execute_actions(url: str, actions: Iterable[Dict[str, Any]], browser_pool=None,
+                    executor: Optional[ActionExecutor] = None, **context_options) -> Dict[str, Any]:
+    """Borrow a page from the browser pool and run actions on url with executor"""
+    pool = browser_pool or get_browser_pool(headless=True)
+    executor = executor or ActionExecutor()
+    with pool.page(**context_options) as page:
+        return executor.run(page, actions, url=url)
+
+def summarize_results(result: Dict[str, Any]) -> List[str]:
+    """One line per action plus a total, for printing"""
+    lines = []
+    for action in result['actions']:
+        line = f"{action['index']}. {action['type']} {action['label'] or action['selector'] or ''}: {action['status']}"
+        if action['status'] != 'skipped':
+            line += (f" in {action['seconds']:.2f}s, {action['wait_seconds']:.2f}s waiting "
+                     f"({action['attempts']} attempt(s))")
+        if action['error']:
+            line += f" - {action['error'].splitlines()[0]}"
+        if action['screenshot']:
+            line += f" [screenshot: {action['screenshot']}]"
+        lines.append(line)
+    status = "passed" if result['passed'] else "failed"
+    lines.append(f"Test {status} in {result['total_seconds']:.2f}s "
+                 f"(navigation {result['navigation_seconds']:.2f}s, {result['ready_seconds']:.2f}s of it "
+                 f"waiting for the page to settle)")
+    return lines
@@ -0,0 +1,213 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+from playwright.sync_api import sync_playwright
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_PAGES_PER_BROWSER = 50
+
+class _PooledBrowser:
+    """A launched browser plus the bookkeeping the pool needs to recycle it"""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.pages_served = 0
+        self.launched_at = time.time()
+
+    def is_healthy(self) -> bool:
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        try:
+            self.browser.close()
+        except Exception as e:
+            logging.debug(f"Ignoring error while closing pooled browser: {str(e)}")
+
+_local = threading.local()
+
+def _acquire_driver(pool) -> Any:
+    """The calling thread's sync Playwright driver, started on first use.
+
+    Playwright allows only one sync driver per thread (a second start() fails
+    with "using Playwright Sync API inside the asyncio loop"), so every pool on
+    a thread shares it; pools only own their browsers.
+    """
+    users = getattr(_local, 'driver_users', None)
+    if users is None:
+        users = _local.driver_users = set()
+    if getattr(_local, 'playwright', None) is None:
+        _local.playwright = sync_playwright().start()
+    users.add(id(pool))
+    return _local.playwright
+
+def _release_driver(pool) -> None:
+    """Stop the thread's driver once the last pool using it has closed"""
+    users = getattr(_local, 'driver_users', set())
+    users.discard(id(pool))
+    driver = getattr(_local, 'playwright', None)
+    if driver is not None and not users:
+        try:
+            driver.stop()
+        except Exception as e:
+            logging.debug(f"Ignoring error while stopping Playwright: {str(e)}")
+        _local.playwright = None
+
+class BrowserPool:
+    """Keeps Chromium instances warm so each job only pays for a new context.
+
+    Sync Playwright objects are bound to the thread that created them, so a pool
+    must only be used from one thread. Use get_browser_pool() to get the shared
+    pool for the calling thread; pools for different launch options on one
+    thread share that thread's Playwright driver.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE,
+                 max_pages_per_browser: int = DEFAULT_MAX_PAGES_PER_BROWSER,
+                 launch_options: Optional[Dict[str, Any]] = None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.size = size
+        self.max_pages_per_browser = max_pages_per_browser
+        self.launch_options = launch_options or {'headless': True}
+        self._playwright = None
+        self._idle: List[_PooledBrowser] = []
+        self._in_use = 0
+        self._owner_thread = threading.get_ident()
+        self.stats = {'launched': 0, 'recycled': 0, 'unhealthy': 0, 'jobs': 0}
+
+    def _check_thread(self) -> None:
+        if threading.get_ident() != self._owner_thread:
+            raise RuntimeError("BrowserPool used from a different thread than the one that created it")
+
+    def _launch(self) -> _PooledBrowser:
+        if self._playwright is None:
+            self._playwright = _acquire_driver(self)
+        start_time = time.time()
+        browser = self._playwright.chromium.launch(**self.launch_options)
+        self.stats['launched'] += 1
+        logging.info(f"Browser pool launched Chromium in {time.time() - start_time:.2f}s")
+        return _PooledBrowser(browser)
+
+    def _acquire(self) -> _PooledBrowser:
+        self._check_thread()
+        while self._idle:
+            pooled = self._idle.pop()
+            if pooled.is_healthy():
+                self._in_use += 1
+                return pooled
+            self.stats['unhealthy'] += 1
+            logging.warning("Discarding disconnected browser from pool")
+            pooled.close()
+        self._in_use += 1
+        return self._launch()
+
+    def _release(self, pooled: _PooledBrowser) -> None:
+        self._in_use -= 1
+        if pooled.pages_served >= self.max_pages_per_browser:
+            self.stats['recycled'] += 1
+            logging.info(f"Recycling browser after {pooled.pages_served} pages")
+            pooled.close()
+        elif not pooled.is_healthy():
+            self.stats['unhealthy'] += 1
+            pooled.close()
+        elif len(self._idle) >= self.size:
+            # Overflow browser launched while the pool was exhausted
+            pooled.close()
+        else:
+            self._idle.append(pooled)
+
+    @contextmanager
+    def context(self, **context_options):
+        """Borrow a browser and yield a fresh, isolated context on it"""
+        pooled = self._acquire()
+        context = None
+        try:
+            context = pooled.browser.new_context(**context_options)
+            self.stats['jobs'] += 1
+            yield context
+        finally:
+            pooled.pages_served += 1
+            if context is not None:
+                try:
+                    context.close()
+                except Exception as e:
+                    logging.debug(f"Ignoring error while closing context: {str(e)}")
+            self._release(pooled)
+
+    @contextmanager
+    def page(self, **context_options):
+        """Borrow a browser and yield a new page in a fresh context"""
+        with self.context(**context_options) as context:
+            yield context.new_page()
+
+    def warm_up(self) -> None:
+        """Launch browsers up front so the first job doesn't pay for it"""
+        self._check_thread()
+        while len(self._idle) + self._in_use < self.size:
+            self._idle.append(self._launch())
+
+    def close(self) -> None:
+        for pooled in self._idle:
+            pooled.close()
+        self._idle = []
+        if self._playwright is not None:
+            _release_driver(self)
+            self._playwright = None
+
+_all_pools: List[BrowserPool] = []
+
+def get_browser_pool(size: int = DEFAULT_POOL_SIZE,
+                     max_pages_per_browser: int = DEFAULT_MAX_PAGES_PER_BROWSER,
+                     **launch_options) -> BrowserPool:
+    """Return the calling thread's shared pool for these launch options and sizes.
+
+    A different size or max_pages_per_browser gets its own pool rather than
+    silently reusing one configured differently.
+    """
+    if not launch_options:
+        launch_options = {'headless': True}
+    pools = getattr(_local, 'pools', None)
+    if pools is None:
+        pools = _local.pools = {}
+    key = json.dumps({'launch_options': launch_options, 'size': size,
+                      'max_pages_per_browser': max_pages_per_browser}, sort_keys=True)
+    pool = pools.get(key)
+    if pool is None:
+        pool = BrowserPool(size=size, max_pages_per_browser=max_pages_per_browser,
+                           launch_options=launch_options)
+        pools[key] = pool
+        _all_pools.append(pool)
+    return pool
+
+def close_all_pools() -> None:
+    """Shut down every pool created by the calling thread.
+
+    Sync Playwright objects can only be used from the thread that created them,
+    so pools owned by other threads can't be closed from here: a worker thread
+    that used get_browser_pool() should call this before it exits. At exit this
+    runs on the main thread; browsers of threads that didn't clean up are left
+    to Playwright, which kills them when its driver process exits.
+    """
+    thread_id = threading.get_ident()
+    for pool in [p for p in _all_pools if p._owner_thread == thread_id]:
+        try:
+            pool.close()
+        except Exception as e:
+            logging.debug(f"Ignoring error while closing browser pool: {str(e)}")
+        _all_pools.remove(pool)
+    pools = getattr(_local, 'pools', None)
+    if pools:
+        pools.clear()
+    others = len(_all_pools)
+    if others:
+        logging.debug(f"{others} browser pool(s) owned by other threads left open")
+
+# Closes the main thread's pools; see close_all_pools for pools on other threads
+atexit.register(close_all_pools)
@@ -0,0 +1,165 @@
+import atexit
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+import cv2
+import numpy as np
+
+IMAGE_FORMATS = ('png', 'webp', 'jpeg')
+DEFAULT_ENCODER_WORKERS = 2
+
+_EXTENSIONS = {'png': '.png', 'webp': '.webp', 'jpeg': '.jpg'}
+
+@dataclass(frozen=True)
+class EncodeOptions:
+    """Output format for written images.
+
+    png_compression is zlib level 0-9 (OpenCV's default is 1, PIL's 6). webp is
+    lossless unless webp_lossless is False; jpeg is meant for preview overlays.
+    """
+    format: str = 'png'
+    png_compression: int = 3
+    webp_lossless: bool = True
+    webp_quality: int = 90
+    jpeg_quality: int = 85
+
+    def __post_init__(self):
+        if self.format not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format: {self.format}")
+
+    @property
+    def extension(self) -> str:
+        return _EXTENSIONS[self.format]
+
+    def imencode_params(self):
+        if self.format == 'png':
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        if self.format == 'webp':
+            # OpenCV switches WebP to lossless for quality above 100
+            return [cv2.IMWRITE_WEBP_QUALITY, 101 if self.webp_lossless else self.webp_quality]
+        return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+
+DEFAULT_ENCODING = EncodeOptions()
+
+def encode_image(image: np.ndarray, options: EncodeOptions = DEFAULT_ENCODING) -> bytes:
+    ok, buffer = cv2.imencode(options.extension, image, options.imencode_params())
+    if not ok:
+        raise IOError(f"Could not encode image as {options.format}")
+    return buffer.tobytes()
+
+def _write_atomic(path: str, data: bytes) -> None:
+    # Readers of path never see a half-written file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_image(image: np.ndarray, path: str, options: EncodeOptions = DEFAULT_ENCODING) -> Dict:
+    """Encode and write image; returns {path, format, bytes, encode_seconds}"""
+    start_time = time.time()
+    data = encode_image(image, options)
+    encode_seconds = time.time() - start_time
+    _write_atomic(path, data)
+    return {'path': path, 'format': options.format, 'bytes': len(data), 'encode_seconds': encode_seconds}
+
+def write_encoded(data: bytes, path: str, options: Optional[EncodeOptions] = None) -> Dict:
+    """Write already-encoded image bytes, transcoding them first if options asks for another format"""
+    if options is None:
+        _write_atomic(path, data)
+        return {'path': path, 'format': None, 'bytes': len(data), 'encode_seconds': 0.0}
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError(f"Could not decode image bytes for {path}")
+    return write_image(image, path, options)
+
+class ImageEncoder:
+    """Background pool that encodes and writes images off the calling thread.
+
+    cv2.imencode releases the GIL, so a small thread pool keeps encoding off the
+    labeling path. Submitted arrays must not be modified afterwards. Use wait(path)
+    before reading a file that may still be pending.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_ENCODER_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-encoder")
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.stats = {'encoded': 0, 'failed': 0, 'bytes': 0, 'encode_seconds': 0.0}
+
+    def _submit(self, path: str, job: Callable[[], Dict],
+                on_done: Optional[Callable[[Dict], None]]):
+        def run():
+            try:
+                result = job()
+            except Exception as e:
+                with self._lock:
+                    self.stats['failed'] += 1
+                logging.error(f"Failed to write image {path}: {str(e)}")
+                raise
+            with self._lock:
+                self.stats['encoded'] += 1
+                self.stats['bytes'] += result['bytes']
+                self.stats['encode_seconds'] += result['encode_seconds']
+            if on_done:
+                on_done(result)
+            return result
+
+        future = self._executor.submit(run)
+        with self._lock:
+            self._pending[path] = future
+        future.add_done_callback(lambda f: self._forget(path, f))
+        return future
+
+    def _forget(self, path, future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+
+    def submit(self, image: np.ndarray, path: str, options: EncodeOptions = DEFAULT_ENCODING,
+               on_done: Optional[Callable[[Dict], None]] = None):
+        """Encode image to path in the background; returns a Future of the write_image result"""
+        return self._submit(path, lambda: write_image(image, path, options), on_done)
+
+    def submit_encoded(self, data: bytes, path: str, options: Optional[EncodeOptions] = None,
+                       on_done: Optional[Callable[[Dict], None]] = None):
+        return self._submit(path, lambda: write_encoded(data, path, options), on_done)
+
+    def wait(self, path: str, timeout: Optional[float] = None) -> None:
+        """Block until a pending write of path (if any) has finished"""
+        with self._lock:
+            future = self._pending.get(str(path))
+        if future is not None:
+            future.result(timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+_shared_encoder: Optional[ImageEncoder] = None
+_shared_lock = threading.Lock()
+
+def get_image_encoder() -> ImageEncoder:
+    """Process-wide encoder pool, flushed at exit so no pending image is lost"""
+    global _shared_encoder
+    with _shared_lock:
+        if _shared_encoder is None:
+            _shared_encoder = ImageEncoder()
+            atexit.register(_shared_encoder.shutdown)
+        return _shared_encoder
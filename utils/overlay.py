@@ -0,0 +1,303 @@
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+class OverlayStyle:
+    """Colors (RGB) and geometry for label overlays"""
+
+    def __init__(self, outline=(255, 0, 0), plate=(255, 255, 255), text=(255, 0, 0),
+                 outline_width=2, plate_padding=5, plate_gap=5,
+                 font_scale=0.45, font_thickness=1):
+        self.outline = outline
+        self.plate = plate
+        self.text = text
+        self.outline_width = outline_width
+        self.plate_padding = plate_padding
+        self.plate_gap = plate_gap
+        self.font_scale = font_scale
+        self.font_thickness = font_thickness
+
+# Red boxes with white plates, as drawn by ElementLabeler
+LABELER_STYLE = OverlayStyle()
+# Red plates with white text, as drawn by utils.screenshot
+SCREENSHOT_STYLE = OverlayStyle(plate=(255, 0, 0), text=(255, 255, 255), plate_padding=4, plate_gap=0, font_scale=0.4)
+
+LabeledBox = Tuple[str, Dict[str, float]]
+
+@lru_cache(maxsize=32)
+def _line_metrics(font_scale: float, thickness: int) -> Tuple[int, int]:
+    """Ascent and total height shared by all glyphs of a style so they line up"""
+    (_, ascent), baseline = cv2.getTextSize("L-0123456789", cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    return ascent, ascent + baseline
+
+@lru_cache(maxsize=256)
+def _glyph(char: str, font_scale: float, thickness: int) -> np.ndarray:
+    """Bitmap of a single character, rendered once per style"""
+    (width, _), _ = cv2.getTextSize(char, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    ascent, line_height = _line_metrics(font_scale, thickness)
+    canvas = np.zeros((line_height, max(width, 1)), dtype=np.uint8)
+    cv2.putText(canvas, char, (0, ascent), cv2.FONT_HERSHEY_SIMPLEX, font_scale, 255, thickness, cv2.LINE_8)
+    return canvas > 0
+
+@lru_cache(maxsize=8192)
+def _label_pixels(text: str, font_scale: float, thickness: int) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """Pixel coordinates (ys, xs) and size of a label, composed from cached glyphs"""
+    bitmap = np.hstack([_glyph(char, font_scale, thickness) for char in text])
+    ys, xs = np.nonzero(bitmap)
+    return ys.astype(np.int32), xs.astype(np.int32), bitmap.shape[1], bitmap.shape[0]
+
+def _fill_rects(image: np.ndarray, rects: np.ndarray, color) -> None:
+    """Fill many [x0, x1) x [y0, y1) rectangles with one fancy-indexed assignment.
+
+    Pixel indices for all rectangles are generated together with np.repeat, so the
+    cost is proportional to the painted area, not to the image size.
+    """
+    height, width = image.shape[:2]
+    if len(rects) == 0:
+        return
+    x0 = np.clip(rects[:, 0], 0, width)
+    x1 = np.clip(rects[:, 2], 0, width)
+    y0 = np.clip(rects[:, 1], 0, height)
+    y1 = np.clip(rects[:, 3], 0, height)
+    widths = x1 - x0
+    areas = widths * (y1 - y0)
+    keep = (widths > 0) & (areas > 0)
+    if not keep.any():
+        return
+    x0, y0, widths, areas = x0[keep], y0[keep], widths[keep], areas[keep]
+    # Offsets within a single rectangle always fit in int32, which halves the divmod cost
+    starts = np.cumsum(areas) - areas
+    local = (np.arange(int(areas.sum()), dtype=np.int64) - np.repeat(starts, areas)).astype(np.int32)
+    dy, dx = np.divmod(local, np.repeat(widths, areas).astype(np.int32))
+    flat = (np.repeat(y0, areas) + dy) * width + np.repeat(x0, areas) + dx
+    # Treat each multi-channel pixel as one opaque item so np.put writes it in one go
+    if not image.flags.c_contiguous:
+        raise ValueError("render_overlay needs a C-contiguous image")
+    channels = image.shape[2] if image.ndim == 3 else 1
+    pixel_type = np.dtype((np.void, channels * image.itemsize))
+    pixels = image.reshape(-1).view(pixel_type)
+    value = np.array([color], dtype=image.dtype).reshape(-1).view(pixel_type)[0]
+    np.put(pixels, flat, value)
+
+def _to_image_color(image: np.ndarray, rgb) -> Tuple[int, ...]:
+    # cv2 images are BGR; keep alpha opaque on BGRA images
+    if image.ndim == 2:
+        return (int(np.mean(rgb)),)
+    bgr = tuple(reversed(rgb))
+    return bgr + (255,) if image.shape[2] == 4 else bgr
+
+def render_overlay(image: np.ndarray, labeled_boxes: Sequence[LabeledBox],
+                   style: OverlayStyle = LABELER_STYLE, offset: Tuple[int, int] = (0, 0)) -> np.ndarray:
+    """Draw every box, label plate and label onto a BGR array in place.
+
+    Outlines and plates are filled in bulk; label text is blitted from cached glyph
+    bitmaps with a single fancy-indexed assignment. offset is subtracted from box
+    coordinates, which lets callers draw onto a crop or tile of the page.
+    """
+    if not labeled_boxes:
+        return image
+    height, width = image.shape[:2]
+    color_image = image
+    boxes = np.array(
+        [[box['x'], box['y'], box['x'] + box['width'], box['y'] + box['height']] for _, box in labeled_boxes],
+        dtype=np.float64
+    )
+    boxes -= [offset[0], offset[1], offset[0], offset[1]]
+    boxes = np.round(boxes).astype(np.int64)
+    x0, y0, x1, y1 = boxes.T
+    t = style.outline_width
+
+    outlines = np.concatenate([
+        np.stack([x0, y0, x1 + 1, y0 + t], axis=1),
+        np.stack([x0, y1 - t + 1, x1 + 1, y1 + 1], axis=1),
+        np.stack([x0, y0, x0 + t, y1 + 1], axis=1),
+        np.stack([x1 - t + 1, y0, x1 + 1, y1 + 1], axis=1),
+    ])
+    _fill_rects(color_image, outlines, _to_image_color(color_image, style.outline))
+
+    label_sizes = []
+    for label, _ in labeled_boxes:
+        _, _, text_width, text_height = _label_pixels(label, style.font_scale, style.font_thickness)
+        label_sizes.append((text_width, text_height))
+    sizes = np.array(label_sizes, dtype=np.int64).reshape(-1, 2)
+    plate_top = y0 - sizes[:, 1] - style.plate_gap - style.plate_padding
+    plates = np.stack([x0, plate_top, x0 + sizes[:, 0] + style.plate_padding, y0 - style.plate_gap], axis=1)
+    _fill_rects(color_image, plates, _to_image_color(color_image, style.plate))
+
+    all_ys, all_xs = [], []
+    text_x = x0 + 2
+    text_y = plate_top + style.plate_padding // 2
+    for i, (label, _) in enumerate(labeled_boxes):
+        ys, xs, _, _ = _label_pixels(label, style.font_scale, style.font_thickness)
+        all_ys.append(ys + text_y[i])
+        all_xs.append(xs + text_x[i])
+    ys = np.concatenate(all_ys)
+    xs = np.concatenate(all_xs)
+    visible = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+    color_image[ys[visible], xs[visible]] = _to_image_color(color_image, style.text)
+    return image
+
+ImageWriter = Callable[[np.ndarray, str], None]
+
+def _imwrite(image: np.ndarray, path: str) -> None:
+    if not cv2.imwrite(path, image):
+        raise IOError(f"Could not write image: {path}")
+
+def render_overlay_file(screenshot_path: str, labeled_boxes: Sequence[LabeledBox],
+                        output_path: Optional[str] = None, style: OverlayStyle = LABELER_STYLE,
+                        writer: Optional[ImageWriter] = None) -> str:
+    """Read a screenshot, draw labels with render_overlay and write the result.
+
+    writer(image, path) replaces the synchronous cv2.imwrite, e.g. to hand the
+    array to a background encoder.
+    """
+    image = cv2.imread(screenshot_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Could not read image: {screenshot_path}")
+    render_overlay(image, labeled_boxes, style)
+    output_path = output_path or screenshot_path.replace(".png", "_labeled.png")
+    (writer or _imwrite)(image, output_path)
+    return output_path
+
+def render_overlay_tiles(tiles: Sequence[Dict], labeled_boxes: Sequence[LabeledBox],
+                         style: OverlayStyle = LABELER_STYLE, plate_margin: int = 40,
+                         output_paths: Optional[Sequence[str]] = None,
+                         writer: Optional[ImageWriter] = None):
+    """Label a tiled capture one tile at a time, yielding each labeled tile entry.
+
+    tiles are {'y', 'height', 'path'} dicts in page coordinates. Only boxes that
+    intersect a tile (including their label plate above the box) are drawn on it,
+    and only one decoded tile is held in memory at a time. Labeled tiles are written
+    next to the originals unless output_paths gives one path per tile, with writer
+    as in render_overlay_file.
+    """
+    if labeled_boxes:
+        tops = np.array([box['y'] for _, box in labeled_boxes], dtype=np.float64)
+        bottoms = tops + np.array([box['height'] for _, box in labeled_boxes], dtype=np.float64)
+    else:
+        tops = bottoms = np.zeros(0)
+    for i, tile in enumerate(tiles):
+        tile_top = tile['y']
+        tile_bottom = tile_top + tile['height']
+        hits = np.nonzero((bottoms >= tile_top) & (tops - plate_margin < tile_bottom))[0]
+        image = cv2.imread(tile['path'], cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not read tile: {tile['path']}")
+        render_overlay(image, [labeled_boxes[j] for j in hits], style, offset=(0, tile_top))
+        labeled_path = output_paths[i] if output_paths else tile['path'].replace(".png", "_labeled.png")
+        (writer or _imwrite)(image, labeled_path)
+        yield dict(tile, path=labeled_path, labels=len(hits))
+
+def read_region(screenshot_path: Optional[str], region: Tuple[int, int, int, int],
+                tiles: Optional[Sequence[Dict]] = None) -> np.ndarray:
+    """Decode only the (x, y, width, height) part of a screenshot or tiled capture.
+
+    With tiles, only the tiles overlapping the region are read and stacked.
+    """
+    x, y, width, height = (int(v) for v in region)
+    if tiles is None:
+        image = cv2.imread(screenshot_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not read image: {screenshot_path}")
+        return np.ascontiguousarray(image[max(y, 0):y + height, max(x, 0):x + width])
+    parts = []
+    for tile in tiles:
+        top, bottom = max(y, tile['y']), min(y + height, tile['y'] + tile['height'])
+        if top >= bottom:
+            continue
+        image = cv2.imread(tile['path'], cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not read tile: {tile['path']}")
+        parts.append(image[top - tile['y']:bottom - tile['y'], max(x, 0):x + width])
+    if not parts:
+        raise ValueError(f"Region {region} is outside the captured page")
+    return np.ascontiguousarray(np.vstack(parts))
+
+def load_font(size: int = 14):
+    font_paths = [
+        "Arial.ttf",
+        "LiberationSans-Regular.ttf",
+        "/System/Library/Fonts/Supplemental/Arial.ttf",
+        "/Library/Fonts/Arial.ttf"
+    ]
+    for path in font_paths:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def render_overlay_pil(image: Image.Image, labeled_boxes: Sequence[LabeledBox],
+                       style: OverlayStyle = LABELER_STYLE, font=None) -> Image.Image:
+    """Reference per-element PIL renderer, kept for comparison and benchmarking"""
+    font = font or load_font(14)
+    draw = ImageDraw.Draw(image)
+    for label, box in labeled_boxes:
+        draw.rectangle(
+            [(box['x'], box['y']), (box['x'] + box['width'], box['y'] + box['height'])],
+            outline=style.outline,
+            width=style.outline_width
+        )
+        text_bbox = draw.textbbox((0, 0), label, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+        draw.rectangle(
+            [(box['x'], box['y'] - text_height - style.plate_padding - style.plate_gap),
+             (box['x'] + text_width + style.plate_padding, box['y'] - style.plate_gap)],
+            fill=style.plate
+        )
+        draw.text(
+            (box['x'] + 2, box['y'] - text_height - style.plate_gap - style.plate_padding // 2 - 1),
+            label,
+            fill=style.text,
+            font=font
+        )
+    return image
+
+def benchmark_overlay(width: int = 1366, height: int = 8000, count: int = 500,
+                      repeat: int = 3, seed: int = 0) -> Dict[str, float]:
+    """Time the PIL and vectorized renderers on the same synthetic page.
+
+    Returns the best-of-repeat seconds for each path and the speedup.
+    """
+    rng = np.random.default_rng(seed)
+    labeled_boxes: List[LabeledBox] = []
+    for i in range(count):
+        w, h = int(rng.integers(20, 300)), int(rng.integers(15, 60))
+        labeled_boxes.append((f"L-{i + 1}", {
+            'x': float(rng.integers(0, width - w)),
+            'y': float(rng.integers(30, height - h)),
+            'width': float(w),
+            'height': float(h)
+        }))
+    base = np.full((height, width, 3), 240, dtype=np.uint8)
+    font = load_font(14)
+
+    def best_of(fn):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    pil_seconds = best_of(lambda: render_overlay_pil(Image.fromarray(base), labeled_boxes, font=font))
+    vectorized_seconds = best_of(lambda: render_overlay(base.copy(), labeled_boxes))
+    return {
+        'elements': count,
+        'image_size': f"{width}x{height}",
+        'pil_seconds': pil_seconds,
+        'vectorized_seconds': vectorized_seconds,
+        'speedup': pil_seconds / vectorized_seconds if vectorized_seconds else float('inf')
+    }
+
+if __name__ == "__main__":
+    for count in (100, 500, 2000):
+        result = benchmark_overlay(count=count)
+        print(f"{result['elements']:>5} elements on {result['image_size']}: "
+              f"PIL {result['pil_seconds'] * 1000:.1f} ms, "
+              f"vectorized {result['vectorized_seconds'] * 1000:.1f} ms "
+              f"({result['speedup']:.1f}x)")
@@ -0,0 +1,212 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Optional, Sequence
+
+DEFAULT_QUIET_MS = 300
+DEFAULT_TIMEOUT_MS = 15000
+# Requests open longer than this are treated as long-polling/streaming and stop blocking readiness
+DEFAULT_MAX_REQUEST_MS = 5000
+# Once the network is idle, DOM mutations (carousels, countdowns) can extend the wait by at most this
+DEFAULT_MAX_MUTATION_MS = 2000
+DEFAULT_POLL_MS = 50
+
+# Regexes (JS syntax) for requests that never count as pending
+DEFAULT_IGNORE = (
+    r"google-analytics\.com", r"googletagmanager\.com", r"doubleclick\.net", r"facebook\.(com|net)/tr",
+    r"hotjar\.com", r"segment\.(io|com)", r"sentry\.io", r"/socket\.io/", r"[?&]transport=polling",
+    r"/(long-?poll|realtime|events|sse)\b", r"hot-update",
+)
+
+# Tracks DOM mutations and in-flight fetch/XHR; installed as an init script before any page code
+# runs, or lazily by the first readiness check on pages opened without it
+TRACKER_JS = '''(opts) => {
+    if (window.__readiness) return;
+    const ignore = (opts.ignore || []).map(p => new RegExp(p));
+    const now = () => performance.now();
+    const r = window.__readiness = {pending: new Map(), nextId: 0, lastMutation: now(), lastBusy: now()};
+    const start = (url) => {
+        url = String(url || '');
+        if (ignore.some(re => re.test(url))) return null;
+        const id = ++r.nextId;
+        r.pending.set(id, {url: url, start: now()});
+        return id;
+    };
+    const end = (id) => {
+        if (id !== null && r.pending.delete(id)) r.lastBusy = now();
+    };
+    if (window.fetch) {
+        const originalFetch = window.fetch;
+        window.fetch = function (input, init) {
+            const id = start(input && input.url ? input.url : input);
+            try {
+                return originalFetch.apply(this, arguments).finally(() => end(id));
+            } catch (e) {
+                end(id);
+                throw e;
+            }
+        };
+    }
+    const open = XMLHttpRequest.prototype.open;
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.open = function (method, url) {
+        this.__readinessUrl = url;
+        return open.apply(this, arguments);
+    };
+    XMLHttpRequest.prototype.send = function () {
+        const id = start(this.__readinessUrl);
+        this.addEventListener('loadend', () => end(id), {once: true});
+        return send.apply(this, arguments);
+    };
+    // Style and class toggles are how CSS animations and carousels run; they don't change what's actionable
+    new MutationObserver((records) => {
+        if (records.some(m => m.type !== 'attributes' || (m.attributeName !== 'style' && m.attributeName !== 'class'))) {
+            r.lastMutation = now();
+        }
+    }).observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+}'''
+
+# True once the document is parsed, no tracked request younger than maxRequestMs is open and
+# neither the DOM nor the request set has changed for quietMs. A DOM that never stops changing
+# is accepted after maxMutationMs of network idle within the same wait (opts.waitId).
+PAGE_READY_JS = f'''(opts) => {{
+    if (!window.__readiness) ({TRACKER_JS})(opts);
+    const r = window.__readiness;
+    if (r.waitId !== opts.waitId) {{
+        r.waitId = opts.waitId;
+        r.networkIdleSince = null;
+    }}
+    if (document.readyState === 'loading') return false;
+    const now = performance.now();
+    for (const request of r.pending.values()) {{
+        if (now - request.start < opts.maxRequestMs) {{
+            r.networkIdleSince = null;
+            return false;
+        }}
+    }}
+    if (r.networkIdleSince === null) r.networkIdleSince = now;
+    if (now - r.networkIdleSince >= opts.maxMutationMs) return true;
+    return now - Math.max(r.lastMutation, r.lastBusy) >= opts.quietMs;
+}}'''
+
+class ReadinessEngine:
+    """Decides when a page is actionable instead of sleeping for fixed times.
+
+    wait_for_page() polls until the DOM has been quiet for quiet_ms and no tracked
+    request is pending; requests matching `ignore` (analytics, long-polling) and
+    requests open longer than max_request_ms don't count, so pages that never
+    reach networkidle still settle. Style/class-only mutations are ignored, and
+    other mutations extend a wait by at most max_mutation_ms once the network is
+    idle, so animated pages don't run into the timeout. wait_for_element() waits
+    for a target to be visible, stable (same box over consecutive frames) and
+    enabled or editable.
+    A wait that times out is logged and execution continues, as the fixed sleeps
+    did. Every wait is recorded; stats() summarizes how long they actually took.
+    """
+
+    def __init__(self, quiet_ms: int = DEFAULT_QUIET_MS, timeout_ms: int = DEFAULT_TIMEOUT_MS,
+                 max_request_ms: int = DEFAULT_MAX_REQUEST_MS, max_mutation_ms: int = DEFAULT_MAX_MUTATION_MS,
+                 ignore: Sequence[str] = DEFAULT_IGNORE, poll_ms: int = DEFAULT_POLL_MS, history: int = 1000):
+        self.quiet_ms = quiet_ms
+        self.timeout_ms = timeout_ms
+        self.max_request_ms = max_request_ms
+        self.max_mutation_ms = max_mutation_ms
+        self.ignore = list(ignore)
+        self.poll_ms = poll_ms
+        self.waits = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        return {'quietMs': self.quiet_ms, 'maxRequestMs': self.max_request_ms,
+                'maxMutationMs': self.max_mutation_ms, 'ignore': self.ignore}
+
+    def _wait_options(self) -> Dict[str, Any]:
+        # A fresh waitId restarts the mutation cap for each wait
+        return dict(self.options, waitId=uuid.uuid4().hex)
+
+    def init_script(self) -> str:
+        """Script for context.add_init_script / page.add_init_script (sync or async API)"""
+        return f"({TRACKER_JS})({json.dumps(self.options)})"
+
+    def _record(self, kind: str, target: Optional[str], start_time: float, timed_out: bool) -> Dict[str, Any]:
+        wait = {'kind': kind, 'target': target, 'seconds': time.time() - start_time, 'timed_out': timed_out}
+        with self._lock:
+            self.waits.append(wait)
+        if timed_out:
+            logging.warning(f"Readiness wait '{kind}' for {target or 'page'} timed out after {wait['seconds']:.2f}s")
+        else:
+            logging.debug(f"Readiness wait '{kind}' for {target or 'page'} took {wait['seconds']:.3f}s")
+        return wait
+
+    def wait_for_page(self, page, kind: str = 'page', timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        start_time = time.time()
+        try:
+            page.wait_for_function(PAGE_READY_JS, arg=self._wait_options(), polling=self.poll_ms,
+                                   timeout=timeout_ms or self.timeout_ms)
+            timed_out = False
+        except Exception as e:
+            logging.debug(f"Page readiness check failed: {str(e)}")
+            timed_out = True
+        return self._record(kind, page.url, start_time, timed_out)
+
+    async def wait_for_page_async(self, page, kind: str = 'page', timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        start_time = time.time()
+        try:
+            await page.wait_for_function(PAGE_READY_JS, arg=self._wait_options(), polling=self.poll_ms,
+                                         timeout=timeout_ms or self.timeout_ms)
+            timed_out = False
+        except Exception as e:
+            logging.debug(f"Page readiness check failed: {str(e)}")
+            timed_out = True
+        return self._record(kind, page.url, start_time, timed_out)
+
+    @staticmethod
+    def _remaining(timeout_ms: int, start_time: float) -> int:
+        # What is left of one overall budget, so chained waits can't add up to more than it
+        return max(1, timeout_ms - int((time.time() - start_time) * 1000))
+
+    def wait_for_element(self, page, selector: str, editable: bool = False,
+                         timeout_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Wait until selector is visible, stable and enabled (editable for typing).
+
+        Unlike wait_for_page this raises on timeout, since the action can't run.
+        """
+        timeout = timeout_ms or self.timeout_ms
+        start_time = time.time()
+        try:
+            handle = page.wait_for_selector(selector, state='visible', timeout=timeout)
+            handle.wait_for_element_state('stable', timeout=self._remaining(timeout, start_time))
+            handle.wait_for_element_state('editable' if editable else 'enabled',
+                                          timeout=self._remaining(timeout, start_time))
+        except Exception:
+            self._record('element', selector, start_time, True)
+            raise
+        return self._record('element', selector, start_time, False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Count, total and max seconds and timeouts of recorded waits, per kind"""
+        with self._lock:
+            waits = list(self.waits)
+        stats = {}
+        for wait in waits:
+            s = stats.setdefault(wait['kind'], {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'timed_out': 0})
+            s['count'] += 1
+            s['seconds'] += wait['seconds']
+            s['max_seconds'] = max(s['max_seconds'], wait['seconds'])
+            s['timed_out'] += int(wait['timed_out'])
+        return stats
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_readiness_engine() -> ReadinessEngine:
+    """Process-wide engine with the default settings, shared so waits are recorded together"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ReadinessEngine()
+        return _engine
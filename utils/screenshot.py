@@ -3,11 +3,12 @@ import json
 import sqlite3
 from datetime import datetime
 from playwright.sync_api import sync_playwright
-import cv2
-import numpy as np
 from typing import Optional, Dict, Tuple, Any
-from PIL import Image, ImageDraw, ImageFont
 from pathlib import Path
+from utils.browser_pool import get_browser_pool
+from utils.overlay import render_overlay_file, SCREENSHOT_STYLE
+from utils.image_encoder import EncodeOptions, get_image_encoder
+from utils.readiness import get_readiness_engine
 
 # Configuration
 DATA_DIR = Path("data")
@@ -19,6 +20,9 @@ DB_FILE = DATA_DIR / "elements.db"
 DEBUG_DIR = DATA_DIR / "debug_logs"
 DEBUG_DIR.mkdir(exist_ok=True)
 SESSION_FILE = DATA_DIR / "session_state.json"
+# None keeps Chromium's PNG bytes as-is; set an EncodeOptions to transcode (e.g. lossless WebP)
+SCREENSHOT_ENCODING: Optional[EncodeOptions] = None
+OVERLAY_ENCODING = EncodeOptions(format='png', png_compression=3)
 
 class SessionManager:
     """Handles browser session persistence and state management"""
@@ -100,38 +104,44 @@ def capture_screenshot(url: str, is_uploaded: bool = False, use_session: bool =
     Returns:
         Tuple of (screenshot_path, page_title)
     """
-    screenshot_path = SCREENSHOT_DIR / f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+    extension = SCREENSHOT_ENCODING.extension if SCREENSHOT_ENCODING else ".png"
+    screenshot_path = SCREENSHOT_DIR / f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
     
     try:
         if not use_session:
-            # One-off session
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                context = browser.new_context(viewport={'width': 1920, 'height': 1080})
-                page = context.new_page()
-                
+            # One-off context on a pooled browser
+            with get_browser_pool(headless=True).page(viewport={'width': 1920, 'height': 1080}) as page:
+                page.add_init_script(script=get_readiness_engine().init_script())
                 if is_uploaded:
-                    page.goto(f"file://{url}", wait_until="networkidle", timeout=60000)
+                    page.goto(f"file://{url}", wait_until="domcontentloaded", timeout=60000)
                 else:
-                    page.goto(url, wait_until="networkidle", timeout=60000)
+                    page.goto(url, wait_until="domcontentloaded", timeout=60000)
+                get_readiness_engine().wait_for_page(page, 'navigation')
                 
                 page_title = page.title()
-                page.screenshot(path=str(screenshot_path), full_page=True, type="png", quality=90)
-                browser.close()
+                screenshot = page.screenshot(full_page=True, type="png")
         else:
             # Use persistent session
             if not session_manager.session_active:
                 session_manager.start_session()
             
             if is_uploaded:
-                session_manager.page.goto(f"file://{url}", wait_until="networkidle", timeout=60000)
+                session_manager.page.goto(f"file://{url}", wait_until="domcontentloaded", timeout=60000)
             else:
-                session_manager.page.goto(url, wait_until="networkidle", timeout=60000)
+                session_manager.page.goto(url, wait_until="domcontentloaded", timeout=60000)
+            # The session page may predate the init script; the check installs tracking lazily
+            get_readiness_engine().wait_for_page(session_manager.page, 'navigation')
             
             page_title = session_manager.page.title()
-            session_manager.page.screenshot(path=str(screenshot_path), full_page=True, type="png", quality=90)
+            screenshot = session_manager.page.screenshot(full_page=True, type="png")
             session_manager.save_session_state()
         
+        # Written (and transcoded if configured) in the background; readers call
+        # get_image_encoder().wait(path) first
+        get_image_encoder().submit_encoded(
+            screenshot, str(screenshot_path), SCREENSHOT_ENCODING,
+            on_done=lambda r: log_debug(f"Screenshot written: {r['path']} ({r['bytes'] / 1024:.0f} KB, encoded in {r['encode_seconds']:.2f}s)")
+        )
         log_debug(f"Screenshot captured: {screenshot_path}")
         return str(screenshot_path), page_title
         
@@ -149,19 +159,14 @@ def get_element_coordinates(url: str, screenshot_path: str, is_uploaded: bool =
     
     try:
         if not use_session:
-            # One-off session
-            with sync_playwright() as p:
-                browser = p.chromium.launch(headless=True)
-                context = browser.new_context()
-                page = context.new_page()
-                
+            # One-off context on a pooled browser
+            with get_browser_pool(headless=True).page() as page:
                 if is_uploaded:
                     page.goto(f"file://{url}", wait_until="domcontentloaded", timeout=60000)
                 else:
                     page.goto(url, wait_until="domcontentloaded", timeout=60000)
                 
                 element_data = _process_page_elements(page)
-                browser.close()
         else:
             # Use persistent session
             if not session_manager.session_active:
@@ -301,38 +306,27 @@ def store_element_data(element_data):
 def overlay_labels_on_screenshot(screenshot_path, element_data):
     """Enhanced visual annotations with OpenCV"""
     try:
-        # Load the image using PIL
-        image = Image.open(screenshot_path)
-        draw = ImageDraw.Draw(image)
-        
-        try:
-            # Try to load a nice font, fallback to default if not available
-            font = ImageFont.truetype("arial.ttf", 12)
-        except:
-            font = ImageFont.load_default()
-        
-        for label, data in element_data.items():
-            x, y = map(int, data["coordinates"])
-            w, h = map(int, data["size"])
-            
-            # Draw bounding box
-            draw.rectangle([x, y, x + w, y + h], outline="red", width=2)
-            
-            # Get text size using textbbox (replacement for textsize)
-            text_bbox = draw.textbbox((0, 0), label, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            # Draw label background
-            draw.rectangle([x, y - text_height - 4, x + text_width + 4, y], fill="red")
-            
-            # Draw label text
-            draw.text((x + 2, y - text_height - 2), label, fill="white", font=font)
+        labeled_boxes = [
+            (label, {
+                'x': data["coordinates"][0],
+                'y': data["coordinates"][1],
+                'width': data["size"][0],
+                'height': data["size"][1]
+            })
+            for label, data in element_data.items()
+        ]
         
-        # Save annotated image
-        labeled_path = screenshot_path.replace(".png", "_labeled.png")
-        image.save(labeled_path)
-        log_debug(f"Annotated screenshot saved: {labeled_path}")
+        encoder = get_image_encoder()
+        encoder.wait(screenshot_path)
+        output_path = os.path.splitext(screenshot_path)[0] + "_labeled" + OVERLAY_ENCODING.extension
+
+        def write(image, path):
+            encoder.submit(image, path, OVERLAY_ENCODING, on_done=lambda r: log_debug(
+                f"Annotated screenshot saved: {r['path']} ({r['bytes'] / 1024:.0f} KB, encoded in {r['encode_seconds']:.2f}s)"
+            ))
+
+        # All boxes and label plates are drawn in bulk on a NumPy array
+        render_overlay_file(screenshot_path, labeled_boxes, output_path, style=SCREENSHOT_STYLE, writer=write)
         
     except Exception as e:
         log_debug(f"Error in annotation: {str(e)}")
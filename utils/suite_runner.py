@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import subprocess
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from utils.test_spec import spec_name, write_test_spec
+
+# Outside the root config's testDir (./tests), so a plain `npx playwright test` never picks up old runs
+SUITE_DIR = os.path.join("data", "suites")
+PLAYWRIGHT_COMMAND = ("npx", "playwright", "test")
+DEFAULT_PROJECT = "chromium"
+
+# Each run directory gets its own config with testDir set to the run, mirroring the root projects
+RUN_CONFIG = """const { defineConfig, devices } = require('@playwright/test');
+
+module.exports = defineConfig({
+  testDir: '.',
+  testMatch: '*.spec.js',
+  fullyParallel: true,
+  projects: [
+    { name: 'chromium', use: { ...devices['Desktop Chrome'] } },
+    { name: 'firefox', use: { ...devices['Desktop Firefox'] } },
+    { name: 'webkit', use: { ...devices['Desktop Safari'] } },
+  ],
+});
+"""
+RUN_CONFIG_NAME = "playwright.config.js"
+
+# Playwright JSON reporter statuses, per test across retries
+_STATUS_MAP = {'expected': 'passed', 'unexpected': 'failed', 'flaky': 'flaky', 'skipped': 'skipped'}
+
+def write_suite(cases: Iterable[Dict[str, Any]], run_dir: str) -> List[Dict[str, Any]]:
+    """Write one spec per case ({'url', 'prompt', 'actions'}) plus the run's config into run_dir.
+
+    Spec names are the case's position followed by spec_name(url, prompt), so
+    duplicate cases get separate files. Returns the cases with 'spec' set.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, RUN_CONFIG_NAME), "w") as f:
+        f.write(RUN_CONFIG)
+    written = []
+    for index, case in enumerate(cases, 1):
+        path = os.path.join(run_dir, f"{index:04d}-{spec_name(case['url'], case['prompt'])}")
+        write_test_spec(case['url'], case['actions'], path, title=case['prompt'])
+        written.append(dict(case, spec=path))
+    return written
+
+def _walk_specs(suite: Dict[str, Any]):
+    for spec in suite.get('specs', []):
+        yield spec
+    for child in suite.get('suites', []):
+        yield from _walk_specs(child)
+
+def _readiness_waits(test: Dict[str, Any], runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Newer reporters keep per-run annotations; older ones only the test's
+    annotations = [a for r in runs for a in r.get('annotations', [])] or test.get('annotations', [])
+    waits = []
+    for annotation in annotations:
+        if annotation.get('type') == 'readiness':
+            try:
+                waits.append(json.loads(annotation.get('description') or ''))
+            except ValueError:
+                continue
+    return waits
+
+def parse_json_report(report: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten a Playwright JSON report into one result per (spec file, test, project)"""
+    results = []
+    for suite in report.get('suites', []):
+        for spec in _walk_specs(suite):
+            for test in spec.get('tests', []):
+                runs = test.get('results') or [{}]
+                errors = [r['error'].get('message', '') for r in runs if r.get('error')]
+                results.append({
+                    'file': spec.get('file') or suite.get('file'),
+                    'title': spec.get('title'),
+                    'project': test.get('projectName'),
+                    'status': _STATUS_MAP.get(test.get('status'), test.get('status')),
+                    'duration_seconds': sum(r.get('duration', 0) for r in runs) / 1000,
+                    'retries': max(len(runs) - 1, 0),
+                    'errors': errors,
+                    'waits': _readiness_waits(test, runs),
+                })
+    return results
+
+def _shard_command(run_dir: str, workers: int, shard: int, shards: int, project: Optional[str],
+                   command: Sequence[str]) -> List[str]:
+    config = os.path.join(run_dir, RUN_CONFIG_NAME).replace(os.sep, '/')
+    args = list(command) + [f"--config={config}", f"--workers={workers}", "--reporter=json"]
+    if shards > 1:
+        args.append(f"--shard={shard}/{shards}")
+    if project:
+        args.append(f"--project={project}")
+    return args
+
+def run_suite(cases: Iterable[Dict[str, Any]], workers: Optional[int] = None, shards: int = 1,
+              shard_index: Optional[int] = None, project: Optional[str] = DEFAULT_PROJECT,
+              suite_dir: str = SUITE_DIR, timeout: Optional[float] = None,
+              command: Sequence[str] = PLAYWRIGHT_COMMAND) -> Dict[str, Any]:
+    """Write a spec per case and run them with Playwright Test in parallel.
+
+    workers is the total worker budget and defaults to the CPU count. With
+    shards > 1 the suite is split with --shard; every shard runs as its own
+    process at once, sharing that budget, unless shard_index picks one (e.g. one
+    shard per CI machine), which then gets all of it. Each shard's JSON report
+    goes to its own file in the run directory and the results are mapped back
+    to cases.
+    """
+    workers = workers or os.cpu_count() or 1
+    run_dir = os.path.join(suite_dir, f"run-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}")
+    written = write_suite(cases, run_dir)
+    shard_numbers = [shard_index] if shard_index else list(range(1, shards + 1))
+    shard_workers = max(1, workers // len(shard_numbers))
+
+    start_time = time.time()
+    processes = []
+    for shard in shard_numbers:
+        report_path = os.path.join(run_dir, f"report-{shard}.json")
+        args = _shard_command(run_dir, shard_workers, shard, shards, project, command)
+        env = dict(os.environ, PLAYWRIGHT_JSON_OUTPUT_NAME=report_path)
+        logging.info(f"Starting shard {shard}/{shards}: {' '.join(args)}")
+        processes.append((shard, report_path, subprocess.Popen(
+            args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )))
+
+    shard_results, test_results = [], []
+    for shard, report_path, process in processes:
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, stderr = process.communicate()
+            logging.error(f"Shard {shard} timed out after {timeout}s")
+        shard_result = {'shard': shard, 'returncode': process.returncode, 'report': report_path}
+        try:
+            with open(report_path) as f:
+                report = json.load(f)
+            test_results.extend(parse_json_report(report))
+            shard_result['stats'] = report.get('stats')
+        except (OSError, ValueError) as e:
+            logging.error(f"No JSON report from shard {shard}: {str(e)}; stderr: {(stderr or '').strip()[-500:]}")
+            shard_result['error'] = (stderr or '').strip()[-500:] or str(e)
+        shard_results.append(shard_result)
+
+    by_file = {}
+    for result in test_results:
+        by_file.setdefault(os.path.basename(result['file'] or ''), []).append(result)
+    tests = []
+    for case in written:
+        spec = os.path.basename(case['spec'])
+        results = by_file.get(spec)
+        if not results:
+            # Outside this shard, or the shard died before reporting it
+            tests.append({'url': case['url'], 'prompt': case['prompt'], 'spec': case['spec'],
+                          'status': 'not_run', 'duration_seconds': 0.0, 'errors': [], 'waits': []})
+            continue
+        for result in results:
+            tests.append({'url': case['url'], 'prompt': case['prompt'], 'spec': case['spec'], **result})
+
+    summary = {status: sum(t['status'] == status for t in tests)
+               for status in ('passed', 'failed', 'flaky', 'skipped', 'not_run')}
+    return {
+        'run_dir': run_dir,
+        'workers': workers,
+        'shards': shard_results,
+        'tests': tests,
+        'summary': summary,
+        'passed': summary['failed'] == 0 and all(s['returncode'] == 0 for s in shard_results),
+        'wall_seconds': time.time() - start_time,
+        'test_seconds': sum(t['duration_seconds'] for t in tests),
+        'wait_seconds': sum(w.get('ms', 0) for t in tests for w in t['waits']) / 1000,
+    }
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import re
+from urllib.parse import urlsplit
+from utils.readiness import PAGE_READY_JS, get_readiness_engine
+
+DEFAULT_SPEC_PATH = os.path.join("tests", "generated_test.spec.js")
+
+def render_test_spec(url, actions, title="Generated Test", readiness=None):
+    """Playwright Test source that runs actions on url with the safeAction retry helper.
+
+    Waits use the readiness engine's checks (see utils.readiness) with its
+    settings, and each wait is recorded as a 'readiness' test annotation.
+    """
+    readiness = readiness or get_readiness_engine()
+    return f"""
+const {{ test, expect }} = require('@playwright/test');
+
+test({json.dumps(title)}, async ({{ page }}) => {{
+    test.setTimeout(120000); // Increased timeout to 2 minutes
+    
+    try {{
+        console.log("Navigating to {url}...");
+        await page.addInitScript({json.dumps(readiness.init_script())});
+        await page.goto('{url}', {{ waitUntil: "domcontentloaded", timeout: 60000 }});
+        await waitForReady(page, 'navigation');
+
+        // Action execution
+        const actions = {json.dumps(actions, indent=4)};
+        
+        for (const action of actions) {{
+            try {{
+                console.log(`Executing ${{action.type}} on ${{action.selector}}`);
+                
+                if (action.type === "type") {{
+                    await safeAction(page, action.selector, async () => {{
+                        await page.fill(action.selector, action.value);
+                    }}, true);
+                }} 
+                else if (action.type === "click") {{
+                    await safeAction(page, action.selector, async () => {{
+                        await page.click(action.selector);
+                    }});
+                }}
+                
+                await waitForReady(page, 'action');
+            }} catch (e) {{
+                console.error(`Action failed: ${{action.type}} on ${{action.selector}}`);
+                try {{
+                    await page.screenshot({{ path: `error_${{action.label}}_${{Date.now()}}.png` }});
+                }} catch (screenshotError) {{
+                    console.error("Failed to capture screenshot:", screenshotError);
+                }}
+                throw e;
+            }}
+        }}
+    }} catch (e) {{
+        console.error("Test failed:", e);
+        throw e;
+    }}
+}});
+
+const READINESS = {json.dumps(readiness.options)};
+const pageReady = {PAGE_READY_JS};
+
+function recordWait(kind, target, start, timedOut) {{
+    const ms = Date.now() - start;
+    test.info().annotations.push({{
+        type: 'readiness',
+        description: JSON.stringify({{ kind: kind, target: target, ms: ms, timed_out: timedOut }})
+    }});
+    console.log(`Ready (${{kind}}) after ${{ms}}ms${{timedOut ? ' (timed out)' : ''}}`);
+}}
+
+// Resolves once the DOM is quiet and no tracked request is pending; a timeout only logs
+async function waitForReady(page, kind) {{
+    const start = Date.now();
+    let timedOut = false;
+    try {{
+        await page.waitForFunction(pageReady, {{ ...READINESS, waitId: `${{start}}-${{Math.random()}}` }}, {{ polling: {readiness.poll_ms}, timeout: {readiness.timeout_ms} }});
+    }} catch (e) {{
+        timedOut = true;
+    }}
+    recordWait(kind, page.url(), start, timedOut);
+}}
+
+// Visible, then not moving between frames, then enabled (editable for fill)
+async function waitForElement(page, selector, editable, timeout) {{
+    const start = Date.now();
+    try {{
+        const handle = await page.waitForSelector(selector, {{ state: 'visible', timeout: timeout }});
+        const remaining = () => Math.max(1, timeout - (Date.now() - start));
+        await handle.waitForElementState('stable', {{ timeout: remaining() }});
+        await handle.waitForElementState(editable ? 'editable' : 'enabled', {{ timeout: remaining() }});
+    }} catch (e) {{
+        recordWait('element', selector, start, true);
+        throw e;
+    }}
+    recordWait('element', selector, start, false);
+}}
+
+async function safeAction(page, selector, actionFn, editable = false, maxAttempts = 3) {{
+    let lastError = null;
+    
+    for (let attempt = 1; attempt <= maxAttempts; attempt++) {{
+        try {{
+            // Wait for the element to be visible, stable and enabled
+            await waitForElement(page, selector, editable, attempt === 1 ? 30000 : 10000);
+            
+            // Scroll element into view
+            await page.$eval(selector, el => el.scrollIntoView({{ 
+                block: 'center',
+                behavior: 'smooth'
+            }}));
+            
+            // Highlight element temporarily
+            await page.$eval(selector, el => {{
+                const originalStyle = el.style.cssText;
+                el.style.border = '2px solid red';
+                setTimeout(() => el.style.cssText = originalStyle, 1000);
+            }});
+            
+            // Execute the action
+            await actionFn();
+            return;
+        }} catch (error) {{
+            lastError = error;
+            if (attempt < maxAttempts) {{
+                console.log(`Attempt ${{attempt}} failed, retrying once the page settles...`);
+                await waitForReady(page, 'retry');
+            }}
+        }}
+    }}
+    
+    throw lastError;
+}}"""
+
+def spec_name(url, prompt):
+    """File name unique to a (url, prompt) pair, readable enough to find in a report"""
+    slug = re.sub(r"[^a-z0-9]+", "-", f"{urlsplit(url).netloc} {prompt}".lower()).strip("-")[:60]
+    digest = hashlib.sha1(json.dumps([url, prompt]).encode()).hexdigest()[:10]
+    return f"{slug or 'test'}-{digest}.spec.js"
+
+def write_test_spec(url, actions, test_file=DEFAULT_SPEC_PATH, title="Generated Test"):
+    """Write the spec for actions to test_file and return its path"""
+    os.makedirs(os.path.dirname(test_file) or ".", exist_ok=True)
+    with open(test_file, "w") as f:
+        f.write(render_test_spec(url, actions, title))
+    return test_file